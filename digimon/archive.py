@@ -0,0 +1,209 @@
+import heapq
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+from sqlalchemy import DateTime, Float, Integer
+
+from . import config
+from .models.transaction_model import DBTransaction
+
+settings = config.get_settings()
+
+# An archive holds the rows of one closed month of transactions. Rows are
+# sorted by wallet and id and cut into blocks, every column of a block is
+# compressed on its own, and a JSON footer keeps each block's offsets and
+# wallet and id ranges:
+#
+#   MAGIC | block 0 column 0 | block 0 column 1 | ... | footer | footer size | MAGIC
+#
+# Readers memory-map the file and only decompress the columns of the blocks
+# that can hold the rows they look for, one block at a time.
+#
+# TRANSACTION_ARCHIVE_DIR must be a directory every node mounts, such as a
+# network file system. The archived rows are gone from the database, and a
+# node that can not see the files can not serve them.
+
+MAGIC = b"DGTX1"
+SUFFIX = ".dtx"
+BLOCK_ROWS = 8192
+# stored in integer columns for NULL, ids are never negative
+NULL = -1
+
+DTYPES = [(Integer, "<i8"), (Float, "<f8"), (DateTime, "<M8[us]")]
+COLUMNS = {
+    column.key: next(dtype for type_, dtype in DTYPES if isinstance(column.type, type_))
+    for column in DBTransaction.__table__.c
+}
+
+
+def to_array(name: str, values) -> np.ndarray:
+    if COLUMNS[name] == "<i8":
+        values = [NULL if value is None else value for value in values]
+    return np.array(values, dtype=COLUMNS[name])
+
+
+def to_values(name: str, array: np.ndarray) -> list:
+    values = array.tolist()
+    if array.dtype.kind == "i":
+        values = [None if value == NULL else value for value in values]
+    return values
+
+
+class ArchiveWriter:
+    # rows are written block by block as they are read, so a month never has
+    # to fit in memory. The file only appears under its name once complete.
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path + ".tmp", "wb")
+        self.file.write(MAGIC)
+        self.blocks = []
+
+    def write(self, rows: list[tuple]):
+        # rows are in COLUMNS order, sorted by wallet_id with NULL first and id
+        for i in range(0, len(rows), BLOCK_ROWS):
+            self.write_block(rows[i : i + BLOCK_ROWS])
+
+    def write_block(self, rows: list[tuple]):
+        columns = {
+            name: to_array(name, values) for name, values in zip(COLUMNS, zip(*rows))
+        }
+        block = dict(
+            rows=len(rows),
+            wallet_ids=[int(columns["wallet_id"].min()), int(columns["wallet_id"].max())],
+            ids=[int(columns["id"].min()), int(columns["id"].max())],
+            columns={},
+        )
+        for name, array in columns.items():
+            data = zlib.compress(array.tobytes())
+            block["columns"][name] = [self.file.tell(), len(data)]
+            self.file.write(data)
+        self.blocks.append(block)
+
+    def close(self):
+        footer = json.dumps(dict(columns=COLUMNS, blocks=self.blocks)).encode()
+        self.file.write(footer)
+        self.file.write(struct.pack("<Q", len(footer)))
+        self.file.write(MAGIC)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class ArchiveFile:
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        end = len(self.map) - len(MAGIC)
+        if self.map[:len(MAGIC)] != MAGIC or self.map[end:] != MAGIC:
+            raise ValueError(f"{path} is not a transaction archive")
+        (size,) = struct.unpack("<Q", self.map[end - 8 : end])
+        footer = json.loads(self.map[end - 8 - size : end - 8])
+        self.columns = footer["columns"]
+        self.blocks = footer["blocks"]
+
+    def read(self, block: dict, name: str) -> np.ndarray:
+        offset, size = block["columns"][name]
+        return np.frombuffer(
+            zlib.decompress(self.map[offset : offset + size]), dtype=self.columns[name]
+        )
+
+    def rows(self, block: dict, start: int, stop: int) -> list[dict]:
+        # keyed by the columns the file was written with, which may be older
+        # than the table
+        columns = {
+            name: to_values(name, self.read(block, name)[start:stop])
+            for name in self.columns
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def wallet_slices(self, wallet_id: int, after: int | None = None):
+        # the block and row range of every block holding rows of the wallet
+        for block in self.blocks:
+            first, last = block["wallet_ids"]
+            if first <= wallet_id <= last:
+                wallet_ids = self.read(block, "wallet_id")
+                start, stop = np.searchsorted(wallet_ids, [wallet_id, wallet_id + 1])
+                if after is not None and start < stop:
+                    ids = self.read(block, "id")[start:stop]
+                    start += np.searchsorted(ids, after, side="right")
+                if start < stop:
+                    yield block, int(start), int(stop)
+
+    def wallet_transactions(self, wallet_id: int, after: int | None = None):
+        for block, start, stop in self.wallet_slices(wallet_id, after):
+            yield from self.rows(block, start, stop)
+
+    def wallet_count(self, wallet_id: int) -> int:
+        return sum(stop - start for _, start, stop in self.wallet_slices(wallet_id))
+
+    def get(self, transaction_id: int) -> dict | None:
+        for block in self.blocks:
+            first, last = block["ids"]
+            if first <= transaction_id <= last:
+                (found,) = np.nonzero(self.read(block, "id") == transaction_id)
+                if len(found):
+                    return self.rows(block, found[0], found[0] + 1)[0]
+        return None
+
+    def close(self):
+        self.map.close()
+
+
+class ArchiveSet:
+    # every archive file in one directory, opened once and kept mapped. The
+    # archiver refreshes it on every run, reads never list the directory.
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.files: dict[str, ArchiveFile] = {}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def refresh(self):
+        # runs in a thread, readers keep iterating the dict they started with
+        names = set()
+        if os.path.isdir(self.directory):
+            names = {name for name in os.listdir(self.directory) if name.endswith(SUFFIX)}
+        files = {
+            name: self.files.get(name) or ArchiveFile(os.path.join(self.directory, name))
+            for name in sorted(names)
+        }
+        removed = [archive for name, archive in self.files.items() if name not in names]
+        self.files = files
+        for archive in removed:
+            archive.close()
+
+    def wallet_transactions(self, wallet_id: int, after: int | None = None):
+        # rows in id order, decompressed a block at a time as they are read
+        return heapq.merge(
+            *[
+                archive.wallet_transactions(wallet_id, after)
+                for archive in self.files.values()
+            ],
+            key=lambda row: row["id"],
+        )
+
+    def wallet_count(self, wallet_id: int) -> int:
+        return sum(archive.wallet_count(wallet_id) for archive in self.files.values())
+
+    def get(self, transaction_id: int) -> dict | None:
+        for archive in self.files.values():
+            row = archive.get(transaction_id)
+            if row is not None:
+                return row
+        return None
+
+    def close(self):
+        for archive in self.files.values():
+            archive.close()
+        self.files.clear()
+
+
+archives = ArchiveSet(settings.TRANSACTION_ARCHIVE_DIR)
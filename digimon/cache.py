@@ -0,0 +1,81 @@
+import collections
+import sys
+import time
+
+
+def sizeof(value) -> int:
+    # estimate of objects and dicts down to their scalars, enough for a budget.
+    # Private attributes, such as the ORM state of a row, are not counted.
+    fields = value if isinstance(value, dict) else getattr(value, "__dict__", None)
+    if fields is None:
+        return sys.getsizeof(value)
+    return sys.getsizeof(value) + sum(
+        sys.getsizeof(key) + sizeof(field)
+        for key, field in fields.items()
+        if not str(key).startswith("_")
+    )
+
+
+class TTLCache:
+    # least recently used entries are evicted once maxsize is reached, or
+    # maxbytes when entries are sized, entries older than ttl seconds are
+    # dropped when they are read
+    def __init__(self, maxsize: int, ttl: float, maxbytes: int | None = None):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.nbytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self.pop(key)
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        self.pop(key)
+        size = sizeof(value) if self.maxbytes is not None else 0
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value, size)
+        self.nbytes += size
+        while len(self.entries) > self.maxsize or (
+            self.maxbytes is not None and self.nbytes > self.maxbytes
+        ):
+            _, (_, _, size) = self.entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+    def pop(self, key, default=None):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return default
+        self.nbytes -= entry[2]
+        return entry[1]
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        return dict(
+            size=len(self.entries),
+            maxsize=self.maxsize,
+            bytes=self.nbytes,
+            maxbytes=self.maxbytes,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
@@ -0,0 +1,191 @@
+import contextlib
+import dataclasses
+
+from pydantic import BaseModel
+from sqlmodel import SQLModel
+
+from . import config
+from . import etags
+from . import models
+from . import shared_cache
+from .cache import TTLCache
+from .models.item_models import DBItem, Item
+from .models.merchant_model import DBMerchant, Merchant
+from .models.wallet_model import DBWallet, WalletInfo
+
+settings = config.get_settings()
+
+CHANNEL = "catalog:invalidate"
+
+
+@dataclasses.dataclass(frozen=True)
+class Entry:
+    value: BaseModel
+    # hashed once when the entry is filled, so conditional GETs are answered
+    # without serializing anything
+    etag: str
+
+    @classmethod
+    def from_json(cls, schema: type[BaseModel], data: bytes) -> "Entry":
+        return cls(schema.model_validate_json(data), etags.make_etag(data))
+
+
+class Catalog:
+    # read-through cache of items, merchants and wallets by id. The local
+    # tier holds the response models and their ETags, so a hit never leaves
+    # the process. With a shared cache behind it, a local miss is served
+    # from the shared tier before the database, and writes delete the shared
+    # entry and publish the key so every worker drops its local copy.
+    #
+    # Local and shared entries live at most max_staleness seconds, which
+    # bounds how stale a read is when an invalidation is lost, or when a
+    # reader stores a row it read before a write after that write deleted
+    # the shared entry. While the subscription is down no invalidations
+    # arrive, so the local tier is emptied and bypassed until it is back.
+    # Without a shared cache the local tier is the only one, and ttl bounds
+    # how long writes made outside the routes stay unseen.
+    def __init__(
+        self,
+        maxsize: int,
+        maxbytes: int,
+        ttl: float,
+        max_staleness: float | None = None,
+        shared: shared_cache.SharedCache | None = None,
+    ):
+        self.shared = shared
+        if shared is not None and max_staleness is not None:
+            ttl = min(ttl, max_staleness)
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl, maxbytes=maxbytes)
+        self.coherent = shared is None
+        # a row read before an invalidation may already be stale, so it is
+        # only stored when nothing was invalidated while it was read
+        self.invalidations = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    @staticmethod
+    def key(model: type[SQLModel], id: int) -> str:
+        return f"catalog:{model.__tablename__}:{id}"
+
+    async def get_entry(
+        self,
+        session: models.AsyncSession,
+        model: type[SQLModel],
+        schema: type[BaseModel],
+        id: int,
+    ) -> Entry | None:
+        key = self.key(model, id)
+        if self.coherent:
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+
+        invalidations = self.invalidations
+        if self.shared is not None:
+            try:
+                data = await self.shared.get(key)
+            except ConnectionError:
+                data = None
+                self.shared_errors += 1
+            if data is not None:
+                self.shared_hits += 1
+                entry = Entry.from_json(schema, data)
+                self.store(key, entry, invalidations)
+                return entry
+
+        row = await session.get(model, id)
+        if row is None:
+            return None
+
+        value = schema.model_validate(row)
+        data = value.model_dump_json().encode()
+        entry = Entry(value, etags.make_etag(data))
+        if self.store(key, entry, invalidations) and self.shared is not None:
+            try:
+                await self.shared.set(key, data, self.ttl)
+            except ConnectionError:
+                self.shared_errors += 1
+        return entry
+
+    def store(self, key: str, entry: Entry, invalidations: int) -> bool:
+        if invalidations != self.invalidations:
+            return False
+        if self.coherent:
+            self.cache.set(key, entry)
+        return True
+
+    async def get(
+        self,
+        session: models.AsyncSession,
+        model: type[SQLModel],
+        schema: type[BaseModel],
+        id: int,
+    ) -> BaseModel | None:
+        entry = await self.get_entry(session, model, schema, id)
+        return None if entry is None else entry.value
+
+    async def get_item(self, session: models.AsyncSession, item_id: int) -> Item | None:
+        return await self.get(session, DBItem, Item, item_id)
+
+    async def get_merchant(
+        self, session: models.AsyncSession, merchant_id: int
+    ) -> Merchant | None:
+        return await self.get(session, DBMerchant, Merchant, merchant_id)
+
+    async def get_wallet(
+        self, session: models.AsyncSession, wallet_id: int
+    ) -> WalletInfo | None:
+        return await self.get(session, DBWallet, WalletInfo, wallet_id)
+
+    async def invalidate(self, model: type[SQLModel], id: int):
+        # called after the commit, so no worker can read the old row again
+        key = self.key(model, id)
+        self.drop(key)
+        if self.shared is not None:
+            try:
+                await self.shared.delete(key)
+                await self.shared.publish(CHANNEL, key)
+            except ConnectionError:
+                # the shared entry expires on its own, after max_staleness
+                self.shared_errors += 1
+
+    def drop(self, key: str):
+        self.invalidations += 1
+        self.cache.pop(key)
+
+    def set_coherent(self, coherent: bool):
+        self.invalidations += 1
+        self.cache.clear()
+        self.coherent = coherent
+
+    def clear(self):
+        self.invalidations += 1
+        self.cache.clear()
+
+    async def start(self):
+        if self.shared is not None:
+            await self.shared.subscribe(CHANNEL, self.drop, self.set_coherent)
+
+    async def stop(self):
+        if self.shared is not None:
+            with contextlib.suppress(Exception):
+                await self.shared.close()
+            self.coherent = False
+
+    def stats(self) -> dict:
+        return self.cache.stats() | dict(
+            coherent=self.coherent,
+            shared=type(self.shared).__name__ if self.shared is not None else None,
+            shared_hits=self.shared_hits,
+            shared_errors=self.shared_errors,
+        )
+
+
+catalog = Catalog(
+    maxsize=settings.CATALOG_CACHE_SIZE,
+    maxbytes=settings.CATALOG_CACHE_BYTES,
+    ttl=settings.CATALOG_CACHE_TTL_SECONDS,
+    max_staleness=settings.CATALOG_CACHE_MAX_STALENESS_SECONDS,
+    shared=shared_cache.create_shared_cache(settings.SHARED_CACHE_URL),
+)
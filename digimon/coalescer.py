@@ -0,0 +1,408 @@
+import asyncio
+import contextlib
+import dataclasses
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+
+from . import catalog
+from . import config
+from . import idempotency
+from . import leaderboard
+from . import ledger
+from . import models
+from . import purchase
+from . import reports
+from . import wallets
+from .models.item_models import DBItem
+from .models.ledger_model import LedgerKind
+from .models.transaction_model import DBTransaction, Transaction
+from .models.wallet_model import DBWallet, Wallet
+
+settings = config.get_settings()
+
+
+@dataclasses.dataclass
+class WalletOperation:
+    kind: LedgerKind
+    amount: float = 0.0
+    item_id: int | None = None
+    quantity: int = 1
+    future: asyncio.Future | None = None
+    submitted_at: float = 0.0
+    # finished in the transaction that applies the operation
+    claim: idempotency.Claim | None = None
+
+
+def reject(shard: int | None, detail: str) -> HTTPException | None:
+    # a shard only holds part of the balance, a debit it can not cover runs
+    # alone instead of being rejected
+    if shard is not None:
+        return None
+    return HTTPException(status_code=400, detail=detail)
+
+
+class WalletCoalescer:
+    # A write to a wallet with nothing else in flight runs alone, through the
+    # single-statement debit or purchase of that wallet, without waiting.
+    # Writes that arrive while another write to the same wallet is in flight
+    # are queued for the window and applied together by one transaction: one
+    # lock of the row the batch writes to, one balance update, one multi-row
+    # insert each of transactions, revenue rollups and ledger entries and one
+    # commit. They are accepted or rejected in arrival order against the
+    # running balance, so every caller gets the answer it would have got alone.
+    #
+    # A batch on a sharded wallet locks and writes a single shard, like a
+    # write alone, so batches of a hot wallet run side by side on different
+    # shards. Debits that the shard can not cover go to a second batch that
+    # pools every shard, as a short debit alone does. A batch that fails runs
+    # each of its operations alone, so one bad operation only fails itself.
+    def __init__(self, window: float, max_batch: int):
+        self.window = window
+        self.max_batch = max_batch
+        self.pending: dict[int, list[WalletOperation]] = {}
+        self.timers: dict[int, asyncio.TimerHandle] = {}
+        self.tasks: set[asyncio.Task] = set()
+        # writes in flight per wallet, queued or running
+        self.inflight: dict[int, int] = {}
+
+        self.direct = 0
+        self.batches = 0
+        self.operations = 0
+        self.max_batch_size = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.failed_batches = 0
+
+    async def submit(self, wallet_id: int, operation: WalletOperation):
+        inflight = self.inflight.get(wallet_id, 0)
+        self.inflight[wallet_id] = inflight + 1
+        try:
+            if not inflight:
+                self.direct += 1
+                return await self.apply_alone(wallet_id, operation)
+            return await self.enqueue(wallet_id, operation)
+        finally:
+            self.inflight[wallet_id] -= 1
+            if not self.inflight[wallet_id]:
+                del self.inflight[wallet_id]
+
+    async def enqueue(self, wallet_id: int, operation: WalletOperation):
+        loop = asyncio.get_running_loop()
+        operation.future = loop.create_future()
+        operation.submitted_at = time.perf_counter()
+
+        batch = self.pending.setdefault(wallet_id, [])
+        batch.append(operation)
+        if len(batch) >= self.max_batch:
+            self.flush(wallet_id)
+        elif len(batch) == 1:
+            self.timers[wallet_id] = loop.call_later(
+                self.window, self.flush, wallet_id
+            )
+
+        return await operation.future
+
+    async def deposit(self, wallet_id: int, amount: float) -> Wallet:
+        return await self.submit(
+            wallet_id,
+            WalletOperation(LedgerKind.deposit, amount, claim=idempotency.current.get()),
+        )
+
+    async def withdraw(self, wallet_id: int, amount: float) -> Wallet:
+        return await self.submit(
+            wallet_id,
+            WalletOperation(LedgerKind.withdraw, amount, claim=idempotency.current.get()),
+        )
+
+    async def purchase(self, wallet_id: int, item_id: int, quantity: int) -> Transaction:
+        return await self.submit(
+            wallet_id,
+            WalletOperation(
+                LedgerKind.purchase,
+                item_id=item_id,
+                quantity=quantity,
+                claim=idempotency.current.get(),
+            ),
+        )
+
+    def flush(self, wallet_id: int):
+        timer = self.timers.pop(wallet_id, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self.pending.pop(wallet_id, None)
+        if not batch:
+            return
+
+        task = asyncio.create_task(self.run(wallet_id, batch))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def run(self, wallet_id: int, batch: list[WalletOperation]):
+        started = time.perf_counter()
+        self.batches += 1
+        self.operations += len(batch)
+        self.max_batch_size = max(self.max_batch_size, len(batch))
+        for operation in batch:
+            self.wait_time += started - operation.submitted_at
+        self.max_wait_time = max(self.max_wait_time, started - batch[0].submitted_at)
+
+        results = await self.try_apply(wallet_id, batch, pooled=False)
+        if results is not None:
+            # debits the shard could not cover are applied once more with
+            # every shard pooled, which is what each of them would do alone
+            short = [i for i, result in enumerate(results) if result is None]
+            if short:
+                pooled = await self.try_apply(
+                    wallet_id, [batch[i] for i in short], pooled=True
+                )
+                for i, result in zip(short, pooled or [None] * len(short)):
+                    results[i] = result
+        else:
+            results = [None] * len(batch)
+
+        for operation, result in zip(batch, results):
+            if result is None:
+                result = await self.try_alone(wallet_id, operation)
+            # callers that went away still had their operation applied
+            if operation.future.done():
+                continue
+            if isinstance(result, Exception):
+                operation.future.set_exception(result)
+            else:
+                operation.future.set_result(result)
+
+    async def try_apply(
+        self, wallet_id: int, batch: list[WalletOperation], pooled: bool
+    ) -> list | None:
+        try:
+            async with models.session_factory() as session:
+                return await self.apply(session, wallet_id, batch, pooled)
+        except Exception:
+            # nothing was committed, the operations run alone
+            self.failed_batches += 1
+            return None
+
+    async def try_alone(self, wallet_id: int, operation: WalletOperation):
+        try:
+            return await self.apply_alone(wallet_id, operation)
+        except Exception as error:
+            return error
+
+    async def apply_alone(self, wallet_id: int, operation: WalletOperation):
+        async with models.session_factory() as session:
+            if operation.kind == LedgerKind.purchase:
+                return await purchase.purchase(
+                    session, wallet_id, operation.item_id, operation.quantity, operation.claim
+                )
+
+            if operation.kind == LedgerKind.deposit:
+                balance = await wallets.credit(session, wallet_id, operation.amount)
+                amount = operation.amount
+            else:
+                balance = await wallets.debit(session, wallet_id, operation.amount)
+                amount = -operation.amount
+            if balance is None:
+                await session.rollback()
+                if not await session.get(DBWallet, wallet_id):
+                    raise HTTPException(status_code=404, detail="Wallet not found")
+                raise HTTPException(status_code=400, detail="Insufficient funds")
+
+            await ledger.record(session, [ledger.entry(wallet_id, amount, operation.kind)])
+            wallet = await catalog.catalog.get_wallet(session, wallet_id)
+            result = Wallet(
+                id=wallet_id,
+                shard_count=wallet.shard_count if wallet else 1,
+                balance=balance,
+            )
+            if operation.claim is not None:
+                await operation.claim.complete(session, result)
+            await session.commit()
+            return result
+
+    async def apply(
+        self,
+        session: models.AsyncSession,
+        wallet_id: int,
+        batch: list[WalletOperation],
+        pooled: bool = False,
+    ) -> list:
+        # a batch locks the one row it writes to, a pooled batch the wallet
+        # and all of its shards. None in the results is an operation that was
+        # not applied.
+        if pooled:
+            wallet, shards = await wallets.lock(session, wallet_id)
+            if wallet is None:
+                return [
+                    HTTPException(
+                        status_code=404,
+                        detail=(
+                            "Wallet or Item not found"
+                            if operation.kind == LedgerKind.purchase
+                            else "Wallet not found"
+                        ),
+                    )
+                    for operation in batch
+                ]
+            shard, start = None, wallet.balance + sum(shards)
+        else:
+            locked = await wallets.lock_one(session, wallet_id)
+            if locked is None:
+                # gone, or resharded since the shard was picked
+                return [None] * len(batch)
+            shard, start = locked
+
+        item_ids = {
+            operation.item_id
+            for operation in batch
+            if operation.kind == LedgerKind.purchase
+        }
+        prices = {}
+        merchants = {}
+        if item_ids:
+            result = await session.exec(
+                select(DBItem.id, DBItem.price, DBItem.merchant_id).where(
+                    DBItem.id.in_(item_ids)
+                )
+            )
+            for item_id, price, merchant_id in result.all():
+                prices[item_id] = price
+                merchants[item_id] = merchant_id
+
+        balance = start
+        balances = []
+        results = []
+        purchases = []
+        entries = []
+        for operation in batch:
+            if operation.kind == LedgerKind.deposit:
+                balance += operation.amount
+                entries.append(ledger.entry(wallet_id, operation.amount, operation.kind))
+                balances.append((len(results), balance))
+                results.append(None)
+            elif operation.kind == LedgerKind.withdraw:
+                if balance < operation.amount:
+                    results.append(reject(shard, "Insufficient funds"))
+                    continue
+                balance -= operation.amount
+                entries.append(ledger.entry(wallet_id, -operation.amount, operation.kind))
+                balances.append((len(results), balance))
+                results.append(None)
+            elif operation.item_id not in prices:
+                results.append(HTTPException(status_code=404, detail="Wallet or Item not found"))
+            else:
+                amount = prices[operation.item_id] * operation.quantity
+                if balance < amount:
+                    results.append(reject(shard, "Insufficient balance"))
+                    continue
+                balance -= amount
+                entries.append(ledger.entry(wallet_id, -amount, operation.kind))
+                purchases.append((len(results), operation, amount, entries[-1]))
+                results.append(None)
+
+        if not entries:
+            await session.rollback()
+            return results
+
+        # deposits and withdrawals answer with the whole balance, which for a
+        # sharded wallet also counts the shards this batch did not touch
+        shard_count = 1
+        total = balance
+        if pooled:
+            await wallets.spread(session, wallet_id, wallet.shard_count, balance, len(shards))
+            shard_count = wallet.shard_count
+        else:
+            await wallets.set_one(session, wallet_id, shard, balance)
+        if shard is not None:
+            wallet = await catalog.catalog.get_wallet(session, wallet_id)
+            shard_count = wallet.shard_count if wallet else 1
+            if balances:
+                total = await wallets.get_balance(session, wallet_id)
+
+        if purchases:
+            result = await session.exec(
+                insert(DBTransaction).returning(
+                    DBTransaction.id, DBTransaction.quantity, sort_by_parameter_order=True
+                ),
+                params=[
+                    dict(
+                        quantity=operation.quantity,
+                        balance=amount,
+                        wallet_id=wallet_id,
+                        item_id=operation.item_id,
+                        merchant_id=merchants[operation.item_id],
+                    )
+                    for _, operation, amount, _ in purchases
+                ],
+            )
+            rows = result.all()
+            for (_, _, _, entry), row in zip(purchases, rows):
+                entry["transaction_id"] = row.id
+
+            await reports.record(
+                session,
+                [
+                    reports.rollup(
+                        merchants[operation.item_id],
+                        operation.item_id,
+                        operation.quantity,
+                        amount,
+                    )
+                    for _, operation, amount, _ in purchases
+                ],
+            )
+
+        await ledger.record(session, entries)
+
+        # the results only replace those of the caller once committed, so a
+        # failed commit runs every operation alone
+        applied = list(results)
+        for i, running in balances:
+            applied[i] = Wallet(
+                id=wallet_id, shard_count=shard_count, balance=total - (balance - running)
+            )
+        if purchases:
+            for (i, _, _, _), row in zip(purchases, rows):
+                applied[i] = Transaction(id=row.id, quantity=row.quantity)
+        for operation, result in zip(batch, applied):
+            if operation.claim is not None and isinstance(result, (Wallet, Transaction)):
+                await operation.claim.complete(session, result)
+        await session.commit()
+
+        # committed, nothing may fail the batch from here on. The board is
+        # approximate and rebuilt from the rollups on start.
+        with contextlib.suppress(Exception):
+            leaderboard.leaderboard.add(
+                [
+                    (merchants[operation.item_id], operation.item_id, operation.quantity)
+                    for _, operation, _, _ in purchases
+                ]
+            )
+        return applied
+
+    async def stop(self):
+        for wallet_id in list(self.pending):
+            self.flush(wallet_id)
+        if self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return dict(
+            pending=sum(len(batch) for batch in self.pending.values()),
+            batches=self.batches,
+            operations=self.operations,
+            avg_batch_size=self.operations / self.batches if self.batches else 0.0,
+            max_batch_size=self.max_batch_size,
+            avg_wait_time=self.wait_time / self.operations if self.operations else 0.0,
+            max_wait_time=self.max_wait_time,
+            direct=self.direct,
+            failed_batches=self.failed_batches,
+        )
+
+
+coalescer = WalletCoalescer(
+    window=settings.WALLET_COALESCE_WINDOW_MS / 1000,
+    max_batch=settings.WALLET_COALESCE_MAX_BATCH,
+)
@@ -7,6 +7,56 @@ class Settings(BaseSettings):
 
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 5 * 60  # 5 minutes
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 7 * 24 * 60  # 7 days
+    REVOCATION_REFRESH_SECONDS: float = 5
+    REVOCATION_OVERLAP_SECONDS: float = 60
+    LOGIN_FLUSH_SECONDS: float = 5
+
+    PAGE_COUNT_CACHE_SECONDS: int = 30
+    CATALOG_CACHE_SIZE: int = 100_000
+    CATALOG_CACHE_BYTES: int = 64 * 1024 * 1024  # 64 MiB
+    CATALOG_CACHE_TTL_SECONDS: float = 60
+    CATALOG_CACHE_MAX_STALENESS_SECONDS: float = 5
+
+    SHARED_CACHE_URL: str | None = None  # memory:// or redis://host:port/db
+    SHARED_CACHE_TIMEOUT_SECONDS: float = 0.1
+
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 30 * 60  # 30 minutes
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+
+    EXCHANGE_RATES_FILE: str | None = None
+    EXCHANGE_RATES_RELOAD_SECONDS: float = 10
+
+    PASSWORD_HASH_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    WALLET_MAX_SHARDS: int = 64
+    WALLET_COALESCE_WINDOW_MS: float = 2
+    WALLET_COALESCE_MAX_BATCH: int = 100
+
+    LEDGER_COMPACT_SECONDS: float = 60
+    LEDGER_SNAPSHOT_ENTRIES: int = 1000
+
+    IDEMPOTENCY_TTL_SECONDS: float = 24 * 60 * 60  # 1 day
+    IDEMPOTENCY_CACHE_SIZE: int = 10000
+    IDEMPOTENCY_PURGE_SECONDS: float = 60 * 60  # 1 hour
+    IDEMPOTENCY_LEASE_SECONDS: float = 30
+
+    PAYOUT_CHUNK_SIZE: int = 5000
+
+    LEADERBOARD_SIZE: int = 100
+    LEADERBOARD_SKETCH_WIDTH: int = 1 << 18
+    LEADERBOARD_SKETCH_DEPTH: int = 4
+
+    # shared by every node, see archive.py
+    TRANSACTION_ARCHIVE_DIR: str = "archive"
+    TRANSACTION_ARCHIVE_SECONDS: float = 60 * 60  # 1 hour
+    TRANSACTION_HOT_MONTHS: int = 3
+    TRANSACTION_PARTITION_MONTHS_AHEAD: int = 2
 
     model_config = SettingsConfigDict(
         env_file=".env", validate_assignment=True, extra="allow"
@@ -7,8 +7,9 @@ import jwt
 from pydantic import ValidationError
 
 from . import models
-from .models.users import User, DBUser
+from .models.users import User, DBUser, TokenData
 from . import security
+from .revocation import revocations
 from . import config
 
 
@@ -16,30 +17,68 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
 
 settings = config.get_settings()
 
+credentials_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
 
-async def get_current_user(
+
+async def get_token_payload(
     token: typing.Annotated[str, Depends(oauth2_scheme)],
-    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
-) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+) -> dict:
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
         )
-        user_id: int = payload.get("sub")
+        # refresh tokens are only accepted by the refresh_token grant
+        if payload.get("sub") is None or payload.get("typ") == "refresh":
+            raise credentials_exception
+
+        payload["sub"] = int(payload["sub"])
+    except (jwt.PyJWTError, ValueError):
+        raise credentials_exception
+
+    if revocations.is_revoked(payload):
+        raise credentials_exception
+
+    return payload
 
-        if user_id is None:
+
+async def get_current_principal(
+    payload: typing.Annotated[dict, Depends(get_token_payload)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> TokenData:
+    # the session only opens a connection when it is used, so tokens with
+    # current claims are authorized without touching the database
+    if payload.get("cv") == security.CLAIMS_VERSION:
+        try:
+            return TokenData(
+                user_id=payload["sub"],
+                status=payload["st"],
+                roles=payload["rl"],
+                permissions=payload["pm"],
+            )
+        except (KeyError, ValidationError):
             raise credentials_exception
 
-    except jwt.JWTError as e:
-        print(e)
+    user = await session.get(DBUser, payload["sub"])
+    if user is None:
         raise credentials_exception
 
-    user = await session.get(DBUser, user_id)
+    return TokenData(
+        user_id=user.id,
+        status=user.status,
+        roles=user.roles,
+        permissions=int(security.get_permissions(user.roles)),
+    )
+
+
+async def get_current_user(
+    principal: typing.Annotated[TokenData, Depends(get_current_principal)],
+    session: typing.Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> User:
+    user = await session.get(DBUser, principal.user_id)
     if user is None:
         raise credentials_exception
 
@@ -47,16 +86,16 @@ async def get_current_user(
 
 
 async def get_current_active_user(
-    current_user: typing.Annotated[User, Depends(get_current_user)]
-) -> User:
+    current_user: typing.Annotated[TokenData, Depends(get_current_principal)]
+) -> TokenData:
     if current_user.status != "active":
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
 
 async def get_current_active_superuser(
-    current_user: typing.Annotated[User, Depends(get_current_user)],
-) -> User:
+    current_user: typing.Annotated[TokenData, Depends(get_current_principal)],
+) -> TokenData:
     if "admin" not in current_user.roles:
         raise HTTPException(
             status_code=400, detail="The user doesn't have enough privileges"
@@ -70,10 +109,22 @@ class RoleChecker:
 
     def __call__(
         self,
-        user: typing.Annotated[User, Depends(get_current_active_user)],
+        user: typing.Annotated[TokenData, Depends(get_current_active_user)],
     ):
         for role in user.roles:
             if role in self.allowed_roles:
                 return
         # logger.debug(f"User with role {user.roles} not in {self.allowed_roles}")
         raise HTTPException(status_code=403, detail="Role not permitted")
+
+
+class PermissionChecker:
+    def __init__(self, permissions: security.Permission):
+        self.permissions = permissions
+
+    def __call__(
+        self,
+        user: typing.Annotated[TokenData, Depends(get_current_active_user)],
+    ):
+        if user.permissions & self.permissions != self.permissions:
+            raise HTTPException(status_code=403, detail="Permission denied")
@@ -0,0 +1,35 @@
+import hashlib
+import json
+
+from fastapi import Response
+
+
+def make_etag(data: bytes) -> str:
+    # strong, a hash of the exact JSON the body is built from
+    return '"%s"' % hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def page_etag(rows, *extra) -> str:
+    # a page changes when one of its rows is updated or another row takes
+    # its place, so the ids and updated_at of its rows version it. extra
+    # holds anything else in the body, such as the page count.
+    return make_etag(
+        json.dumps(
+            [extra, [(row.id, row.updated_at.isoformat()) for row in rows]]
+        ).encode()
+    )
+
+
+def matches(if_none_match: str | None, etag: str) -> bool:
+    # If-None-Match compares weakly, so a W/ prefix is ignored
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from . import config
+
+settings = config.get_settings()
+
+
+class PasswordHasher:
+    # bcrypt releases the GIL, so a small thread pool keeps the event loop
+    # free while hashes are computed; callers beyond the queue limit are
+    # rejected right away instead of piling up behind a login storm
+    def __init__(self, workers: int, max_queue: int, rounds: int):
+        self.context = CryptContext(
+            schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds
+        )
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="password-hasher"
+        )
+        self.max_pending = workers + max_queue
+        self.pending = 0
+
+        self.count = 0
+        self.rejected = 0
+        self.queue_wait_time = 0.0
+        self.max_queue_wait_time = 0.0
+        self.hash_time = 0.0
+        self.max_hash_time = 0.0
+
+    async def run(self, func, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent authentications",
+                headers={"Retry-After": "1"},
+            )
+
+        def timed():
+            started = time.perf_counter()
+            return started, func(*args), time.perf_counter()
+
+        self.pending += 1
+        submitted = time.perf_counter()
+        try:
+            started, result, finished = await asyncio.get_running_loop().run_in_executor(
+                self.executor, timed
+            )
+        finally:
+            self.pending -= 1
+
+        self.count += 1
+        self.queue_wait_time += started - submitted
+        self.max_queue_wait_time = max(self.max_queue_wait_time, started - submitted)
+        self.hash_time += finished - started
+        self.max_hash_time = max(self.max_hash_time, finished - started)
+        return result
+
+    async def hash(self, password: str) -> str:
+        return await self.run(self.context.hash, password)
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        # the new hash is set when the stored one was made with other settings
+        return await self.run(self.context.verify_and_update, password, hashed_password)
+
+    def stats(self) -> dict:
+        return dict(
+            pending=self.pending,
+            max_pending=self.max_pending,
+            count=self.count,
+            rejected=self.rejected,
+            avg_queue_wait_time=self.queue_wait_time / self.count if self.count else 0.0,
+            max_queue_wait_time=self.max_queue_wait_time,
+            avg_hash_time=self.hash_time / self.count if self.count else 0.0,
+            max_hash_time=self.max_hash_time,
+        )
+
+
+hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_queue=settings.PASSWORD_HASH_MAX_QUEUE,
+    rounds=settings.PASSWORD_HASH_ROUNDS,
+)
@@ -0,0 +1,364 @@
+import asyncio
+import contextlib
+import contextvars
+import dataclasses
+import datetime
+import hashlib
+import typing
+
+from fastapi import Header, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import delete, exists, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from . import config
+from . import models
+from .cache import TTLCache
+from .models.idempotency_model import DBIdempotencyKey, DBIdempotencyStep
+
+settings = config.get_settings()
+
+
+class PartiallyApplied(Exception):
+    # raised by a request that committed some of its steps before failing.
+    # The claim is kept, so the key is not free for a request that would
+    # apply those steps again, and a retry after the lease runs out skips
+    # them.
+    pass
+
+
+@dataclasses.dataclass(frozen=True)
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    body: dict
+
+    def replay(self) -> JSONResponse:
+        return JSONResponse(
+            self.body,
+            status_code=self.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class Claim:
+    key: str
+    fingerprint: str
+    # tells this claim apart from a later one of the same key
+    claimed_at: datetime.datetime
+    ttl: float
+
+    def finish(self, status_code: int, body):
+        # only an unfinished claim is finished, the first outcome stays
+        return (
+            update(DBIdempotencyKey)
+            .where(
+                DBIdempotencyKey.key == self.key,
+                DBIdempotencyKey.created_at == self.claimed_at,
+                DBIdempotencyKey.status_code.is_(None),
+            )
+            .values(
+                status_code=status_code,
+                body=body,
+                expires_at=datetime.datetime.now() + datetime.timedelta(seconds=self.ttl),
+            )
+        )
+
+    async def complete(self, session: models.AsyncSession, response):
+        # called before the commit of the transaction that applies the request
+        await session.exec(self.finish(status.HTTP_200_OK, jsonable_encoder(response)))
+
+
+# the claim of the request running in this task, None without a key
+current: contextvars.ContextVar[Claim | None] = contextvars.ContextVar(
+    "idempotency_claim", default=None
+)
+
+
+async def complete(session: models.AsyncSession, response):
+    claim = current.get()
+    if claim is not None:
+        await claim.complete(session, response)
+
+
+class IdempotencyStore:
+    # responses are kept in idempotency_keys, with a LRU in front of it so
+    # retries hitting the same worker never touch the database. Duplicates
+    # that arrive while the first request runs wait for its result instead of
+    # running again.
+    #
+    # Requests that move money store their response with complete(), in the
+    # transaction that moves it, so the key is finished exactly when the
+    # change is committed. A claim only holds the key for a short lease,
+    # which the worker running the request keeps extending. A worker that
+    # dies mid request stops extending it, and a retry after the lease claims
+    # the key again rather than getting 409 until the key expires. Only an
+    # unfinished claim is ever released or claimed again, so whatever fails
+    # after the commit, a retry replays the stored response.
+    def __init__(self, cache_size: int, ttl: float, lease: float):
+        self.ttl = ttl
+        self.lease = lease
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.task = None
+
+    async def execute(self, key: str, fingerprint: str, func, *args):
+        stored = self.cache.get(key)
+        if stored is None and key in self.inflight:
+            stored, _ = await asyncio.shield(self.inflight[key])
+        if stored is not None:
+            return self.check(stored, fingerprint).replay()
+
+        # a client that disconnects must not leave the key half done, so the
+        # request runs in its own task and the caller only waits for it
+        task = asyncio.create_task(self.claim_and_run(key, fingerprint, func, *args))
+        self.inflight[key] = task
+        task.add_done_callback(self.finish)
+
+        stored, response = await asyncio.shield(task)
+        if response is None:
+            return stored.replay()
+        if isinstance(response, HTTPException):
+            raise response
+        return response
+
+    def finish(self, task: asyncio.Task):
+        for key, inflight in list(self.inflight.items()):
+            if inflight is task:
+                del self.inflight[key]
+        # the caller may be gone, this keeps the error from being reported as
+        # never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def check(self, stored: StoredResponse, fingerprint: str) -> StoredResponse:
+        if stored.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="Idempotency-Key was used with another request",
+            )
+        return stored
+
+    async def claim_and_run(self, key: str, fingerprint: str, func, *args):
+        now = datetime.datetime.now()
+        async with models.session_factory() as session:
+            # a new key or an expired one is claimed by exactly one request
+            result = await session.exec(
+                insert(DBIdempotencyKey)
+                .values(
+                    key=key,
+                    fingerprint=fingerprint,
+                    created_at=now,
+                    expires_at=now + datetime.timedelta(seconds=self.lease),
+                )
+                .on_conflict_do_update(
+                    index_elements=[DBIdempotencyKey.key],
+                    set_=dict(
+                        fingerprint=fingerprint,
+                        status_code=None,
+                        body=None,
+                        created_at=now,
+                        expires_at=now + datetime.timedelta(seconds=self.lease),
+                    ),
+                    where=DBIdempotencyKey.expires_at < now,
+                )
+                .returning(DBIdempotencyKey.key)
+            )
+            claimed = result.first() is not None
+            await session.commit()
+
+            if not claimed:
+                result = await session.exec(
+                    select(
+                        DBIdempotencyKey.fingerprint,
+                        DBIdempotencyKey.status_code,
+                        DBIdempotencyKey.body,
+                    ).where(DBIdempotencyKey.key == key)
+                )
+                row = result.one()
+                if row.status_code is None:
+                    # the first request runs in another worker
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail="A request with this Idempotency-Key is in progress",
+                    )
+                stored = StoredResponse(row.fingerprint, row.status_code, row.body)
+                self.cache.set(key, stored)
+                return self.check(stored, fingerprint), None
+
+            claim = Claim(key, fingerprint, now, self.ttl)
+            current.set(claim)
+            heartbeat = asyncio.create_task(self.extend(key, now))
+            try:
+                response = await func(*args)
+                stored = StoredResponse(
+                    fingerprint, status.HTTP_200_OK, jsonable_encoder(response)
+                )
+            except HTTPException as error:
+                if error.status_code >= 500:
+                    return await self.release(session, claim, error)
+                stored = StoredResponse(
+                    fingerprint, error.status_code, dict(detail=error.detail)
+                )
+                response = error
+            except PartiallyApplied:
+                raise
+            except BaseException as error:
+                return await self.release(session, claim, error)
+            finally:
+                heartbeat.cancel()
+
+            # a no-op when the request stored it with its change
+            await session.exec(claim.finish(stored.status_code, stored.body))
+            await session.commit()
+
+        self.cache.set(key, stored)
+        return stored, response
+
+    async def extend(self, key: str, claimed_at: datetime.datetime):
+        # claimed_at tells this claim apart from a later one of the same key
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            with contextlib.suppress(Exception):
+                async with models.session_factory() as session:
+                    await session.exec(
+                        update(DBIdempotencyKey)
+                        .where(
+                            DBIdempotencyKey.key == key,
+                            DBIdempotencyKey.created_at == claimed_at,
+                            DBIdempotencyKey.status_code.is_(None),
+                        )
+                        .values(
+                            expires_at=datetime.datetime.now()
+                            + datetime.timedelta(seconds=self.lease)
+                        )
+                    )
+                    await session.commit()
+
+    async def release(
+        self, session: models.AsyncSession, claim: Claim, error: BaseException
+    ):
+        # nothing was committed unless the claim was finished with it, in
+        # which case the stored response is the answer
+        result = await session.exec(
+            delete(DBIdempotencyKey)
+            .where(
+                DBIdempotencyKey.key == claim.key,
+                DBIdempotencyKey.created_at == claim.claimed_at,
+                DBIdempotencyKey.status_code.is_(None),
+            )
+            .returning(DBIdempotencyKey.key)
+        )
+        released = result.first() is not None
+        await session.commit()
+        if released:
+            raise error
+
+        result = await session.exec(
+            select(DBIdempotencyKey.status_code, DBIdempotencyKey.body).where(
+                DBIdempotencyKey.key == claim.key,
+                DBIdempotencyKey.created_at == claim.claimed_at,
+            )
+        )
+        row = result.one_or_none()
+        if row is None:
+            raise error
+        stored = StoredResponse(claim.fingerprint, row.status_code, row.body)
+        self.cache.set(claim.key, stored)
+        return stored, None
+
+    async def purge(self):
+        # a claim that failed after committing some of its steps only has its
+        # lease, but it is kept for the full ttl: purging it would delete its
+        # steps with it, and a retry would apply them again
+        now = datetime.datetime.now()
+        async with models.session_factory() as session:
+            await session.exec(
+                delete(DBIdempotencyKey).where(
+                    DBIdempotencyKey.expires_at < now,
+                    or_(
+                        DBIdempotencyKey.status_code.is_not(None),
+                        DBIdempotencyKey.created_at
+                        < now - datetime.timedelta(seconds=self.ttl),
+                        ~exists().where(DBIdempotencyStep.key == DBIdempotencyKey.key),
+                    ),
+                )
+            )
+            await session.commit()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.IDEMPOTENCY_PURGE_SECONDS)
+            with contextlib.suppress(Exception):
+                await self.purge()
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+
+store = IdempotencyStore(
+    cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+    lease=settings.IDEMPOTENCY_LEASE_SECONDS,
+)
+
+
+class IdempotentRequest:
+    # route dependency, without the header the request just runs
+    def __init__(self, key: str | None, fingerprint: str | None):
+        self.key = key
+        self.fingerprint = fingerprint
+
+    @classmethod
+    async def from_request(
+        cls,
+        request: Request,
+        idempotency_key: typing.Annotated[str | None, Header(max_length=255)] = None,
+    ) -> "IdempotentRequest":
+        if idempotency_key is None:
+            return cls(None, None)
+
+        fingerprint = hashlib.sha256()
+        fingerprint.update(request.method.encode())
+        fingerprint.update(request.url.path.encode())
+        fingerprint.update(request.url.query.encode())
+        fingerprint.update(await request.body())
+        return cls(idempotency_key, fingerprint.hexdigest())
+
+    async def steps(self, session: models.AsyncSession) -> dict:
+        if self.key is None:
+            return {}
+        result = await session.exec(
+            select(DBIdempotencyStep.step, DBIdempotencyStep.body).where(
+                DBIdempotencyStep.key == self.key,
+                DBIdempotencyStep.fingerprint == self.fingerprint,
+            )
+        )
+        return dict(result.all())
+
+    async def record_step(self, session: models.AsyncSession, step: int, body):
+        # in the transaction of the step, without committing it
+        if self.key is None:
+            return
+        await session.exec(
+            insert(DBIdempotencyStep).values(
+                key=self.key,
+                fingerprint=self.fingerprint,
+                step=step,
+                body=jsonable_encoder(body),
+            )
+        )
+
+    async def run(self, func, *args):
+        if self.key is None:
+            return await func(*args)
+        return await store.execute(self.key, self.fingerprint, func, *args)
@@ -0,0 +1,128 @@
+import heapq
+
+import numpy as np
+from sqlalchemy import func, select
+
+from . import config
+from . import models
+from .models.report_model import DBRevenueRollup
+
+settings = config.get_settings()
+
+PRIME = (1 << 31) - 1
+REBUILD_CHUNK_SIZE = 100_000
+
+
+class CountMinSketch:
+    # fixed size counter table, estimates never undercount and overcount by
+    # at most total / width * e with probability 1 - exp(-depth)
+    def __init__(self, width: int, depth: int, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.width = width
+        self.rows = np.arange(depth)[:, None]
+        self.a = rng.integers(1, PRIME, size=(depth, 1), dtype=np.uint64)
+        self.b = rng.integers(0, PRIME, size=(depth, 1), dtype=np.uint64)
+        self.table = np.zeros((depth, width), dtype=np.int64)
+
+    def indexes(self, keys: np.ndarray) -> np.ndarray:
+        keys = keys.astype(np.uint64)[None, :] % np.uint64(PRIME)
+        return ((self.a * keys + self.b) % np.uint64(PRIME) % np.uint64(self.width)).astype(
+            np.intp
+        )
+
+    def add(self, keys: np.ndarray, counts: np.ndarray) -> np.ndarray:
+        indexes = self.indexes(keys)
+        np.add.at(self.table, (self.rows, indexes), counts)
+        return self.table[self.rows, indexes].min(axis=0)
+
+    def estimate(self, keys: np.ndarray) -> np.ndarray:
+        return self.table[self.rows, self.indexes(keys)].min(axis=0)
+
+    def clear(self):
+        self.table.fill(0)
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+
+class Leaderboard:
+    # best selling items by quantity. Item ids are unique across merchants, so
+    # one sketch counts every item and each merchant only keeps a candidate
+    # set of its `size` highest estimates. Counts are rebuilt from the rollups
+    # at startup and then follow the purchases committed by this process.
+    def __init__(self, size: int, width: int, depth: int):
+        self.size = size
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates: dict[int, dict[int, int]] = {}
+
+    def add(self, sales: list[tuple[int | None, int, int]]):
+        # sales are (merchant_id, item_id, quantity)
+        sales = [sale for sale in sales if sale[0] is not None]
+        if not sales:
+            return
+
+        merchant_ids, item_ids, quantities = zip(*sales)
+        estimates = self.sketch.add(
+            np.array(item_ids, dtype=np.int64), np.array(quantities, dtype=np.int64)
+        )
+        for merchant_id, item_id, estimate in zip(merchant_ids, item_ids, estimates.tolist()):
+            self.offer(merchant_id, item_id, estimate)
+
+    def offer(self, merchant_id: int, item_id: int, estimate: int):
+        candidates = self.candidates.setdefault(merchant_id, {})
+        if item_id in candidates or len(candidates) < self.size:
+            candidates[item_id] = estimate
+            return
+
+        smallest = min(candidates, key=candidates.get)
+        if estimate > candidates[smallest]:
+            del candidates[smallest]
+            candidates[item_id] = estimate
+
+    def top(self, merchant_id: int, limit: int) -> list[tuple[int, int]]:
+        candidates = self.candidates.get(merchant_id)
+        if not candidates:
+            return []
+
+        # estimates only grow, refresh the ones stored when each item last sold
+        item_ids = list(candidates)
+        estimates = self.sketch.estimate(np.array(item_ids, dtype=np.int64)).tolist()
+        candidates.update(zip(item_ids, estimates))
+        return heapq.nlargest(limit, candidates.items(), key=lambda item: item[1])
+
+    def clear(self):
+        self.sketch.clear()
+        self.candidates.clear()
+
+    async def rebuild(self):
+        async with models.session_factory() as session:
+            result = await session.stream(
+                select(
+                    DBRevenueRollup.merchant_id,
+                    DBRevenueRollup.item_id,
+                    func.sum(DBRevenueRollup.quantity),
+                )
+                .group_by(DBRevenueRollup.merchant_id, DBRevenueRollup.item_id)
+                .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+            )
+            self.clear()
+            async for rows in result.partitions():
+                self.add([tuple(row) for row in rows])
+
+    async def start(self):
+        await self.rebuild()
+
+    def stats(self) -> dict:
+        return dict(
+            merchants=len(self.candidates),
+            candidates=sum(len(candidates) for candidates in self.candidates.values()),
+            sketch_bytes=self.sketch.nbytes,
+        )
+
+
+leaderboard = Leaderboard(
+    size=settings.LEADERBOARD_SIZE,
+    width=settings.LEADERBOARD_SKETCH_WIDTH,
+    depth=settings.LEADERBOARD_SKETCH_DEPTH,
+)
@@ -0,0 +1,157 @@
+import asyncio
+import contextlib
+import datetime
+
+from sqlalchemy import func, insert, select
+
+from . import config
+from . import models
+from .models.ledger_model import DBBalanceSnapshot, DBLedgerEntry, LedgerKind
+from .models.wallet_model import DBWallet
+
+settings = config.get_settings()
+
+# Every balance change is appended to ledger_entries in the transaction that
+# changes wallets.balance, which stays the row that debits are checked
+# against. A wallet's balance at any time is its latest snapshot at or
+# before that time plus the entries after the snapshot.
+
+
+def entry(
+    wallet_id: int,
+    amount: float,
+    kind: LedgerKind,
+    transaction_id: int | None = None,
+    transfer_id: int | None = None,
+) -> dict:
+    return dict(
+        wallet_id=wallet_id,
+        amount=amount,
+        kind=kind.value,
+        transaction_id=transaction_id,
+        transfer_id=transfer_id,
+    )
+
+
+async def record(session: models.AsyncSession, entries: list[dict]):
+    if entries:
+        await session.exec(insert(DBLedgerEntry), params=entries)
+
+
+def latest_snapshot(wallet_id: int, as_of: datetime.datetime | None = None):
+    statement = (
+        select(DBBalanceSnapshot.entry_id, DBBalanceSnapshot.balance)
+        .where(DBBalanceSnapshot.wallet_id == wallet_id)
+        .order_by(DBBalanceSnapshot.entry_id.desc())
+        .limit(1)
+    )
+    if as_of is not None:
+        statement = statement.where(DBBalanceSnapshot.created_at <= as_of)
+    return statement
+
+
+async def get_balance(
+    session: models.AsyncSession,
+    wallet_id: int,
+    as_of: datetime.datetime | None = None,
+) -> float:
+    result = await session.exec(latest_snapshot(wallet_id, as_of))
+    snapshot = result.one_or_none()
+    entry_id, balance = snapshot if snapshot is not None else (0, 0.0)
+
+    statement = select(func.coalesce(func.sum(DBLedgerEntry.amount), 0.0)).where(
+        DBLedgerEntry.wallet_id == wallet_id, DBLedgerEntry.id > entry_id
+    )
+    if as_of is not None:
+        statement = statement.where(DBLedgerEntry.created_at <= as_of)
+    result = await session.exec(statement)
+    return balance + result.scalar_one()
+
+
+async def compact(session: models.AsyncSession, wallet_id: int) -> DBBalanceSnapshot | None:
+    # every ledger insert holds a key share lock on its wallets row through the
+    # foreign key, so after this lock no uncommitted entry can show up behind
+    # the snapshot
+    await session.exec(
+        select(DBWallet.id).where(DBWallet.id == wallet_id).with_for_update()
+    )
+
+    result = await session.exec(latest_snapshot(wallet_id))
+    snapshot = result.one_or_none()
+    entry_id, balance = snapshot if snapshot is not None else (0, 0.0)
+
+    result = await session.exec(
+        select(
+            func.max(DBLedgerEntry.id),
+            func.sum(DBLedgerEntry.amount),
+            func.max(DBLedgerEntry.created_at),
+        ).where(DBLedgerEntry.wallet_id == wallet_id, DBLedgerEntry.id > entry_id)
+    )
+    last_entry_id, amount, created_at = result.one()
+    if last_entry_id is None:
+        await session.rollback()
+        return None
+
+    snapshot = DBBalanceSnapshot(
+        wallet_id=wallet_id,
+        entry_id=last_entry_id,
+        balance=balance + amount,
+        created_at=created_at,
+    )
+    session.add(snapshot)
+    await session.commit()
+    return snapshot
+
+
+def build_compaction_candidates(min_entries: int):
+    last_entry_id = (
+        select(func.coalesce(func.max(DBBalanceSnapshot.entry_id), 0))
+        .where(DBBalanceSnapshot.wallet_id == DBLedgerEntry.wallet_id)
+        .scalar_subquery()
+    )
+    return (
+        select(DBLedgerEntry.wallet_id)
+        .where(DBLedgerEntry.id > last_entry_id)
+        .group_by(DBLedgerEntry.wallet_id)
+        .having(func.count() >= min_entries)
+    )
+
+
+class Compactor:
+    # rolls snapshots forward for wallets with many entries since their last one
+    def __init__(self, interval: float, min_entries: int):
+        self.interval = interval
+        self.min_entries = min_entries
+        self.task = None
+
+    async def compact_all(self) -> int:
+        async with models.session_factory() as session:
+            result = await session.exec(build_compaction_candidates(self.min_entries))
+            wallet_ids = result.scalars().all()
+            await session.rollback()
+
+            for wallet_id in wallet_ids:
+                await compact(session, wallet_id)
+        return len(wallet_ids)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            with contextlib.suppress(Exception):
+                await self.compact_all()
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+
+compactor = Compactor(
+    interval=settings.LEDGER_COMPACT_SECONDS,
+    min_entries=settings.LEDGER_SNAPSHOT_ENTRIES,
+)
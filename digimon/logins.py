@@ -0,0 +1,86 @@
+import asyncio
+import contextlib
+import datetime
+
+from sqlalchemy import ARRAY, DateTime, Integer, column, func, literal, or_, update
+
+from . import config
+from . import models
+from .models.users import DBUser
+
+settings = config.get_settings()
+
+
+def build_login_update(logins: dict[int, datetime.datetime]):
+    # one UPDATE for every user that logged in since the last flush. A date
+    # is never moved back, so flushes from several processes can interleave.
+    user_ids = sorted(logins)
+    rows = (
+        func.unnest(
+            literal(user_ids, ARRAY(Integer)),
+            literal([logins[user_id] for user_id in user_ids], ARRAY(DateTime)),
+        )
+        .table_valued(column("user_id", Integer), column("last_login_date", DateTime))
+        .render_derived(name="logins")
+    )
+    return (
+        update(DBUser)
+        .where(
+            DBUser.id == rows.c.user_id,
+            or_(
+                DBUser.last_login_date.is_(None),
+                DBUser.last_login_date < rows.c.last_login_date,
+            ),
+        )
+        .values(last_login_date=rows.c.last_login_date)
+    )
+
+
+class LoginRecorder:
+    # last_login_date is informational, so a login only stamps it in memory
+    # and the dates are written behind the request. It lags by up to one
+    # interval, and the dates of a crashed process are lost.
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.logins: dict[int, datetime.datetime] = {}
+        self.task = None
+
+    def record(self, user_id: int, date: datetime.datetime | None = None):
+        self.logins[user_id] = date or datetime.datetime.now()
+
+    async def flush(self) -> int:
+        if not self.logins:
+            return 0
+
+        logins, self.logins = self.logins, {}
+        try:
+            async with models.session_factory() as session:
+                await session.exec(build_login_update(logins))
+                await session.commit()
+        except Exception:
+            # retried with the next flush, unless the user logged in again
+            for user_id, date in logins.items():
+                self.logins.setdefault(user_id, date)
+            raise
+        return len(logins)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            with contextlib.suppress(Exception):
+                await self.flush()
+
+    async def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        with contextlib.suppress(Exception):
+            await self.flush()
+
+
+recorder = LoginRecorder(interval=settings.LOGIN_FLUSH_SECONDS)
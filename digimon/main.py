@@ -1,8 +1,3 @@
-from gevent import monkey
-from requests import session
-
-monkey.patch_all()
-
 from fastapi import FastAPI
 
 from .models import init_db
@@ -12,13 +7,38 @@ from digimon import config
 from contextlib import asynccontextmanager
 
 from . import models
+from .catalog import catalog
+from .idempotency import store as idempotency_store
+from .leaderboard import leaderboard
+from .ledger import compactor
+from .logins import recorder as login_recorder
+from .partitions import archiver
+from .coalescer import coalescer
+from .rates import provider
+from .revocation import revocations
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await revocations.start()
+    await provider.start()
+    await compactor.start()
+    await idempotency_store.start()
+    await leaderboard.start()
+    await archiver.start()
+    await login_recorder.start()
+    await catalog.start()
     yield
+    await catalog.stop()
+    await login_recorder.stop()
+    await archiver.stop()
+    await idempotency_store.stop()
+    await compactor.stop()
+    await coalescer.stop()
+    await provider.stop()
+    await revocations.stop()
     if models.engine is not None:
         # Close the DB connection
-        await session.close()
+        await models.close_session()
 
 
 def create_app(settings=None):
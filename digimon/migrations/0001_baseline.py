@@ -0,0 +1,111 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+transactional = True
+
+# the schema the later migrations start from, written out so it stays the
+# same whatever the models become. A database from before the migrations
+# already has users, merchants, items, wallets and transactions, IF NOT
+# EXISTS keeps them and COLUMNS brings them to the same columns.
+# transactions is a plain table here, 0002 partitions it, and the indexes of
+# 0003 and 0006 and the columns of 0005 are left to those migrations.
+TABLES = [
+    "CREATE TABLE IF NOT EXISTS idempotency_keys ("
+    "key VARCHAR NOT NULL, fingerprint VARCHAR NOT NULL, status_code INTEGER, body JSON, "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "PRIMARY KEY (key))",
+    "CREATE TABLE IF NOT EXISTS revenue_rollups ("
+    "merchant_id INTEGER NOT NULL, item_id INTEGER NOT NULL, day DATE NOT NULL, "
+    "count INTEGER NOT NULL, quantity INTEGER NOT NULL, revenue FLOAT NOT NULL, "
+    "PRIMARY KEY (merchant_id, item_id, day))",
+    "CREATE TABLE IF NOT EXISTS users ("
+    "email VARCHAR NOT NULL, username VARCHAR NOT NULL, "
+    "first_name VARCHAR NOT NULL, last_name VARCHAR NOT NULL, "
+    "id SERIAL NOT NULL, password VARCHAR NOT NULL, status VARCHAR NOT NULL, "
+    "roles JSON NOT NULL, token_generation INTEGER NOT NULL, "
+    "register_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "updated_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "last_login_date TIMESTAMP WITHOUT TIME ZONE, "
+    "PRIMARY KEY (id))",
+    "CREATE TABLE IF NOT EXISTS merchants ("
+    "name VARCHAR NOT NULL, description VARCHAR, tax_id VARCHAR NOT NULL, "
+    "id SERIAL NOT NULL, user_id INTEGER NOT NULL, "
+    "PRIMARY KEY (id), FOREIGN KEY (user_id) REFERENCES users (id))",
+    "CREATE TABLE IF NOT EXISTS refresh_tokens ("
+    "jti VARCHAR NOT NULL, family VARCHAR NOT NULL, user_id INTEGER NOT NULL, "
+    "issued_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "used_at TIMESTAMP WITHOUT TIME ZONE, revoked BOOLEAN NOT NULL, "
+    "PRIMARY KEY (jti), FOREIGN KEY (user_id) REFERENCES users (id))",
+    "CREATE TABLE IF NOT EXISTS revoked_tokens ("
+    "id SERIAL NOT NULL, jti VARCHAR, generation INTEGER, user_id INTEGER NOT NULL, "
+    "revoked_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "PRIMARY KEY (id), FOREIGN KEY (user_id) REFERENCES users (id))",
+    "CREATE TABLE IF NOT EXISTS items ("
+    "name VARCHAR NOT NULL, description VARCHAR, price FLOAT NOT NULL, tax FLOAT, "
+    "id SERIAL NOT NULL, merchant_id INTEGER, user_id INTEGER NOT NULL, "
+    "PRIMARY KEY (id), FOREIGN KEY (merchant_id) REFERENCES merchants (id), "
+    "FOREIGN KEY (user_id) REFERENCES users (id))",
+    "CREATE TABLE IF NOT EXISTS wallets ("
+    "balance FLOAT NOT NULL, id SERIAL NOT NULL, "
+    "shard_count INTEGER NOT NULL DEFAULT 1, merchant_id INTEGER, "
+    "PRIMARY KEY (id), FOREIGN KEY (merchant_id) REFERENCES merchants (id))",
+    "CREATE TABLE IF NOT EXISTS balance_snapshots ("
+    "id SERIAL NOT NULL, wallet_id INTEGER NOT NULL, entry_id BIGINT NOT NULL, "
+    "balance FLOAT NOT NULL, created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY (wallet_id) REFERENCES wallets (id) ON DELETE CASCADE)",
+    "CREATE TABLE IF NOT EXISTS ledger_entries ("
+    "id BIGSERIAL NOT NULL, wallet_id INTEGER NOT NULL, amount FLOAT NOT NULL, "
+    "kind VARCHAR NOT NULL, transaction_id INTEGER, transfer_id INTEGER, "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(), "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY (wallet_id) REFERENCES wallets (id) ON DELETE CASCADE)",
+    "CREATE TABLE IF NOT EXISTS transactions ("
+    "quantity INTEGER NOT NULL, id SERIAL NOT NULL, balance FLOAT NOT NULL, "
+    "wallet_id INTEGER, item_id INTEGER, merchant_id INTEGER, "
+    "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(), "
+    "PRIMARY KEY (id), FOREIGN KEY (wallet_id) REFERENCES wallets (id), "
+    "FOREIGN KEY (item_id) REFERENCES items (id))",
+    "CREATE TABLE IF NOT EXISTS transfers ("
+    "id SERIAL NOT NULL, from_wallet_id INTEGER NOT NULL, to_wallet_id INTEGER NOT NULL, "
+    "amount FLOAT NOT NULL, created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "PRIMARY KEY (id), "
+    "FOREIGN KEY (from_wallet_id) REFERENCES wallets (id) ON DELETE CASCADE, "
+    "FOREIGN KEY (to_wallet_id) REFERENCES wallets (id) ON DELETE CASCADE)",
+    "CREATE TABLE IF NOT EXISTS wallet_shards ("
+    "wallet_id INTEGER NOT NULL, shard INTEGER NOT NULL, balance FLOAT NOT NULL, "
+    "PRIMARY KEY (wallet_id, shard), "
+    "FOREIGN KEY (wallet_id) REFERENCES wallets (id) ON DELETE CASCADE)",
+    # the tables are new or small when this runs
+    "CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at "
+    "ON idempotency_keys (expires_at)",
+    "CREATE INDEX IF NOT EXISTS ix_refresh_tokens_family ON refresh_tokens (family)",
+    "CREATE INDEX IF NOT EXISTS ix_balance_snapshots_wallet_id_entry_id "
+    "ON balance_snapshots (wallet_id, entry_id)",
+    "CREATE INDEX IF NOT EXISTS ix_ledger_entries_wallet_id_id "
+    "ON ledger_entries (wallet_id, id)",
+]
+
+# columns added to tables that existed before the migrations. The defaults
+# are constants or now(), which postgresql stores once instead of rewriting
+# the table. Existing transactions get the time of the migration.
+COLUMNS = [
+    ("users", "status", "VARCHAR NOT NULL DEFAULT 'active'"),
+    ("users", "roles", "JSON NOT NULL DEFAULT '[\"user\"]'"),
+    ("users", "token_generation", "INTEGER NOT NULL DEFAULT 0"),
+    ("wallets", "shard_count", "INTEGER NOT NULL DEFAULT 1"),
+    ("transactions", "merchant_id", "INTEGER"),
+    ("transactions", "created_at", "TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()"),
+]
+
+
+async def upgrade(conn: AsyncConnection):
+    for statement in TABLES:
+        await conn.execute(text(statement))
+    for table, column, definition in COLUMNS:
+        await conn.execute(
+            text(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+        )
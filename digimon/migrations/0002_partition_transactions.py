@@ -0,0 +1,48 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import LOCK_TIMEOUT, create_index
+
+transactional = False
+
+
+async def upgrade(conn: AsyncConnection):
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('transactions')")
+    )
+    if result.scalar_one() == "p":
+        return
+
+    # the old table becomes the default partition of a new partitioned one,
+    # the archiver then moves its rows month by month into their own
+    # partitions. The indexes the partitioned table expects are built first
+    # without blocking writes, so attaching only has to take short locks.
+    await create_index(
+        conn, "transactions_default_id_created_at", "transactions", ["id", "created_at"], unique=True
+    )
+    await create_index(conn, "transactions_default_wallet_id_id", "transactions", ["wallet_id", "id"])
+    await create_index(conn, "transactions_default_item_id", "transactions", ["item_id"])
+
+    async with conn.engine.begin() as transaction:
+        await transaction.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+        for statement in [
+            "ALTER TABLE transactions RENAME TO transactions_default",
+            "ALTER TABLE transactions_default DROP CONSTRAINT transactions_pkey",
+            "ALTER TABLE transactions_default ADD CONSTRAINT transactions_default_pkey "
+            "PRIMARY KEY USING INDEX transactions_default_id_created_at",
+            "CREATE TABLE transactions ("
+            "quantity INTEGER NOT NULL, "
+            "id INTEGER NOT NULL DEFAULT nextval('transactions_id_seq'), "
+            "balance FLOAT NOT NULL, "
+            "wallet_id INTEGER REFERENCES wallets (id), "
+            "item_id INTEGER REFERENCES items (id), "
+            "merchant_id INTEGER, "
+            "created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now(), "
+            "CONSTRAINT transactions_pkey PRIMARY KEY (id, created_at)"
+            ") PARTITION BY RANGE (created_at)",
+            "CREATE INDEX ix_transactions_wallet_id_id ON transactions (wallet_id, id)",
+            "CREATE INDEX ix_transactions_item_id ON transactions (item_id)",
+            "ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id",
+            "ALTER TABLE transactions ATTACH PARTITION transactions_default DEFAULT",
+        ]:
+            await transaction.execute(text(statement))
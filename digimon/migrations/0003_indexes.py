@@ -0,0 +1,31 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import create_index
+
+transactional = False
+
+# foreign keys are indexed so joins and the checks made when a referenced row
+# is deleted do not scan the referencing table. transactions.wallet_id is
+# covered by ix_transactions_wallet_id_id. Login looks users up by username
+# and email, and the item list sorts by name and price.
+INDEXES = [
+    ("ix_users_username", "users", ["username"]),
+    ("ix_users_email", "users", ["email"]),
+    ("ix_merchants_user_id", "merchants", ["user_id"]),
+    ("ix_items_merchant_id", "items", ["merchant_id"]),
+    ("ix_items_user_id", "items", ["user_id"]),
+    ("ix_items_name_id", "items", ["name", "id"]),
+    ("ix_items_price_id", "items", ["price", "id"]),
+    ("ix_wallets_merchant_id", "wallets", ["merchant_id"]),
+    ("ix_transactions_wallet_id_id", "transactions", ["wallet_id", "id"]),
+    ("ix_transactions_item_id", "transactions", ["item_id"]),
+    ("ix_refresh_tokens_user_id", "refresh_tokens", ["user_id"]),
+    ("ix_revoked_tokens_user_id", "revoked_tokens", ["user_id"]),
+    ("ix_transfers_from_wallet_id", "transfers", ["from_wallet_id"]),
+    ("ix_transfers_to_wallet_id", "transfers", ["to_wallet_id"]),
+]
+
+
+async def upgrade(conn: AsyncConnection):
+    for name, table, columns in INDEXES:
+        await create_index(conn, name, table, columns)
@@ -0,0 +1,44 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+transactional = False
+
+BATCH_SIZE = 10_000
+
+
+async def upgrade(conn: AsyncConnection):
+    # merchant_id of transactions made before it existed, in short batches by
+    # id so no row stays locked for long. Each batch adds the rows it fills
+    # in to the revenue rollups in the same statement, so a batch that runs
+    # again after a failure finds nothing left to add, and purchases made
+    # meanwhile, which roll themselves up, are not counted twice.
+    result = await conn.execute(text("SELECT min(id), max(id) FROM transactions"))
+    first, last = result.one()
+    if first is None:
+        return
+
+    for start in range(first, last + 1, BATCH_SIZE):
+        await conn.execute(
+            text(
+                "WITH updated AS ("
+                "UPDATE transactions SET merchant_id = items.merchant_id FROM items "
+                "WHERE transactions.item_id = items.id "
+                "AND transactions.merchant_id IS NULL "
+                "AND transactions.id >= :start AND transactions.id < :end "
+                "RETURNING transactions.merchant_id, transactions.item_id, "
+                "transactions.created_at::date AS day, "
+                "transactions.quantity, transactions.balance"
+                ") "
+                "INSERT INTO revenue_rollups "
+                "(merchant_id, item_id, day, count, quantity, revenue) "
+                "SELECT merchant_id, item_id, day, count(*), sum(quantity), sum(balance) "
+                "FROM updated WHERE merchant_id IS NOT NULL "
+                "GROUP BY merchant_id, item_id, day "
+                "ORDER BY merchant_id, item_id, day "
+                "ON CONFLICT (merchant_id, item_id, day) DO UPDATE SET "
+                "count = revenue_rollups.count + excluded.count, "
+                "quantity = revenue_rollups.quantity + excluded.quantity, "
+                "revenue = revenue_rollups.revenue + excluded.revenue"
+            ),
+            dict(start=start, end=start + BATCH_SIZE),
+        )
@@ -0,0 +1,15 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+transactional = True
+
+
+async def upgrade(conn: AsyncConnection):
+    # now() is stored once as the default of existing rows, no table rewrite
+    for table in ["items", "merchants"]:
+        await conn.execute(
+            text(
+                f"ALTER TABLE {table} ADD COLUMN "
+                "updated_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now()"
+            )
+        )
@@ -0,0 +1,10 @@
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from . import create_index
+
+transactional = False
+
+
+async def upgrade(conn: AsyncConnection):
+    # every worker polls recently revoked tokens
+    await create_index(conn, "ix_revoked_tokens_revoked_at", "revoked_tokens", ["revoked_at"])
@@ -0,0 +1,16 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+transactional = True
+
+
+async def upgrade(conn: AsyncConnection):
+    await conn.execute(
+        text(
+            "CREATE TABLE idempotency_steps ("
+            "key VARCHAR NOT NULL, fingerprint VARCHAR NOT NULL, step INTEGER NOT NULL, "
+            "body JSON NOT NULL, "
+            "PRIMARY KEY (key, fingerprint, step), "
+            "FOREIGN KEY (key) REFERENCES idempotency_keys (key) ON DELETE CASCADE)"
+        )
+    )
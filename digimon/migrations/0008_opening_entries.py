@@ -0,0 +1,41 @@
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+transactional = False
+
+BATCH_SIZE = 1000
+
+
+async def upgrade(conn: AsyncConnection):
+    # wallets from before the ledger get an opening entry for the balance
+    # the ledger does not account for, so ledger balances match wallets. A
+    # short batch of wallets is locked at a time; writes to them that
+    # committed before count in both the balance and the entries, the others
+    # wait. Wallets that already agree get nothing, so it can run again.
+    result = await conn.execute(text("SELECT min(id), max(id) FROM wallets"))
+    first, last = result.one()
+    if first is None:
+        return
+
+    for start in range(first, last + 1, BATCH_SIZE):
+        await conn.execute(
+            text(
+                "WITH locked AS ("
+                "SELECT id, balance FROM wallets "
+                "WHERE id >= :start AND id < :end "
+                "AND NOT EXISTS (SELECT 1 FROM ledger_entries "
+                "WHERE ledger_entries.wallet_id = wallets.id AND kind = 'opening') "
+                "ORDER BY id FOR UPDATE"
+                "), opening AS ("
+                "SELECT id, balance "
+                "+ coalesce((SELECT sum(balance) FROM wallet_shards "
+                "WHERE wallet_shards.wallet_id = locked.id), 0) "
+                "- coalesce((SELECT sum(amount) FROM ledger_entries "
+                "WHERE ledger_entries.wallet_id = locked.id), 0) AS amount "
+                "FROM locked"
+                ") "
+                "INSERT INTO ledger_entries (wallet_id, amount, kind) "
+                "SELECT id, amount, 'opening' FROM opening WHERE amount <> 0 ORDER BY id"
+            ),
+            dict(start=start, end=start + BATCH_SIZE),
+        )
@@ -0,0 +1,153 @@
+import importlib
+import pkgutil
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from .. import models
+
+# Versioned schema changes, applied in order by scripts/migrate.py. A module
+# named NNNN_name.py is version NNNN. It defines
+#
+#   transactional: bool
+#   async def upgrade(conn: AsyncConnection)
+#
+# Transactional migrations run in one transaction with the version row,
+# with a short lock_timeout so DDL waiting behind a long transaction fails
+# instead of stalling every query queued behind it. The others run in
+# autocommit, for statements such as CREATE INDEX CONCURRENTLY that can not
+# run inside a transaction and wait for older transactions without blocking
+# anyone. They must be safe to run again after a failure, and run the
+# statements that do block with lock_timeout().
+
+LOCK_KEY = 0x6469_6769  # pg_advisory_lock key, one migrator at a time
+LOCK_TIMEOUT = "5s"
+
+
+def load() -> list[tuple[int, str, object]]:
+    migrations = []
+    for module in pkgutil.iter_modules(__path__):
+        version, _, name = module.name.partition("_")
+        if version.isdigit():
+            migrations.append(
+                (int(version), name, importlib.import_module(f"{__name__}.{module.name}"))
+            )
+    return sorted(migrations, key=lambda migration: migration[0])
+
+
+async def applied(conn: AsyncConnection) -> set[int]:
+    await conn.execute(
+        text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "name VARCHAR NOT NULL, "
+            "applied_at TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT now())"
+        )
+    )
+    result = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return set(result.scalars().all())
+
+
+async def record(conn: AsyncConnection, version: int, name: str):
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+        dict(version=version, name=name),
+    )
+
+
+async def migrate(engine: AsyncEngine) -> list[str]:
+    if engine.dialect.name != "postgresql":
+        # the migrations are postgresql only, elsewhere the models are the schema
+        async with engine.begin() as conn:
+            await conn.run_sync(models.SQLModel.metadata.create_all)
+        return []
+
+    done = []
+    async with engine.connect() as lock:
+        lock = await lock.execution_options(isolation_level="AUTOCOMMIT")
+        await lock.execute(text("SELECT pg_advisory_lock(:key)"), dict(key=LOCK_KEY))
+        try:
+            versions = await applied(lock)
+            for version, name, module in load():
+                if version in versions:
+                    continue
+
+                if module.transactional:
+                    async with engine.begin() as conn:
+                        await conn.execute(text(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}'"))
+                        await module.upgrade(conn)
+                        await record(conn, version, name)
+                else:
+                    async with engine.connect() as conn:
+                        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                        await module.upgrade(conn)
+                        await record(conn, version, name)
+                done.append(f"{version:04}_{name}")
+        finally:
+            await lock.execute(text("SELECT pg_advisory_unlock(:key)"), dict(key=LOCK_KEY))
+    return done
+
+
+async def lock_timeout(conn: AsyncConnection, statement: str):
+    # for a statement that takes a lock blocking other queries in autocommit
+    await conn.execute(text(f"SET lock_timeout = '{LOCK_TIMEOUT}'"))
+    try:
+        await conn.execute(text(statement))
+    finally:
+        await conn.execute(text("RESET lock_timeout"))
+
+
+async def drop_invalid_index(conn: AsyncConnection, name: str):
+    # a failed concurrent build leaves an invalid index behind
+    result = await conn.execute(
+        text(
+            "SELECT 1 FROM pg_index "
+            "WHERE indexrelid = to_regclass(:name) AND NOT indisvalid"
+        ),
+        dict(name=name),
+    )
+    if result.first() is not None:
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY {name}"))
+
+
+async def create_index(
+    conn: AsyncConnection, name: str, table: str, columns: list[str], unique: bool = False
+):
+    # builds the index without blocking writes. A partitioned table can not
+    # be indexed concurrently, so its index is created on the parent only and
+    # every partition's index is built concurrently and attached to it.
+    unique = "UNIQUE " if unique else ""
+    columns = ", ".join(columns)
+
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:table)"),
+        dict(table=table),
+    )
+    if result.scalar_one() != "p":
+        await drop_invalid_index(conn, name)
+        await conn.execute(
+            text(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+        )
+        return
+
+    await lock_timeout(conn, f"CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY {table} ({columns})")
+    result = await conn.execute(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass(:table) "
+            "AND NOT EXISTS ("
+            "SELECT 1 FROM pg_inherits attached "
+            "JOIN pg_index ON pg_index.indexrelid = attached.inhrelid "
+            "WHERE attached.inhparent = to_regclass(:name) "
+            "AND pg_index.indrelid = child.oid)"
+        ),
+        dict(table=table, name=name),
+    )
+    for (partition,) in result.all():
+        index = f"{partition}_{name}"
+        await drop_invalid_index(conn, index)
+        await conn.execute(
+            text(f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {index} ON {partition} ({columns})")
+        )
+        await lock_timeout(conn, f"ALTER INDEX {name} ATTACH PARTITION {index}")
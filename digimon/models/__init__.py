@@ -1,6 +1,9 @@
+import time
 from typing import AsyncIterator
 from sqlmodel import Field, SQLModel, create_engine, Session, select
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlmodel.ext.asyncio.session import AsyncSession
 from sqlalchemy.ext.asyncio import create_async_engine
 
@@ -11,19 +14,67 @@ from .exchange_model import *
 from .transaction_model import *
 from .wallet_model import *
 from .merchant_model import *
+from .token_model import *
+from .revocation_model import *
+from .ledger_model import *
+from .idempotency_model import *
+from .transfer_model import *
+from .report_model import *
 
 connect_args = {}
 
 engine = None
+session_factory = None
+
+
+class TimedAsyncQueuePool(AsyncAdaptedQueuePool):
+    # records how long requests wait for a connection, the main signal
+    # for sizing the pool of a worker
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_count = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.wait_count = self.wait_count
+        pool.wait_time = self.wait_time
+        pool.max_wait_time = self.max_wait_time
+        return pool
+
 
 def init_db(settings):
-    global engine
+    global engine, session_factory
+
+    args = dict(connect_args)
+    if make_url(settings.SQLDB_URL).get_driver_name() == "asyncpg":
+        args["prepared_statement_cache_size"] = settings.DB_STATEMENT_CACHE_SIZE
 
     engine = create_async_engine(
         settings.SQLDB_URL,
         future=True,
-        connect_args=connect_args,
+        connect_args=args,
+        poolclass=TimedAsyncQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
     )
+    session_factory = sessionmaker(
+        engine,
+        class_=AsyncSession, expire_on_commit=False)
 
 async def create_all():
     async with engine.begin() as conn:
@@ -36,14 +87,24 @@ async def recreate_table():
 
 
 async def get_session() -> AsyncIterator[AsyncSession]: 
-    async_session = sessionmaker(
-        engine, 
-        class_=AsyncSession, expire_on_commit=False)
-    async with async_session() as session:
+    async with session_factory() as session:
         yield session
 
+def pool_status() -> dict:
+    pool = engine.pool
+    return dict(
+        size=pool.size(),
+        checked_in=pool.checkedin(),
+        checked_out=pool.checkedout(),
+        overflow=pool.overflow(),
+        wait_count=pool.wait_count,
+        wait_time=pool.wait_time,
+        avg_wait_time=pool.wait_time / pool.wait_count if pool.wait_count else 0.0,
+        max_wait_time=pool.max_wait_time,
+    )
+
 async def close_session():
     global engine
     if engine is None:
         raise Exception("DatabaseSessionManager is not initialized")
-    await engine.dispose()
\ No newline at end of file
+    await engine.dispose()
@@ -1,3 +1,4 @@
+import pydantic
 from pydantic import BaseModel, ConfigDict
 from enum import Enum
 
@@ -8,11 +9,24 @@ class Currency(str, Enum):
     JPY = "JPY"
 
 class BaseExchange(BaseModel):
-    amount: float
+    amount: float = pydantic.Field(gt=0)
     from_currency: Currency
     to_currency: Currency
 
 
+class QuoteRequest(BaseModel):
+    # plain codes, they are mapped to rate indexes in one numpy pass
+    model_config = ConfigDict(use_enum_values=True)
+
+    amounts: list[float]
+    from_currencies: list[Currency]
+    to_currencies: list[Currency]
+
+
+class ItemQuoteRequest(BaseModel):
+    item_ids: list[int]
+
+
 EXCHANGE_RATES = {
     "USD": 34.99,
     "CNY": 4.88,
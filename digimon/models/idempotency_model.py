@@ -0,0 +1,34 @@
+import datetime
+
+from sqlalchemy import Column, ForeignKey, String
+from sqlmodel import Field, JSON, SQLModel
+
+
+class DBIdempotencyKey(SQLModel, table=True):
+    __tablename__ = "idempotency_keys"
+    key: str = Field(primary_key=True)
+    # hash of method, path, query and body, a key is only valid for one request
+    fingerprint: str
+
+    # both are empty while the first request with the key is running
+    status_code: int | None = Field(default=None)
+    body: dict | None = Field(default=None, sa_type=JSON)
+
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    expires_at: datetime.datetime = Field(index=True)
+
+
+class DBIdempotencyStep(SQLModel, table=True):
+    # the result of a part of a request that committed on its own, a retry
+    # of the request skips the parts it finds here
+    __tablename__ = "idempotency_steps"
+    key: str = Field(
+        sa_column=Column(
+            String,
+            ForeignKey("idempotency_keys.key", ondelete="CASCADE"),
+            primary_key=True,
+        )
+    )
+    fingerprint: str = Field(primary_key=True)
+    step: int = Field(primary_key=True)
+    body: list | dict = Field(sa_type=JSON)
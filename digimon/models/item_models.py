@@ -1,5 +1,8 @@
+import datetime
+from enum import Enum
 from typing import Optional, TYPE_CHECKING
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import Index, func
 from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
 from . import users
 
@@ -31,19 +34,37 @@ class Item(BaseItem):
 
 class DBItem(Item, SQLModel, table=True):
     __tablename__ = "items"
+    # the sort orders of the item list, ending with id like its cursor
+    __table_args__ = (
+        Index("ix_items_name_id", "name", "id"),
+        Index("ix_items_price_id", "price", "id"),
+    )
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id")
+    merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id", index=True)
     merchant: Optional["DBMerchant"] = Relationship(back_populates="items")
 
     transactions: list["DBTransaction"] = Relationship(back_populates="item")
 
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: users.DBUser | None = Relationship()
 
+    # set again by every update through the ORM, list pages are versioned by it
+    updated_at: datetime.datetime = Field(
+        default=None,
+        sa_column_kwargs={"server_default": func.now(), "onupdate": func.now()},
+    )
+
+class ItemSort(str, Enum):
+    id = "id"
+    name = "name"
+    price = "price"
+
+
 class ItemList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     items: list[Item]
-    page: int
-    page_count: int
-    size_per_page: int
\ No newline at end of file
+    page: int | None
+    page_count: int | None
+    size_per_page: int
+    next_cursor: str | None = None
\ No newline at end of file
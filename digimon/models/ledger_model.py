@@ -0,0 +1,58 @@
+import datetime
+from enum import Enum
+
+from pydantic import BaseModel
+from sqlalchemy import BigInteger, Column, ForeignKey, Index, Integer, func
+from sqlmodel import Field, SQLModel
+
+
+class LedgerKind(str, Enum):
+    opening = "opening"
+    deposit = "deposit"
+    withdraw = "withdraw"
+    purchase = "purchase"
+    exchange = "exchange"
+    adjustment = "adjustment"
+    transfer = "transfer"
+    payout = "payout"
+
+
+class DBLedgerEntry(SQLModel, table=True):
+    # append only, every change of a wallet balance is one signed entry
+    __tablename__ = "ledger_entries"
+    __table_args__ = (Index("ix_ledger_entries_wallet_id_id", "wallet_id", "id"),)
+    id: int | None = Field(default=None, sa_column=Column(BigInteger, primary_key=True))
+
+    wallet_id: int = Field(
+        sa_column=Column(Integer, ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    )
+    amount: float
+    kind: str
+    transaction_id: int | None = Field(default=None)
+    transfer_id: int | None = Field(default=None)
+    created_at: datetime.datetime = Field(
+        default=None, sa_column_kwargs={"server_default": func.now()}
+    )
+
+
+class DBBalanceSnapshot(SQLModel, table=True):
+    # the balance after every entry of the wallet up to entry_id, created_at is
+    # the time of that last entry so as-of queries can start from it
+    __tablename__ = "balance_snapshots"
+    __table_args__ = (
+        Index("ix_balance_snapshots_wallet_id_entry_id", "wallet_id", "entry_id"),
+    )
+    id: int | None = Field(default=None, primary_key=True)
+
+    wallet_id: int = Field(
+        sa_column=Column(Integer, ForeignKey("wallets.id", ondelete="CASCADE"), nullable=False)
+    )
+    entry_id: int = Field(sa_column=Column(BigInteger, nullable=False))
+    balance: float
+    created_at: datetime.datetime
+
+
+class WalletBalance(BaseModel):
+    wallet_id: int
+    balance: float
+    as_of: datetime.datetime | None = None
@@ -1,5 +1,8 @@
+import datetime
+from enum import Enum
 from typing import Optional, TYPE_CHECKING
 from pydantic import BaseModel, ConfigDict
+from sqlalchemy import func
 from sqlmodel import Field, SQLModel, create_engine, Session, select, Relationship
 from . import users
 class BaseMerchant(BaseModel):
@@ -23,7 +26,7 @@ class DBMerchant(Merchant, SQLModel, table=True):
     __tablename__ = "merchants"
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    user_id: int = Field(default=None, foreign_key="users.id")
+    user_id: int = Field(default=None, foreign_key="users.id", index=True)
     user: users.DBUser | None = Relationship()
 
     items: list["DBItem"] = Relationship(back_populates="merchant", cascade_delete=True)
@@ -31,13 +34,24 @@ class DBMerchant(Merchant, SQLModel, table=True):
         back_populates="merchant", cascade_delete=True
     )
 
+    # set again by every update through the ORM, list pages are versioned by it
+    updated_at: datetime.datetime = Field(
+        default=None,
+        sa_column_kwargs={"server_default": func.now(), "onupdate": func.now()},
+    )
+
+class MerchantSort(str, Enum):
+    id = "id"
+    name = "name"
+
 class MerchantList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     merchants: list[Merchant]
-    page: int
+    page: int | None
     page_size: int
     size_per_page: int
+    next_cursor: str | None = None
 
 if TYPE_CHECKING:
     from .item_models import DBItem
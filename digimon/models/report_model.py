@@ -0,0 +1,54 @@
+import datetime
+
+from pydantic import BaseModel
+from sqlmodel import Field, SQLModel
+
+
+class DBRevenueRollup(SQLModel, table=True):
+    # one row per merchant, item and day, kept current by every purchase
+    __tablename__ = "revenue_rollups"
+    merchant_id: int = Field(primary_key=True)
+    item_id: int = Field(primary_key=True)
+    day: datetime.date = Field(primary_key=True)
+
+    count: int = 0
+    quantity: int = 0
+    revenue: float = 0.0
+
+
+class RevenueRow(BaseModel):
+    count: int
+    quantity: int
+    revenue: float
+
+
+class DailyRevenue(RevenueRow):
+    day: datetime.date
+
+
+class ItemRevenue(RevenueRow):
+    item_id: int
+
+
+class DailyRevenueReport(BaseModel):
+    merchant_id: int
+    start: datetime.date | None
+    end: datetime.date | None
+    days: list[DailyRevenue]
+
+
+class ItemRevenueReport(BaseModel):
+    merchant_id: int
+    start: datetime.date | None
+    end: datetime.date | None
+    items: list[ItemRevenue]
+
+
+class TopItem(BaseModel):
+    item_id: int
+    quantity: int
+
+
+class TopItems(BaseModel):
+    merchant_id: int
+    items: list[TopItem]
@@ -0,0 +1,18 @@
+import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class DBRevokedToken(SQLModel, table=True):
+    __tablename__ = "revoked_tokens"
+    id: int | None = Field(default=None, primary_key=True)
+
+    # either a single token (jti) or every token of the user issued
+    # before the given generation
+    jti: str | None = Field(default=None)
+    generation: int | None = Field(default=None)
+
+    user_id: int = Field(foreign_key="users.id", index=True)
+
+    revoked_at: datetime.datetime = Field(default_factory=datetime.datetime.now, index=True)
+    expires_at: datetime.datetime
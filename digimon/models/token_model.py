@@ -0,0 +1,16 @@
+import datetime
+
+from sqlmodel import Field, SQLModel
+
+
+class DBRefreshToken(SQLModel, table=True):
+    __tablename__ = "refresh_tokens"
+    jti: str = Field(primary_key=True)
+    family: str = Field(index=True)
+
+    user_id: int = Field(foreign_key="users.id", index=True)
+
+    issued_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    expires_at: datetime.datetime
+    used_at: datetime.datetime | None = Field(default=None)
+    revoked: bool = Field(default=False)
@@ -1,10 +1,14 @@
+import datetime
 from typing import Optional
+from enum import Enum
+
+import pydantic
 from pydantic import BaseModel, ConfigDict
 from sqlmodel import Field, Relationship, SQLModel
 
 from .item_models import DBItem
 from .wallet_model import DBWallet
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, DDL, Index, event, func
 from sqlalchemy.orm import relationship
 
 
@@ -14,7 +18,7 @@ class BaseTransaction(BaseModel):
 
 
 class CreatedTransaction(BaseTransaction):
-    pass
+    quantity: int = pydantic.Field(default=1, gt=0)
 
 
 class UpdatedTransaction(BaseTransaction):
@@ -25,19 +29,77 @@ class Transaction(BaseTransaction):
     id: int
 
 class DBTransaction(Transaction, SQLModel, table=True):
+    # partitioned by month on postgresql, closed months are moved to
+    # archive files by digimon.partitions. Other databases get a plain table.
     __tablename__ = "transactions"
-    id: Optional[int] = Field(default=None, primary_key=True)
+    __table_args__ = (
+        Index("ix_transactions_wallet_id_id", "wallet_id", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    id: Optional[int] = Field(
+        default=None, primary_key=True, sa_column_kwargs={"autoincrement": True}
+    )
     balance: float = Field(default=0.0)  # Add this line
 
     wallet_id: Optional[int] = Field(default=None, foreign_key="wallets.id")
     wallet: Optional[DBWallet] = Relationship(back_populates="transactions")
 
-    item_id: Optional[int] = Field(default=None, foreign_key="items.id")
+    item_id: Optional[int] = Field(default=None, foreign_key="items.id", index=True)
     item: Optional[DBItem] = Relationship(back_populates="transactions")
-    
+
+    # copied from the item for reporting; no foreign key, so inserts do not
+    # take share locks on a popular merchant's row
+    merchant_id: Optional[int] = Field(default=None)
+    # part of the primary key because every unique index of a partitioned
+    # table has to include the partition key
+    created_at: datetime.datetime = Field(
+        default=None, primary_key=True, sa_column_kwargs={"server_default": func.now()}
+    )
+
+
+# rows outside every monthly partition land here until their month gets one
+event.listen(
+    DBTransaction.__table__,
+    "after_create",
+    DDL("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT").execute_if(
+        dialect="postgresql"
+    ),
+)
+
+
+class ExportFormat(str, Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
 class TransactionList(BaseModel):
     model_config = ConfigDict(from_attributes=True)
     transactions: list[Transaction]
-    page: int
+    page: int | None
     page_size: int
-    size_per_page: int
\ No newline at end of file
+    size_per_page: int
+    next_cursor: str | None = None
+
+
+class CheckoutLine(BaseModel):
+    item_id: int
+    quantity: int = pydantic.Field(default=1, gt=0)
+
+
+class Checkout(BaseModel):
+    lines: list[CheckoutLine] = pydantic.Field(min_length=1)
+
+
+class CheckoutLineResult(BaseModel):
+    item_id: int
+    quantity: int
+    status: str
+    amount: float | None = None
+    transaction_id: int | None = None
+
+
+class CheckoutResult(BaseModel):
+    wallet_id: int
+    total: float
+    balance: float
+    lines: list[CheckoutLineResult]
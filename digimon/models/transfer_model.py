@@ -0,0 +1,55 @@
+import datetime
+from typing import Optional
+
+import pydantic
+from pydantic import BaseModel, ConfigDict
+from sqlmodel import Field, SQLModel
+
+
+class BaseTransfer(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    from_wallet_id: int
+    to_wallet_id: int
+    amount: float = pydantic.Field(gt=0)
+
+    @pydantic.model_validator(mode="after")
+    def check_wallets(self):
+        if self.from_wallet_id == self.to_wallet_id:
+            raise ValueError("from_wallet_id and to_wallet_id are the same")
+        return self
+
+
+class CreatedTransfer(BaseTransfer):
+    pass
+
+
+class Transfer(BaseTransfer):
+    id: int
+
+
+class DBTransfer(SQLModel, table=True):
+    __tablename__ = "transfers"
+    id: Optional[int] = Field(default=None, primary_key=True)
+
+    from_wallet_id: int = Field(foreign_key="wallets.id", ondelete="CASCADE", index=True)
+    to_wallet_id: int = Field(foreign_key="wallets.id", ondelete="CASCADE", index=True)
+    amount: float
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class BulkTransfer(BaseModel):
+    transfers: list[CreatedTransfer] = pydantic.Field(min_length=1, max_length=1000)
+
+
+class TransferResult(BaseModel):
+    from_wallet_id: int
+    to_wallet_id: int
+    amount: float
+    # ok, not_found or insufficient_funds
+    status: str
+    transfer_id: int | None = None
+
+
+class BulkTransferResult(BaseModel):
+    transfers: list[TransferResult]
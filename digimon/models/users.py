@@ -1,11 +1,10 @@
 import datetime
 import pydantic
 from pydantic import BaseModel, EmailStr, ConfigDict
-from sqlmodel import  SQLModel, Field
+from sqlalchemy import Index
+from sqlmodel import  SQLModel, Field, JSON
 
-from passlib.context import CryptContext
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from ..hashing import hasher
 
 
 class BaseUser(BaseModel):
@@ -57,11 +56,22 @@ class RegisteredUser(BaseUser):
     password: str = pydantic.Field(example="password")
 
 
-class UpdatedUser(BaseUser):
-    roles: list[str]
+class UpdatedUser(BaseModel):
+    # only the fields that were sent are changed, roles and status are not
+    # part of it and only change through UpdatedAccess
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+    email: str | None = pydantic.Field(example="admin@email.local", default=None)
+    username: str | None = pydantic.Field(example="admin", default=None)
+    first_name: str | None = pydantic.Field(example="Firstname", default=None)
+    last_name: str | None = pydantic.Field(example="Lastname", default=None)
     verify_password: str
 
 
+class UpdatedAccess(BaseModel):
+    roles: list[str] | None = pydantic.Field(example=["user"], default=None)
+    status: str | None = pydantic.Field(example="active", default=None)
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str
@@ -74,6 +84,9 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     user_id: int
+    status: str = "active"
+    roles: list[str] = []
+    permissions: int = 0
 
 
 class ChangedPasswordUser(BaseModel):
@@ -83,10 +96,19 @@ class ChangedPasswordUser(BaseModel):
 
 class DBUser(BaseUser, SQLModel, table=True):
     __tablename__ = "users"
+    # login looks users up by either
+    __table_args__ = (
+        Index("ix_users_username", "username"),
+        Index("ix_users_email", "email"),
+    )
     id: int | None = Field(default=None, primary_key=True)
 
     password: str
 
+    status: str = Field(default="active")
+    roles: list[str] = Field(default_factory=lambda: ["user"], sa_type=JSON)
+    token_generation: int = Field(default=0)
+
     register_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     updated_date: datetime.datetime = Field(default_factory=datetime.datetime.now)
     last_login_date: datetime.datetime | None = Field(default=None)
@@ -98,11 +120,17 @@ class DBUser(BaseUser, SQLModel, table=True):
         return False
 
     async def set_password(self, plain_password):
-        self.password = pwd_context.hash(plain_password)
+        self.password = await hasher.hash(plain_password)
 
     async def verify_password(self, plain_password):
-        print(plain_password, self.password)
-        return pwd_context.verify(plain_password, self.password)
+        verified, new_password = await hasher.verify_and_update(
+            plain_password, self.password
+        )
+        if verified and new_password:
+            # stored hash used an outdated cost, the caller commits the new one
+            self.password = new_password
+        return verified
 
     async def is_use_citizen_id_as_password(self):
-        return pwd_context.verify(self.citizen_id, self.password)
+        verified, _ = await hasher.verify_and_update(self.citizen_id, self.password)
+        return verified
@@ -1,4 +1,5 @@
 from typing import Optional, TYPE_CHECKING
+import pydantic
 from pydantic import BaseModel, ConfigDict
 from sqlmodel import Field, Relationship, SQLModel
 
@@ -17,16 +18,63 @@ class UpdatedWallet(BaseWallet):
 
 class Wallet(BaseWallet):
     id: int
+    shard_count: int = 1
+
+class WalletInfo(BaseModel):
+    # a wallet without its balance, which changes too often to be cached
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    merchant_id: int | None = None
+    shard_count: int = 1
 
 class DBWallet(Wallet, SQLModel, table=True):
     __tablename__ = "wallets"
     id: Optional[int] = Field(default=None, primary_key=True)
+    # with more than one shard the balance lives in wallet_shards
+    shard_count: int = Field(default=1, sa_column_kwargs={"server_default": "1"})
 
-    merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id")
+    merchant_id: Optional[int] = Field(default=None, foreign_key="merchants.id", index=True)
     merchant: Optional["DBMerchant"] = Relationship(back_populates="wallet")
 
     transactions: list["DBTransaction"] = Relationship(back_populates="wallet")
 
+
+class Payout(BaseModel):
+    wallet_id: int
+    amount: float = pydantic.Field(gt=0)
+
+
+class BulkPayout(BaseModel):
+    payouts: list[Payout] = pydantic.Field(min_length=1, max_length=100_000)
+
+    @pydantic.field_validator("payouts")
+    @classmethod
+    def check_unique_wallets(cls, payouts: list[Payout]) -> list[Payout]:
+        if len({payout.wallet_id for payout in payouts}) != len(payouts):
+            raise ValueError("a wallet can only be paid out once per batch")
+        return payouts
+
+
+class PayoutResult(BaseModel):
+    wallet_id: int
+    amount: float
+    # ok, not_found, insufficient_funds or failed, when the chunk paying it
+    # out failed after an earlier one was committed
+    status: str
+    balance: float | None = None
+
+
+class BulkPayoutResult(BaseModel):
+    payouts: list[PayoutResult]
+
+
+class DBWalletShard(SQLModel, table=True):
+    __tablename__ = "wallet_shards"
+    wallet_id: int = Field(foreign_key="wallets.id", primary_key=True, ondelete="CASCADE")
+    shard: int = Field(primary_key=True)
+    balance: float = 0.0
+
 if TYPE_CHECKING:
     from .merchant_model import DBMerchant
     from .transaction_model import DBTransaction
\ No newline at end of file
@@ -0,0 +1,79 @@
+import base64
+import binascii
+import json
+import time
+
+from fastapi import HTTPException
+from sqlmodel import func, select, tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+
+settings = config.get_settings()
+
+# upper bound of every page size parameter
+MAX_PAGE_SIZE = 1000
+
+_counts: dict[str, tuple[float, int]] = {}
+
+
+def encode_cursor(columns, values) -> str:
+    data = json.dumps(
+        dict(c=[column.key for column in columns], v=values), separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        keys, values = data["c"], data["v"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    # a cursor is only valid for the sort order it was issued for
+    if keys != [column.key for column in columns] or len(values) != len(columns):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def paginate(statement, columns, size: int, page: int = 1, after: str | None = None):
+    # columns are the sort columns ending with the primary key, so every
+    # row has a unique position and "after" can seek through the index
+    statement = statement.order_by(*columns)
+    if after is not None:
+        values = decode_cursor(after, columns)
+        if len(columns) == 1:
+            statement = statement.where(columns[0] > values[0])
+        else:
+            statement = statement.where(tuple_(*columns) > tuple_(*values))
+    else:
+        statement = statement.offset((page - 1) * size)
+
+    # one extra row tells whether there is a next page
+    return statement.limit(size + 1)
+
+
+def next_page(rows, columns, size: int):
+    if len(rows) <= size:
+        return rows, None
+
+    rows = rows[:size]
+    last = rows[-1]
+    return rows, encode_cursor(
+        columns, [getattr(last, column.key) for column in columns]
+    )
+
+
+async def cached_count(session: AsyncSession, model) -> int:
+    # full COUNT(*) is linear in the table size, a short lived cache keeps
+    # page_count cheap for clients that poll the first pages
+    key = model.__tablename__
+    now = time.monotonic()
+    cached = _counts.get(key)
+    if cached and now - cached[0] < settings.PAGE_COUNT_CACHE_SECONDS:
+        return cached[1]
+
+    count = (await session.exec(select(func.count()).select_from(model))).one()
+    _counts[key] = (now, count)
+    return count
@@ -0,0 +1,193 @@
+import asyncio
+import contextlib
+import datetime
+import os
+
+from sqlalchemy import text
+
+from . import archive
+from . import config
+from . import models
+
+settings = config.get_settings()
+
+ARCHIVE_CHUNK_SIZE = 65_536
+LOCK_KEY = 0x6469_6761  # pg_advisory_lock key, one archiver at a time
+
+# transactions is range partitioned by created_at, one partition per month
+# named transactions_YYYY_MM. The archiver keeps partitions ready for the
+# coming months and moves months older than TRANSACTION_HOT_MONTHS to
+# archive files, so the table and its indexes only ever hold recent months.
+# Every worker runs the archiver, the one holding the advisory lock does the
+# work and the others skip the round. Without postgresql the table is not
+# partitioned and nothing is archived.
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    months += month.year * 12 + month.month - 1
+    return datetime.date(months // 12, months % 12 + 1, 1)
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"transactions_{month:%Y_%m}"
+
+
+async def create_partition(session: models.AsyncSession, month: datetime.date) -> bool:
+    name = partition_name(month)
+    result = await session.exec(text("SELECT to_regclass(:name)"), params=dict(name=name))
+    if result.scalar_one() is not None:
+        return False
+
+    # rows of the month that already sit in the default partition move into
+    # the new one, attaching checks that none are left behind
+    start, end = month, add_months(month, 1)
+    await session.exec(text(f"CREATE TABLE {name} (LIKE transactions INCLUDING DEFAULTS)"))
+    await session.exec(
+        text(
+            "WITH moved AS ("
+            "DELETE FROM transactions_default "
+            "WHERE created_at >= :start AND created_at < :end RETURNING *"
+            f") INSERT INTO {name} SELECT * FROM moved"
+        ),
+        params=dict(start=start, end=end),
+    )
+    await session.exec(
+        text(
+            f"ALTER TABLE transactions ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+    )
+    await session.commit()
+    return True
+
+
+async def get_partitions(session: models.AsyncSession) -> dict[datetime.date, str]:
+    result = await session.exec(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = 'transactions'::regclass"
+        )
+    )
+    partitions = {}
+    for (name,) in result.all():
+        with contextlib.suppress(ValueError):
+            month = datetime.datetime.strptime(name, "transactions_%Y_%m").date()
+            partitions[month] = name
+    return partitions
+
+
+async def archive_partition(
+    session: models.AsyncSession, name: str, archives: archive.ArchiveSet
+) -> str:
+    # compression and file writes run in a thread, off the event loop
+    loop = asyncio.get_running_loop()
+    os.makedirs(archives.directory, exist_ok=True)
+    path = archives.path(name)
+    writer = await loop.run_in_executor(None, archive.ArchiveWriter, path)
+    columns = ", ".join(archive.COLUMNS)
+    result = await session.stream(
+        text(
+            f"SELECT {columns} FROM {name} ORDER BY wallet_id NULLS FIRST, id"
+        ).execution_options(yield_per=ARCHIVE_CHUNK_SIZE)
+    )
+    async for rows in result.partitions():
+        await loop.run_in_executor(None, writer.write, rows)
+    # the cursor keeps the partition in use until its transaction ends
+    await session.commit()
+    await loop.run_in_executor(None, writer.close)
+
+    # the file is complete before the rows go. A crash in between leaves
+    # both, and the next run writes the file again and drops the partition.
+    await session.exec(text(f"ALTER TABLE transactions DETACH PARTITION {name}"))
+    await session.exec(text(f"DROP TABLE {name}"))
+    await session.commit()
+    return path
+
+
+class Archiver:
+    def __init__(
+        self,
+        interval: float,
+        hot_months: int,
+        months_ahead: int,
+        archives: archive.ArchiveSet,
+    ):
+        self.interval = interval
+        self.hot_months = hot_months
+        self.months_ahead = months_ahead
+        self.archives = archives
+        self.task = None
+
+    async def run_once(self, today: datetime.date | None = None) -> list[str]:
+        try:
+            return await self.archive_locked(today)
+        finally:
+            # every worker picks up the files written by the one holding the
+            # lock, this round or an earlier one
+            await asyncio.get_running_loop().run_in_executor(None, self.archives.refresh)
+
+    async def archive_locked(self, today: datetime.date | None = None) -> list[str]:
+        # held on its own connection, since archiving a month commits more
+        # than once
+        async with models.engine.connect() as lock:
+            lock = await lock.execution_options(isolation_level="AUTOCOMMIT")
+            result = await lock.execute(
+                text("SELECT pg_try_advisory_lock(:key)"), dict(key=LOCK_KEY)
+            )
+            if not result.scalar_one():
+                return []
+            try:
+                return await self.archive(today)
+            finally:
+                await lock.execute(text("SELECT pg_advisory_unlock(:key)"), dict(key=LOCK_KEY))
+
+    async def archive(self, today: datetime.date | None = None) -> list[str]:
+        current = (today or datetime.date.today()).replace(day=1)
+        async with models.session_factory() as session:
+            # months that only have rows in the default partition get their
+            # own partition first, so they can be archived like the others
+            result = await session.exec(
+                text(
+                    "SELECT DISTINCT date_trunc('month', created_at)::date "
+                    "FROM transactions_default"
+                )
+            )
+            months = set(result.scalars().all())
+            months.update(add_months(current, i) for i in range(self.months_ahead + 1))
+            for month in sorted(months):
+                await create_partition(session, month)
+
+            archived = []
+            oldest = add_months(current, 1 - self.hot_months)
+            for month, name in sorted((await get_partitions(session)).items()):
+                if month < oldest:
+                    archived.append(await archive_partition(session, name, self.archives))
+        return archived
+
+    async def run(self):
+        # the first round runs right away, without holding up startup
+        while True:
+            with contextlib.suppress(Exception):
+                await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        if models.engine.dialect.name != "postgresql":
+            return
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+
+archiver = Archiver(
+    interval=settings.TRANSACTION_ARCHIVE_SECONDS,
+    hot_months=settings.TRANSACTION_HOT_MONTHS,
+    months_ahead=settings.TRANSACTION_PARTITION_MONTHS_AHEAD,
+    archives=archive.archives,
+)
@@ -0,0 +1,171 @@
+from sqlalchemy import ARRAY, Float, Integer, column, func, literal, select, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import config
+from . import idempotency
+from . import ledger
+from . import models
+from . import wallets
+from .models.ledger_model import LedgerKind
+from .models.wallet_model import DBWallet, Payout, PayoutResult
+
+settings = config.get_settings()
+
+
+def build_payout_statement(payouts: list[Payout]):
+    # one UPDATE for the whole chunk, rows without the funds are left alone
+    # and reported by their absence from RETURNING. The rows come in as two
+    # arrays rather than a VALUES list, so the statement has two parameters
+    # and compiles once instead of once per chunk.
+    rows = (
+        func.unnest(
+            literal([payout.wallet_id for payout in payouts], ARRAY(Integer)),
+            literal([payout.amount for payout in payouts], ARRAY(Float)),
+        )
+        .table_valued(column("wallet_id", Integer), column("amount", Float))
+        .render_derived(name="payouts")
+    )
+    return (
+        update(DBWallet)
+        .where(
+            DBWallet.id == rows.c.wallet_id,
+            DBWallet.shard_count == 1,
+            DBWallet.balance >= rows.c.amount,
+        )
+        .values(balance=DBWallet.balance - rows.c.amount)
+        .returning(DBWallet.id, DBWallet.balance)
+    )
+
+
+async def lock_wallets(session: AsyncSession, wallet_ids: list[int]):
+    # the lock order of transfers: wallet by wallet in id order, each wallets
+    # row before its shards, so payouts and transfers can not deadlock. Runs
+    # of unsharded wallets between two sharded ones are locked by one query.
+    result = await session.exec(
+        select(DBWallet.id, DBWallet.shard_count).where(DBWallet.id.in_(wallet_ids))
+    )
+    known = dict(result.all())
+
+    shard_counts = {}
+    sharded = {}
+    run = []
+    for wallet_id in wallet_ids + [None]:
+        if wallet_id is not None and known.get(wallet_id) == 1:
+            run.append(wallet_id)
+            continue
+        if run:
+            result = await session.exec(
+                select(DBWallet.id, DBWallet.shard_count)
+                .where(DBWallet.id.in_(run))
+                .order_by(DBWallet.id)
+                .with_for_update(key_share=True)
+            )
+            shard_counts.update(result.all())
+            run = []
+        if wallet_id in known:
+            wallet, shards = await wallets.lock(session, wallet_id)
+            if wallet is not None:
+                shard_counts[wallet_id] = wallet.shard_count
+                sharded[wallet_id] = (wallet, shards)
+    return shard_counts, sharded
+
+
+async def pay_out(
+    session: AsyncSession,
+    payouts: list[Payout],
+    idempotent: idempotency.IdempotentRequest | None = None,
+) -> list[PayoutResult]:
+    wallet_ids = sorted(payout.wallet_id for payout in payouts)
+    shard_counts, sharded = await lock_wallets(session, wallet_ids)
+
+    balances = {}
+    unsharded = [
+        payout
+        for payout in payouts
+        if shard_counts.get(payout.wallet_id) == 1 and payout.wallet_id not in sharded
+    ]
+    if unsharded:
+        result = await session.exec(build_payout_statement(unsharded))
+        balances = dict(result.all())
+
+    # sharded wallets are few, their shards are pooled like a transfer does
+    for payout in payouts:
+        if payout.wallet_id in sharded:
+            wallet, shards = sharded[payout.wallet_id]
+            total = wallet.balance + sum(shards)
+            if total >= payout.amount:
+                await wallets.spread(
+                    session, payout.wallet_id, wallet.shard_count, total - payout.amount, len(shards)
+                )
+                balances[payout.wallet_id] = total - payout.amount
+        elif shard_counts.get(payout.wallet_id, 1) > 1:
+            # sharded after its shard count was read, its shards are not locked
+            balance = await wallets.debit(session, payout.wallet_id, payout.amount)
+            if balance is not None:
+                balances[payout.wallet_id] = balance
+
+    results = []
+    for payout in payouts:
+        result = PayoutResult(wallet_id=payout.wallet_id, amount=payout.amount, status="ok")
+        if payout.wallet_id not in shard_counts:
+            result.status = "not_found"
+        elif payout.wallet_id not in balances:
+            result.status = "insufficient_funds"
+        else:
+            result.balance = balances[payout.wallet_id]
+        results.append(result)
+
+    await ledger.record(
+        session,
+        [
+            ledger.entry(result.wallet_id, -result.amount, LedgerKind.payout)
+            for result in results
+            if result.status == "ok"
+        ],
+    )
+    if idempotent is not None:
+        # a chunk is named by its first wallet, which does not depend on the
+        # chunk size
+        await idempotent.record_step(session, wallet_ids[0], results)
+    await session.commit()
+    return results
+
+
+async def run_payouts(
+    payouts: list[Payout], idempotent: idempotency.IdempotentRequest | None = None
+) -> list[PayoutResult]:
+    # every chunk is its own transaction, which bounds lock time and
+    # statement size for very large batches. With an Idempotency-Key every
+    # chunk records its results with it, and a retry only pays out the
+    # wallets no committed chunk has. Without one, a failure after a
+    # committed chunk reports the wallets that were not paid out as failed.
+    results = {}
+    committed = False
+    async with models.session_factory() as session:
+        if idempotent is not None:
+            for body in (await idempotent.steps(session)).values():
+                for result in body:
+                    results[result["wallet_id"]] = PayoutResult(**result)
+            committed = bool(results)
+
+        ordered = sorted(
+            (payout for payout in payouts if payout.wallet_id not in results),
+            key=lambda payout: payout.wallet_id,
+        )
+        try:
+            for i in range(0, len(ordered), settings.PAYOUT_CHUNK_SIZE):
+                chunk = ordered[i : i + settings.PAYOUT_CHUNK_SIZE]
+                for result in await pay_out(session, chunk, idempotent):
+                    results[result.wallet_id] = result
+                committed = True
+        except Exception as error:
+            if not committed:
+                raise
+            if idempotent is not None and idempotent.key is not None:
+                raise idempotency.PartiallyApplied() from error
+            for payout in ordered:
+                if payout.wallet_id not in results:
+                    results[payout.wallet_id] = PayoutResult(
+                        wallet_id=payout.wallet_id, amount=payout.amount, status="failed"
+                    )
+    return [results[payout.wallet_id] for payout in payouts]
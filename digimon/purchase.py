@@ -0,0 +1,256 @@
+from fastapi import HTTPException
+from sqlalchemy import func, insert, literal, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models.item_models import DBItem
+from .models.ledger_model import DBLedgerEntry, LedgerKind
+from .models.report_model import DBRevenueRollup
+from .models.transaction_model import (
+    CheckoutLine,
+    CheckoutLineResult,
+    CheckoutResult,
+    DBTransaction,
+    Transaction,
+)
+from .models.wallet_model import DBWallet
+from . import idempotency
+from . import leaderboard
+from . import ledger
+from . import reports
+from . import wallets
+
+
+def build_purchase_statement(wallet_id: int, item_id: int, quantity: int):
+    # item price lookup, conditional debit, the transaction, its revenue
+    # rollup and its ledger entry run as one statement, so concurrent
+    # purchases on a wallet can not lose updates
+    item = select(DBItem.price, DBItem.merchant_id).where(DBItem.id == item_id).cte("item")
+    amount = item.c.price * quantity
+
+    debit = wallets.build_change(wallet_id, amount, name="debit")
+
+    transaction = (
+        insert(DBTransaction)
+        .from_select(
+            ["quantity", "balance", "wallet_id", "item_id", "merchant_id"],
+            select(
+                literal(quantity),
+                debit.c.amount,
+                literal(wallet_id),
+                literal(item_id),
+                item.c.merchant_id,
+            ).select_from(debit.join(item, literal(True))),
+        )
+        .returning(DBTransaction.id, DBTransaction.balance, DBTransaction.merchant_id)
+        .cte("purchase")
+    )
+
+    rollup = (
+        reports.build_rollup_upsert(
+            select(
+                transaction.c.merchant_id,
+                literal(item_id),
+                func.current_date(),
+                literal(1),
+                literal(quantity),
+                transaction.c.balance,
+            ).where(transaction.c.merchant_id.is_not(None))
+        )
+        .returning(DBRevenueRollup.item_id)
+        .cte("rollup")
+    )
+
+    entry = (
+        insert(DBLedgerEntry)
+        .from_select(
+            ["wallet_id", "amount", "kind", "transaction_id"],
+            select(
+                literal(wallet_id),
+                -transaction.c.balance,
+                literal(LedgerKind.purchase.value),
+                transaction.c.id,
+            ).select_from(transaction.outerjoin(rollup, literal(True))),
+        )
+        .returning(DBLedgerEntry.transaction_id)
+        .cte("entry")
+    )
+    return select(entry.c.transaction_id, transaction.c.merchant_id).select_from(
+        entry.join(transaction, entry.c.transaction_id == transaction.c.id)
+    )
+
+
+async def purchase(
+    session: AsyncSession,
+    wallet_id: int,
+    item_id: int,
+    quantity: int,
+    claim: idempotency.Claim | None = None,
+) -> Transaction:
+    result = await session.exec(
+        build_purchase_statement(wallet_id, item_id, quantity)
+    )
+    row = result.one_or_none()
+
+    if row is None:
+        await session.rollback()
+        row = await purchase_with_rebalance(session, wallet_id, item_id, quantity)
+
+    transaction = Transaction(id=row.transaction_id, quantity=quantity)
+    if claim is not None:
+        await claim.complete(session, transaction)
+    await session.commit()
+    leaderboard.leaderboard.add([(row.merchant_id, item_id, quantity)])
+    return transaction
+
+
+async def purchase_with_rebalance(
+    session: AsyncSession, wallet_id: int, item_id: int, quantity: int
+):
+    # the picked shard of a sharded wallet may be short while the wallet is not
+    result = await session.exec(
+        select(DBItem.price, DBItem.merchant_id).where(DBItem.id == item_id)
+    )
+    price, merchant_id = result.one_or_none() or (None, None)
+    if price is None or await wallets.rebalance(
+        session, wallet_id, price * quantity
+    ) is None:
+        await session.rollback()
+        await raise_purchase_error(session, wallet_id, item_id)
+
+    result = await session.exec(
+        insert(DBTransaction)
+        .values(
+            quantity=quantity,
+            balance=price * quantity,
+            wallet_id=wallet_id,
+            item_id=item_id,
+            merchant_id=merchant_id,
+        )
+        .returning(DBTransaction.id.label("transaction_id"), DBTransaction.merchant_id)
+    )
+    row = result.one()
+    await ledger.record(
+        session,
+        [
+            ledger.entry(
+                wallet_id, -price * quantity, LedgerKind.purchase, row.transaction_id
+            )
+        ],
+    )
+    await reports.record(
+        session, [reports.rollup(merchant_id, item_id, quantity, price * quantity)]
+    )
+    return row
+
+
+async def raise_purchase_error(session: AsyncSession, wallet_id: int, item_id: int):
+    # only reached when the purchase statement did not insert a row
+    wallet = await session.exec(select(DBWallet.id).where(DBWallet.id == wallet_id))
+    item = await session.exec(select(DBItem.id).where(DBItem.id == item_id))
+    if wallet.first() is None or item.first() is None:
+        raise HTTPException(status_code=404, detail="Wallet or Item not found")
+
+    raise HTTPException(status_code=400, detail="Insufficient balance")
+
+
+async def checkout(
+    session: AsyncSession, wallet_id: int, lines: list[CheckoutLine]
+) -> CheckoutResult:
+    # one IN query for prices, one conditional debit and one bulk insert,
+    # committed together so the cart is bought completely or not at all
+    result = await session.exec(
+        select(DBItem.id, DBItem.price, DBItem.merchant_id).where(
+            DBItem.id.in_({line.item_id for line in lines})
+        )
+    )
+    items = {row.id: row for row in result.all()}
+    prices = {item_id: row.price for item_id, row in items.items()}
+
+    line_results = [
+        CheckoutLineResult(
+            item_id=line.item_id,
+            quantity=line.quantity,
+            status="ok" if line.item_id in prices else "not_found",
+            amount=(
+                prices[line.item_id] * line.quantity
+                if line.item_id in prices
+                else None
+            ),
+        )
+        for line in lines
+    ]
+    if any(line.status != "ok" for line in line_results):
+        raise HTTPException(
+            status_code=404,
+            detail=dict(
+                message="Item not found",
+                lines=[line.model_dump() for line in line_results],
+            ),
+        )
+
+    total = sum(line.amount for line in line_results)
+    balance = await wallets.debit(session, wallet_id, total)
+
+    if balance is None:
+        await session.rollback()
+        wallet = await session.exec(
+            select(DBWallet.id).where(DBWallet.id == wallet_id)
+        )
+        if wallet.first() is None:
+            raise HTTPException(status_code=404, detail="Wallet not found")
+
+        for line in line_results:
+            line.status = "rejected"
+        raise HTTPException(
+            status_code=400,
+            detail=dict(
+                message="Insufficient balance",
+                lines=[line.model_dump() for line in line_results],
+            ),
+        )
+
+    result = await session.exec(
+        insert(DBTransaction).returning(
+            DBTransaction.id, sort_by_parameter_order=True
+        ),
+        params=[
+            dict(
+                quantity=line.quantity,
+                balance=line.amount,
+                wallet_id=wallet_id,
+                item_id=line.item_id,
+                merchant_id=items[line.item_id].merchant_id,
+            )
+            for line in line_results
+        ],
+    )
+    for line, transaction_id in zip(line_results, result.scalars()):
+        line.transaction_id = transaction_id
+
+    await ledger.record(
+        session,
+        [
+            ledger.entry(wallet_id, -line.amount, LedgerKind.purchase, line.transaction_id)
+            for line in line_results
+        ],
+    )
+    await reports.record(
+        session,
+        [
+            reports.rollup(
+                items[line.item_id].merchant_id, line.item_id, line.quantity, line.amount
+            )
+            for line in line_results
+        ],
+    )
+    await session.commit()
+
+    leaderboard.leaderboard.add(
+        [
+            (items[line.item_id].merchant_id, line.item_id, line.quantity)
+            for line in line_results
+        ]
+    )
+    return CheckoutResult(
+        wallet_id=wallet_id, total=total, balance=balance, lines=line_results
+    )
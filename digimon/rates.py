@@ -0,0 +1,122 @@
+import asyncio
+import contextlib
+import dataclasses
+import datetime
+import json
+import os
+
+import numpy as np
+
+from . import config
+from .models.exchange_model import EXCHANGE_RATES, Currency
+
+settings = config.get_settings()
+
+CURRENCIES = tuple(Currency)
+CURRENCY_CODES = np.array([currency.value for currency in CURRENCIES])
+CURRENCY_ORDER = np.argsort(CURRENCY_CODES)
+PAIR_INDEX = {
+    (from_currency, to_currency): i * len(CURRENCIES) + j
+    for i, from_currency in enumerate(CURRENCIES)
+    for j, to_currency in enumerate(CURRENCIES)
+}
+
+
+@dataclasses.dataclass(frozen=True)
+class RateSnapshot:
+    version: int
+    # THB per one unit of each currency, in CURRENCIES order
+    thb_rates: tuple[float, ...]
+    # flattened N x N cross rates, units of "to" per one unit of "from"
+    matrix: tuple[float, ...]
+    # the same cross rates as an N x N array for batch conversions
+    array: np.ndarray = dataclasses.field(compare=False)
+    loaded_at: datetime.datetime
+
+    def rate(self, from_currency: Currency, to_currency: Currency) -> float:
+        return self.matrix[PAIR_INDEX[from_currency, to_currency]]
+
+    def convert(self, amounts: np.ndarray, from_indexes: np.ndarray, to_indexes: np.ndarray) -> np.ndarray:
+        return amounts * self.array[from_indexes, to_indexes]
+
+
+def currency_indexes(currencies) -> np.ndarray:
+    # maps currency codes to their position in CURRENCIES in one pass
+    codes = np.asarray(currencies, dtype=CURRENCY_CODES.dtype)
+    positions = np.searchsorted(CURRENCY_CODES, codes, sorter=CURRENCY_ORDER)
+    indexes = CURRENCY_ORDER[np.minimum(positions, len(CURRENCIES) - 1)]
+    if not np.array_equal(CURRENCY_CODES[indexes], codes):
+        raise ValueError("unknown currency")
+    return indexes
+
+
+def build_snapshot(rates: dict, version: int) -> RateSnapshot:
+    thb_rates = tuple(
+        1.0 if currency == Currency.THB else float(rates[currency.value])
+        for currency in CURRENCIES
+    )
+    if any(rate <= 0 for rate in thb_rates):
+        raise ValueError("exchange rates must be positive")
+
+    array = np.array(thb_rates)[:, np.newaxis] / np.array(thb_rates)[np.newaxis, :]
+    array.flags.writeable = False
+
+    return RateSnapshot(
+        version=version,
+        thb_rates=thb_rates,
+        matrix=tuple(array.ravel().tolist()),
+        array=array,
+        loaded_at=datetime.datetime.now(),
+    )
+
+
+class RateProvider:
+    # readers take self.snapshot once and use it for the whole request;
+    # reloads build a new immutable snapshot and swap the reference, so
+    # nothing is ever locked on the conversion path
+    def __init__(self, rates: dict = EXCHANGE_RATES):
+        self.snapshot = build_snapshot(rates, version=1)
+        self.path = settings.EXCHANGE_RATES_FILE
+        self.mtime = None
+        self.task = None
+
+    def load(self, rates: dict) -> RateSnapshot:
+        snapshot = build_snapshot(rates, version=self.snapshot.version + 1)
+        if snapshot.thb_rates != self.snapshot.thb_rates:
+            self.snapshot = snapshot
+        return self.snapshot
+
+    def reload(self) -> RateSnapshot:
+        if not self.path:
+            return self.snapshot
+
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            with open(self.path) as f:
+                self.load(json.load(f))
+            self.mtime = mtime
+        return self.snapshot
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.EXCHANGE_RATES_RELOAD_SECONDS)
+            # a broken file keeps the last good snapshot
+            with contextlib.suppress(Exception):
+                self.reload()
+
+    async def start(self):
+        if not self.path:
+            return
+
+        self.reload()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+
+provider = RateProvider()
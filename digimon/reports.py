@@ -0,0 +1,122 @@
+import datetime
+
+from sqlalchemy import Date, cast, delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from . import models
+from .models.report_model import DBRevenueRollup
+from .models.transaction_model import DBTransaction
+
+# revenue_rollups holds count, quantity and revenue per merchant, item and
+# day. Every purchase adds to its row in the transaction that inserts it, so
+# reports never scan transactions. Items without a merchant are not rolled up.
+
+
+def build_rollup_upsert(rows):
+    # rows is a select or a list of dicts with merchant_id, item_id, day,
+    # count, quantity and revenue
+    statement = pg_insert(DBRevenueRollup)
+    if isinstance(rows, list):
+        statement = statement.values(rows)
+    else:
+        statement = statement.from_select(
+            ["merchant_id", "item_id", "day", "count", "quantity", "revenue"], rows
+        )
+    return statement.on_conflict_do_update(
+        index_elements=[
+            DBRevenueRollup.merchant_id,
+            DBRevenueRollup.item_id,
+            DBRevenueRollup.day,
+        ],
+        set_=dict(
+            count=DBRevenueRollup.count + statement.excluded.count,
+            quantity=DBRevenueRollup.quantity + statement.excluded.quantity,
+            revenue=DBRevenueRollup.revenue + statement.excluded.revenue,
+        ),
+    )
+
+
+def rollup(merchant_id: int | None, item_id: int, quantity: int, revenue: float) -> dict:
+    return dict(
+        merchant_id=merchant_id, item_id=item_id, count=1, quantity=quantity, revenue=revenue
+    )
+
+
+async def record(session: models.AsyncSession, rollups: list[dict]):
+    # one row per key, upserted in key order so two batches touching the same
+    # items lock them in the same order
+    totals = {}
+    for row in rollups:
+        if row["merchant_id"] is None:
+            continue
+        key = (row["merchant_id"], row["item_id"])
+        total = totals.setdefault(key, dict(count=0, quantity=0, revenue=0.0))
+        total["count"] += row["count"]
+        total["quantity"] += row["quantity"]
+        total["revenue"] += row["revenue"]
+
+    if not totals:
+        return
+
+    # the day comes from the database, the clock that stamps created_at
+    await session.exec(
+        build_rollup_upsert(
+            [
+                dict(merchant_id=merchant_id, item_id=item_id, day=func.current_date(), **total)
+                for (merchant_id, item_id), total in sorted(totals.items())
+            ]
+        )
+    )
+
+
+async def rebuild(session: models.AsyncSession):
+    # recomputes the rollups from transactions, for repairs. Months that are
+    # archived are no longer in the table, their rollups are left alone.
+    day = cast(DBTransaction.created_at, Date)
+    result = await session.exec(
+        select(cast(func.date_trunc("month", func.min(DBTransaction.created_at)), Date))
+    )
+    start = result.scalar_one()
+    if start is None:
+        return
+    await session.exec(delete(DBRevenueRollup).where(DBRevenueRollup.day >= start))
+    await session.exec(
+        insert(DBRevenueRollup).from_select(
+            ["merchant_id", "item_id", "day", "count", "quantity", "revenue"],
+            select(
+                DBTransaction.merchant_id,
+                DBTransaction.item_id,
+                day,
+                func.count(),
+                func.sum(DBTransaction.quantity),
+                func.sum(DBTransaction.balance),
+            )
+            .where(DBTransaction.merchant_id.is_not(None), DBTransaction.item_id.is_not(None))
+            .group_by(DBTransaction.merchant_id, DBTransaction.item_id, day),
+        )
+    )
+    await session.commit()
+
+
+def build_report(
+    merchant_id: int,
+    group_by,
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+):
+    statement = (
+        select(
+            group_by,
+            func.sum(DBRevenueRollup.count).label("count"),
+            func.sum(DBRevenueRollup.quantity).label("quantity"),
+            func.sum(DBRevenueRollup.revenue).label("revenue"),
+        )
+        .where(DBRevenueRollup.merchant_id == merchant_id)
+        .group_by(group_by)
+        .order_by(group_by)
+    )
+    if start is not None:
+        statement = statement.where(DBRevenueRollup.day >= start)
+    if end is not None:
+        statement = statement.where(DBRevenueRollup.day <= end)
+    return statement
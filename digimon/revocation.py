@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import datetime
+
+from sqlmodel import select, update
+
+from . import config
+from . import models
+from .models.revocation_model import DBRevokedToken
+
+settings = config.get_settings()
+
+
+def token_key(jti: str):
+    # uuid hex ids are kept as ints, which is about half the memory of str
+    try:
+        return int(jti, 16)
+    except ValueError:
+        return jti
+
+
+class RevocationList:
+    # process local copy of revoked_tokens, checked on every authenticated
+    # request without any I/O and kept current by polling recent rows.
+    #
+    # Rows are polled by revoked_at rather than id: a row with a lower id can
+    # commit after a higher one was seen. Each poll reads back overlap
+    # seconds before the previous one, which has to cover the time between
+    # revoked_at being taken and the commit, plus the clock skew between
+    # workers. Rows read twice are simply added again.
+    def __init__(self, overlap: float = settings.REVOCATION_OVERLAP_SECONDS):
+        self.jtis: set = set()
+        self.expirations: dict[int, list] = {}
+        self.generations: dict[int, int] = {}
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.since: datetime.datetime | None = None
+        self.task = None
+
+    def is_revoked(self, payload: dict) -> bool:
+        jti = payload.get("jti")
+        if jti is not None and token_key(jti) in self.jtis:
+            return True
+        return payload.get("gen", 0) < self.generations.get(payload["sub"], 0)
+
+    def add(self, revoked_token: DBRevokedToken):
+        if revoked_token.jti is not None:
+            key = token_key(revoked_token.jti)
+            if key not in self.jtis:
+                self.jtis.add(key)
+                # bucketed by the hour of expiry, so pruning drops whole lists
+                self.expirations.setdefault(
+                    int(revoked_token.expires_at.timestamp()) // 3600 + 1, []
+                ).append(key)
+        if revoked_token.generation is not None:
+            self.generations[revoked_token.user_id] = max(
+                self.generations.get(revoked_token.user_id, 0),
+                revoked_token.generation,
+            )
+
+    def prune(self):
+        # expired tokens fail signature validation anyway
+        hour = int(datetime.datetime.now().timestamp()) // 3600
+        for bucket in [bucket for bucket in self.expirations if bucket <= hour]:
+            self.jtis.difference_update(self.expirations.pop(bucket))
+
+    async def refresh(self):
+        started = datetime.datetime.now()
+        statement = select(DBRevokedToken).where(DBRevokedToken.expires_at > started)
+        if self.since is not None:
+            statement = statement.where(DBRevokedToken.revoked_at > self.since - self.overlap)
+        async with models.session_factory() as session:
+            result = await session.exec(statement)
+            for revoked_token in result.all():
+                self.add(revoked_token)
+        self.since = started
+        self.prune()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(settings.REVOCATION_REFRESH_SECONDS)
+            with contextlib.suppress(Exception):
+                await self.refresh()
+
+    async def start(self):
+        await self.refresh()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+
+
+revocations = RevocationList()
+
+
+async def revoke_token(session: models.AsyncSession, payload: dict):
+    revoked_token = DBRevokedToken(
+        jti=payload["jti"],
+        user_id=payload["sub"],
+        expires_at=datetime.datetime.fromtimestamp(payload["exp"]),
+    )
+    session.add(revoked_token)
+    await session.commit()
+    await session.refresh(revoked_token)
+    revocations.add(revoked_token)
+
+
+def bump_generation(session: models.AsyncSession, user: models.DBUser) -> DBRevokedToken:
+    # tokens carry the generation they were issued with, bumping it revokes
+    # every access token issued so far
+    user.token_generation += 1
+    revoked_token = DBRevokedToken(
+        generation=user.token_generation,
+        user_id=user.id,
+        expires_at=datetime.datetime.now()
+        + datetime.timedelta(minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES),
+    )
+    session.add(user)
+    session.add(revoked_token)
+    return revoked_token
+
+
+async def revoke_user_claims(session: models.AsyncSession, user: models.DBUser):
+    # access tokens are trusted for their claims, so a change of roles or
+    # status revokes them. Refresh tokens renew with the new claims, and are
+    # refused for an inactive user.
+    revoked_token = bump_generation(session, user)
+    await session.commit()
+    await session.refresh(revoked_token)
+    revocations.add(revoked_token)
+
+
+async def revoke_user_tokens(session: models.AsyncSession, user: models.DBUser):
+    # refresh tokens included
+    revoked_token = bump_generation(session, user)
+    await session.exec(
+        update(models.DBRefreshToken)
+        .where(models.DBRefreshToken.user_id == user.id)
+        .values(revoked=True)
+    )
+    await session.commit()
+    await session.refresh(revoked_token)
+    revocations.add(revoked_token)
@@ -1,4 +1,4 @@
-from . import item_router, merchant_router, wallet_router, transaction_router, users, authentication , exchange_router
+from . import item_router, merchant_router, wallet_router, transaction_router, users, authentication , exchange_router, metrics_router, report_router
 
 def init_routers(app):
     app.include_router(item_router.router)
@@ -7,4 +7,6 @@ def init_routers(app):
     app.include_router(transaction_router.router)
     app.include_router(users.router)
     app.include_router(authentication.router)
-    app.include_router(exchange_router.router)
\ No newline at end of file
+    app.include_router(exchange_router.router)
+    app.include_router(metrics_router.router)
+    app.include_router(report_router.router)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Security, status
+from fastapi import APIRouter, Depends, Form, HTTPException, Security, status
 from fastapi.security import (
     HTTPAuthorizationCredentials,
     HTTPBasicCredentials,
@@ -7,75 +7,204 @@ from fastapi.security import (
 )
 
 
-from sqlmodel import select
+from sqlalchemy import or_
+from sqlmodel import select, update
 from typing import Annotated
 import datetime
+import uuid
+
+import jwt
 
 from .. import config
 from .. import models
 from ..models.users import Token, TokenData, DBUser
+from ..models.token_model import DBRefreshToken
+from .. import deps
+from .. import logins
+from .. import revocation
 from .. import security
 
 router = APIRouter(tags=["authentication"])
 
 settings = config.get_settings()
 
-
-@router.post(
-    "/token",
+incorrect_refresh_token_exception = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Invalid refresh token",
 )
-async def authentication(
-    form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    session: Annotated[models.AsyncSession, Depends(models.get_session)],
+
+
+class TokenRequestForm:
+    def __init__(
+        self,
+        grant_type: Annotated[str, Form(pattern="^(password|refresh_token)$")] = "password",
+        username: Annotated[str | None, Form()] = None,
+        password: Annotated[str | None, Form()] = None,
+        refresh_token: Annotated[str | None, Form()] = None,
+        scope: Annotated[str, Form()] = "",
+    ):
+        self.grant_type = grant_type
+        self.username = username
+        self.password = password
+        self.refresh_token = refresh_token
+        self.scopes = scope.split()
+
+
+async def create_token(
+    session: models.AsyncSession, user: DBUser, family: str | None = None
 ) -> Token:
+    # every refresh token is stored so that it can be used exactly once,
+    # tokens rotated from the same login share a family
+    issued_at = datetime.datetime.now()
+    access_token_expires = datetime.timedelta(
+        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
+    )
+    refresh_token_expires = datetime.timedelta(
+        minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
+    )
 
-    result = await session.exec(
-        select(DBUser).where(DBUser.username == form_data.username)
+    db_refresh_token = DBRefreshToken(
+        jti=uuid.uuid4().hex,
+        family=family or uuid.uuid4().hex,
+        user_id=user.id,
+        issued_at=issued_at,
+        expires_at=issued_at + refresh_token_expires,
     )
+    session.add(db_refresh_token)
 
-    user = result.one_or_none()
+    return Token(
+        access_token=security.create_access_token(
+            data=security.get_user_claims(user),
+            expires_delta=access_token_expires,
+        ),
+        refresh_token=security.create_refresh_token(
+            data={
+                "sub": str(user.id),
+                "jti": db_refresh_token.jti,
+                "fam": db_refresh_token.family,
+            },
+            expires_delta=refresh_token_expires,
+        ),
+        token_type="Bearer",
+        scope="",
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
+        expires_at=issued_at + access_token_expires,
+        issued_at=issued_at,
+    )
 
-    if not user:
-        result = await session.exec(
-            select(DBUser).where(DBUser.email == form_data.username)
+
+def build_login_lookup(username: str):
+    # one lookup through both indexes, a username match wins over an email
+    return (
+        select(DBUser)
+        .where(or_(DBUser.username == username, DBUser.email == username))
+        .order_by((DBUser.username == username).desc())
+        .limit(1)
+    )
+
+
+async def authenticate_password(
+    form_data: TokenRequestForm, session: models.AsyncSession
+) -> Token:
+    if not form_data.username or not form_data.password:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="username and password are required",
         )
-        user = result.one_or_none()
 
-    print("user", user)
+    result = await session.exec(build_login_lookup(form_data.username))
+    user = result.one_or_none()
+
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
-    print("userx", user, await user.verify_password(form_data.password))
     if not await user.verify_password(form_data.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
         )
 
-    user.last_login_date = datetime.datetime.now()
-
-    session.add(user)
+    logins.recorder.record(user.id)
+    token = await create_token(session, user)
     await session.commit()
-    await session.refresh(user)
+    return token
 
-    access_token_expires = datetime.timedelta(
-        minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
-    )
-    return Token(
-        access_token=security.create_access_token(
-            data={"sub": user.id},
-            expires_delta=access_token_expires,
-        ),
-        refresh_token=security.create_refresh_token(
-            data={"sub": user.id},
-            expires_delta=access_token_expires,
-        ),
-        token_type="Bearer",
-        scope="",
-        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES,
-        expires_at=datetime.datetime.now() + access_token_expires,
-        issued_at=user.last_login_date,
+
+async def authenticate_refresh_token(
+    form_data: TokenRequestForm, session: models.AsyncSession
+) -> Token:
+    # renewals never hash anything, the token itself is the credential
+    if not form_data.refresh_token:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="refresh_token is required",
+        )
+
+    try:
+        payload = jwt.decode(
+            form_data.refresh_token,
+            settings.SECRET_KEY,
+            algorithms=[security.ALGORITHM],
+        )
+    except jwt.PyJWTError:
+        raise incorrect_refresh_token_exception
+
+    if payload.get("typ") != "refresh" or not payload.get("jti"):
+        raise incorrect_refresh_token_exception
+
+    # marking the token used is conditional, so two concurrent renewals
+    # with the same token can not both succeed
+    result = await session.exec(
+        update(DBRefreshToken)
+        .where(
+            DBRefreshToken.jti == payload["jti"],
+            DBRefreshToken.used_at.is_(None),
+            DBRefreshToken.revoked.is_(False),
+        )
+        .values(used_at=datetime.datetime.now())
+        .returning(DBRefreshToken.user_id, DBRefreshToken.family)
     )
+    db_refresh_token = result.one_or_none()
+
+    if db_refresh_token is None:
+        # a rotated token came back, assume it leaked and end the whole family
+        await session.exec(
+            update(DBRefreshToken)
+            .where(DBRefreshToken.family == payload.get("fam"))
+            .values(revoked=True)
+        )
+        await session.commit()
+        raise incorrect_refresh_token_exception
+
+    user = await session.get(DBUser, db_refresh_token.user_id)
+    if not user or user.status != "active":
+        raise incorrect_refresh_token_exception
+
+    token = await create_token(session, user, family=db_refresh_token.family)
+    await session.commit()
+    return token
+
+
+@router.post(
+    "/token",
+)
+async def authentication(
+    form_data: Annotated[TokenRequestForm, Depends()],
+    session: Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> Token:
+    if form_data.grant_type == "refresh_token":
+        return await authenticate_refresh_token(form_data, session)
+
+    return await authenticate_password(form_data, session)
+
+
+@router.post("/token/revoke")
+async def revoke(
+    payload: Annotated[dict, Depends(deps.get_token_payload)],
+    session: Annotated[models.AsyncSession, Depends(models.get_session)],
+) -> dict:
+    await revocation.revoke_token(session, payload)
+    return dict(message="token revoked")
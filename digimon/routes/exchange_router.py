@@ -1,62 +1,138 @@
 from fastapi import APIRouter, Depends, HTTPException
+from typing import Annotated
+from fastapi.responses import JSONResponse
+from sqlmodel import select
 
-from digimon.models.exchange_model import EXCHANGE_RATES, BaseExchange, Currency
+import numpy as np
+
+from digimon.models.exchange_model import (
+    BaseExchange,
+    Currency,
+    ItemQuoteRequest,
+    QuoteRequest,
+)
 
 from sqlmodel.ext.asyncio.session import AsyncSession
+from digimon.models.ledger_model import LedgerKind
 from digimon.models.wallet_model import DBWallet
+from digimon.models.item_models import DBItem
 
+from .. import idempotency
 from .. import models
+from .. import ledger
+from .. import rates
+from .. import wallets
 
 router = APIRouter(prefix="/exchange", tags=["exchange"])
 
+THB_INDEX = rates.CURRENCIES.index(Currency.THB)
+
+
+@router.post("/quote")
+async def quote(request: QuoteRequest) -> JSONResponse:
+    if not len(request.amounts) == len(request.from_currencies) == len(request.to_currencies):
+        raise HTTPException(
+            status_code=400,
+            detail="amounts, from_currencies and to_currencies must have the same length",
+        )
+
+    snapshot = rates.provider.snapshot
+    converted = snapshot.convert(
+        np.asarray(request.amounts, dtype=np.float64),
+        rates.currency_indexes(request.from_currencies),
+        rates.currency_indexes(request.to_currencies),
+    )
+
+    # columns of plain floats are already JSON, skip jsonable_encoder
+    return JSONResponse(
+        {
+            "rate_version": snapshot.version,
+            "amounts": request.amounts,
+            "from_currencies": request.from_currencies,
+            "to_currencies": request.to_currencies,
+            "converted": converted.tolist(),
+        }
+    )
+
+
+@router.post("/quote/items")
+async def quote_items(
+    request: ItemQuoteRequest,
+    session: AsyncSession = Depends(models.get_session),
+) -> JSONResponse:
+    result = await session.exec(
+        select(DBItem.id, DBItem.price).where(DBItem.id.in_(request.item_ids))
+    )
+    prices = dict(result.all())
+    missing = [item_id for item_id in request.item_ids if item_id not in prices]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=dict(message="Not found these items", item_ids=missing),
+        )
+
+    # item prices are in THB, one broadcast gives every item in every currency
+    snapshot = rates.provider.snapshot
+    thb_prices = np.fromiter(
+        (prices[item_id] for item_id in request.item_ids),
+        dtype=np.float64,
+        count=len(request.item_ids),
+    )
+    quoted = thb_prices[:, np.newaxis] * snapshot.array[THB_INDEX, :]
+
+    data = {"rate_version": snapshot.version, "item_ids": request.item_ids}
+    for i, currency in enumerate(rates.CURRENCIES):
+        data[currency.value] = quoted[:, i].tolist()
+    return JSONResponse(data)
+
+
 @router.post("/{exchange}")
 async def exchange_money(
     wallet_id: int,
     request:BaseExchange,
-    session: AsyncSession = Depends(models.get_session)):
+    idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)]):
+    return await idempotent.run(exchange, wallet_id, request)
 
-    wallet = await session.get(DBWallet, wallet_id)
-    if not wallet:
-        raise HTTPException(
-            status_code=404,
-            detail="Not found this wallet",
-        )
+
+async def exchange(wallet_id: int, request: BaseExchange) -> dict:
+    async with models.session_factory() as session:
+        return await exchange_with_session(session, wallet_id, request)
+
+
+async def exchange_with_session(session: AsyncSession, wallet_id: int, request: BaseExchange) -> dict:
     if request.from_currency == request.to_currency:
         raise HTTPException(
             status_code=400,
             detail="from_currency and to_currency are the same",
         )
-    if request.from_currency == Currency.THB:
-        thb_amount = request.amount
-        rate = EXCHANGE_RATES[request.to_currency]
-        to_amount = thb_amount / rate
-    else:
-        rate = EXCHANGE_RATES[request.from_currency]
-        thb_amount = request.amount * rate
-
-        if request.to_currency == Currency.THB:
-            to_amount = thb_amount
-        else:
-            to_rate = EXCHANGE_RATES[request.to_currency]
-            to_amount = thb_amount / to_rate
-
-    rate = EXCHANGE_RATES[request.to_currency]
-    to_amount = request.amount / rate
-
-    if wallet.balance < thb_amount:
-        raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    wallet.balance -= thb_amount
+    # one snapshot for the whole request, so both amounts use the same rates
+    snapshot = rates.provider.snapshot
+    to_amount = request.amount * snapshot.rate(request.from_currency, request.to_currency)
+    thb_amount = request.amount * snapshot.rate(request.from_currency, Currency.THB)
 
-    session.add(wallet)
-    await session.commit()
-    await session.refresh(wallet)
+    balance = await wallets.debit(session, wallet_id, thb_amount)
+    if balance is None:
+        await session.rollback()
+        if not await session.get(DBWallet, wallet_id):
+            raise HTTPException(
+                status_code=404,
+                detail="Not found this wallet",
+            )
+        raise HTTPException(status_code=400, detail="Insufficient balance")
 
-    return {
+    await ledger.record(
+        session, [ledger.entry(wallet_id, -thb_amount, LedgerKind.exchange)]
+    )
+    response = {
         "from_currency": request.from_currency,
         "to_currency": request.to_currency,
         "original_amount": request.amount,
         "exchanged_amount": to_amount,
         "thb_equivalent": thb_amount,
-        "wallet_balance": wallet.balance
-    }
\ No newline at end of file
+        "wallet_balance": balance,
+        "rate_version": snapshot.version,
+    }
+    await idempotency.complete(session, response)
+    await session.commit()
+    return response
@@ -1,12 +1,15 @@
-from fastapi import APIRouter, HTTPException, Depends , Query
+from fastapi import APIRouter, HTTPException, Depends , Header, Query, Response
 from sqlmodel import Session, select , func 
 from typing import Optional, Annotated 
 from .. import models
+from .. import catalog
 from .. import deps
+from .. import etags
+from .. import pagination
 import math
 
 from sqlmodel.ext.asyncio.session import AsyncSession
-from ..models.item_models import CreatedItem, DBItem, Item, ItemList, UpdatedItem
+from ..models.item_models import CreatedItem, DBItem, Item, ItemList, ItemSort, UpdatedItem
 from contextlib import contextmanager
 
 router = APIRouter(prefix="/items", tags=["item"])
@@ -29,37 +32,61 @@ async def create_item(
 @router.get("")
 async def get_items(
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    page: int = 1,
-    size_per_page: int = SIZE_PER_PAGE,
+    response: Response,
+    page: Annotated[int, Query(ge=1)] = 1,
+    size_per_page: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = SIZE_PER_PAGE,
+    after: str | None = None,
+    sort_by: ItemSort = ItemSort.id,
+    with_count: bool = True,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> ItemList:
-    result = await session.exec(
-        select(DBItem).offset((page - 1) * size_per_page).limit(size_per_page)
-    )
-    items = result.all()
+    columns = [DBItem.id]
+    if sort_by != ItemSort.id:
+        columns.insert(0, getattr(DBItem, sort_by.value))
 
-    page_count = int(
-        math.ceil(
-            (await session.exec(select(func.count(DBItem.id)))).first()
-            / size_per_page
+    page_count = None
+    if with_count:
+        page_count = int(
+            math.ceil(await pagination.cached_count(session, DBItem) / size_per_page)
         )
+
+    statement = pagination.paginate(
+        select(DBItem), columns, size_per_page, page=page, after=after
     )
+    result = await session.exec(statement)
+    rows = result.all()
+    etag = etags.page_etag(rows, page_count)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    items, next_cursor = pagination.next_page(rows, columns, size_per_page)
 
-    print("page_count", page_count)
-    print("items", items)
     return ItemList.from_orm(
-        dict(items=items, page_count=page_count, page=page, size_per_page=size_per_page)
+        dict(
+            items=items,
+            page_count=page_count,
+            page=page if after is None else None,
+            size_per_page=size_per_page,
+            next_cursor=next_cursor,
+        )
     )
 
 
 @router.get("/{item_id}")
 async def get_item(
-    item_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]
+    item_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    response: Response,
+    if_none_match: Annotated[str | None, Header()] = None,
 ) -> Item:
-    db_item = await session.get(DBItem, item_id)
-    if db_item:
-        return Item.from_orm(db_item)
+    entry = await catalog.catalog.get_entry(session, DBItem, Item, item_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Item not found")
 
-    raise HTTPException(status_code=404, detail="Item not found")
+    if etags.matches(if_none_match, entry.etag):
+        return etags.not_modified(entry.etag)
+    response.headers["ETag"] = entry.etag
+    return entry.value
 
 
 @router.put("/{item_id}")
@@ -75,6 +102,7 @@ async def update_item(
     db_item.sqlmodel_update(data)
     session.add(db_item)
     await session.commit()
+    await catalog.catalog.invalidate(DBItem, item_id)
     await session.refresh(db_item)
 
     return Item.from_orm(db_item)
@@ -88,5 +116,6 @@ async def delete_item(
     db_item = await session.get(DBItem, item_id)
     await session.delete(db_item)
     await session.commit()
+    await catalog.catalog.invalidate(DBItem, item_id)
 
     return dict(message="delete success")
\ No newline at end of file
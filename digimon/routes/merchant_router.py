@@ -1,22 +1,31 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Response
 from sqlmodel import Session, select
-from ..models.merchant_model import CreatedMerchant, DBMerchant, Merchant, MerchantList, UpdatedMerchant
+from ..models.item_models import DBItem
+from ..models.wallet_model import DBWallet
+from ..models.merchant_model import CreatedMerchant, DBMerchant, Merchant, MerchantList, MerchantSort, UpdatedMerchant
+from ..models.report_model import TopItem, TopItems
 from contextlib import contextmanager
 from typing import Optional, Annotated
 from .. import models
+from .. import catalog
+from .. import config
 from .. import deps
+from .. import etags
+from .. import leaderboard
+from .. import pagination
 from ..models import users
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 router = APIRouter(prefix="/merchants", tags=["merchant"])
+settings = config.get_settings()
 
 @router.post("")
 async def create_merchant(
     merchant: CreatedMerchant, 
-    current_user: Annotated[users, Depends(deps.get_current_user)],
+    current_user: Annotated[users.TokenData, Depends(deps.get_current_active_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]):
     db_merchant = DBMerchant.parse_obj(merchant)
-    db_merchant.user = current_user
+    db_merchant.user_id = current_user.user_id
     session.add(db_merchant)
     await session.commit()
     await session.refresh(db_merchant)
@@ -24,17 +33,65 @@ async def create_merchant(
 
 
 @router.get("")
-async def get_merchants( session: Annotated[AsyncSession, Depends(models.get_session)], page: int = 1, page_size: int = 10,):
-    result = await session.exec(select(DBMerchant).offset((page - 1) * page_size).limit(page_size))
-    db_merchants = result.all()
-    return MerchantList(merchants=db_merchants, page=page, page_size=page_size, size_per_page=len(db_merchants))
+async def get_merchants(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    response: Response,
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = 10,
+    after: str | None = None,
+    sort_by: MerchantSort = MerchantSort.id,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    columns = [DBMerchant.id]
+    if sort_by != MerchantSort.id:
+        columns.insert(0, getattr(DBMerchant, sort_by.value))
+
+    statement = pagination.paginate(select(DBMerchant), columns, page_size, page=page, after=after)
+    result = await session.exec(statement)
+    rows = result.all()
+    etag = etags.page_etag(rows)
+    if etags.matches(if_none_match, etag):
+        return etags.not_modified(etag)
+    response.headers["ETag"] = etag
+    db_merchants, next_cursor = pagination.next_page(rows, columns, page_size)
+    return MerchantList(
+        merchants=db_merchants,
+        page=page if after is None else None,
+        page_size=page_size,
+        size_per_page=len(db_merchants),
+        next_cursor=next_cursor,
+    )
 
 @router.get("/{merchant_id}")
-async def get_merchant(merchant_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]):
-    db_merchant = await session.get(DBMerchant, merchant_id)
-    if not db_merchant:
+async def get_merchant(
+    merchant_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    response: Response,
+    if_none_match: Annotated[str | None, Header()] = None,
+):
+    entry = await catalog.catalog.get_entry(session, DBMerchant, Merchant, merchant_id)
+    if not entry:
         raise HTTPException(status_code=404, detail="Merchant not found")
-    return Merchant.model_validate(db_merchant)
+
+    if etags.matches(if_none_match, entry.etag):
+        return etags.not_modified(entry.etag)
+    response.headers["ETag"] = entry.etag
+    return entry.value
+
+
+@router.get("/{merchant_id}/top-items")
+async def get_top_items(
+    merchant_id: int,
+    limit: Annotated[int, Query(gt=0, le=settings.LEADERBOARD_SIZE)] = 10,
+) -> TopItems:
+    # served from memory, quantities are count-min estimates and never low
+    return TopItems(
+        merchant_id=merchant_id,
+        items=[
+            TopItem(item_id=item_id, quantity=quantity)
+            for item_id, quantity in leaderboard.leaderboard.top(merchant_id, limit)
+        ],
+    )
 
 
 @router.put("/{merchant_id}")
@@ -47,6 +104,7 @@ async def update_merchant(
         setattr(db_merchant, key, value)
     session.add(db_merchant)
     await session.commit()
+    await catalog.catalog.invalidate(DBMerchant, merchant_id)
     await session.refresh(db_merchant)
     return Merchant.model_validate(db_merchant)
 
@@ -57,6 +115,16 @@ async def delete_merchant(
     # current_user: Annotated[models.users, Depends(deps.get_current_user)],
     session: Annotated[AsyncSession, Depends(models.get_session)]):
     db_merchant = await session.get(DBMerchant, merchant_id)
+    # its items and wallet are deleted with it
+    result = await session.exec(select(DBItem.id).where(DBItem.merchant_id == merchant_id))
+    item_ids = result.all()
+    result = await session.exec(select(DBWallet.id).where(DBWallet.merchant_id == merchant_id))
+    wallet_ids = result.all()
     await session.delete(db_merchant)
     await session.commit()
+    await catalog.catalog.invalidate(DBMerchant, merchant_id)
+    for item_id in item_ids:
+        await catalog.catalog.invalidate(DBItem, item_id)
+    for wallet_id in wallet_ids:
+        await catalog.catalog.invalidate(DBWallet, wallet_id)
     return {"message": "Merchant deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,43 @@
+from fastapi import APIRouter
+
+from .. import catalog
+from .. import coalescer
+from .. import hashing
+from .. import idempotency
+from .. import leaderboard
+from .. import models
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/pool")
+async def get_pool_metrics() -> dict:
+    return models.pool_status()
+
+
+@router.get("/hashing")
+async def get_hashing_metrics() -> dict:
+    return hashing.hasher.stats()
+
+
+@router.get("/coalescer")
+async def get_coalescer_metrics() -> dict:
+    return coalescer.coalescer.stats()
+
+
+@router.get("/idempotency")
+async def get_idempotency_metrics() -> dict:
+    return dict(
+        inflight=len(idempotency.store.inflight),
+        cache=idempotency.store.cache.stats(),
+    )
+
+
+@router.get("/leaderboard")
+async def get_leaderboard_metrics() -> dict:
+    return leaderboard.leaderboard.stats()
+
+
+@router.get("/catalog")
+async def get_catalog_metrics() -> dict:
+    return catalog.catalog.stats()
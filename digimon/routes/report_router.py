@@ -0,0 +1,60 @@
+import datetime
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from ..models.report_model import (
+    DailyRevenue,
+    DailyRevenueReport,
+    DBRevenueRollup,
+    ItemRevenue,
+    ItemRevenueReport,
+)
+from .. import models
+from .. import reports
+
+router = APIRouter(prefix="/reports", tags=["report"])
+
+
+def check_range(start: datetime.date | None, end: datetime.date | None):
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+
+@router.get("/merchants/{merchant_id}/revenue")
+async def get_daily_revenue(
+    merchant_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+) -> DailyRevenueReport:
+    check_range(start, end)
+    result = await session.exec(
+        reports.build_report(merchant_id, DBRevenueRollup.day, start, end)
+    )
+    return DailyRevenueReport(
+        merchant_id=merchant_id,
+        start=start,
+        end=end,
+        days=[DailyRevenue(**row._asdict()) for row in result.all()],
+    )
+
+
+@router.get("/merchants/{merchant_id}/items")
+async def get_item_revenue(
+    merchant_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    start: datetime.date | None = None,
+    end: datetime.date | None = None,
+) -> ItemRevenueReport:
+    check_range(start, end)
+    result = await session.exec(
+        reports.build_report(merchant_id, DBRevenueRollup.item_id, start, end)
+    )
+    return ItemRevenueReport(
+        merchant_id=merchant_id,
+        start=start,
+        end=end,
+        items=[ItemRevenue(**row._asdict()) for row in result.all()],
+    )
@@ -1,53 +1,167 @@
-from fastapi import APIRouter, HTTPException, Depends
+import csv
+import io
+import itertools
+import json
+
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 from ..models.item_models import DBItem
-from ..models.transaction_model import CreatedTransaction, DBTransaction, Transaction, TransactionList
+from ..models.transaction_model import Checkout, CheckoutResult, CreatedTransaction, DBTransaction, ExportFormat, Transaction, TransactionList
 from ..models.wallet_model import DBWallet
 from contextlib import contextmanager
 from typing import Optional, Annotated
+from .. import archive
+from .. import coalescer
+from .. import idempotency
 from .. import models
+from .. import pagination
+from .. import purchase
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 
 router = APIRouter(prefix="/transactions", tags=["transaction"])
+SIZE_PER_PAGE = 50
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_MAX_CHUNK_SIZE = 10_000
+EXPORT_MEDIA_TYPES = {
+    ExportFormat.ndjson: "application/x-ndjson",
+    ExportFormat.csv: "text/csv",
+}
+
 
+@router.post("/checkout/{wallet_id}")
+async def checkout(session: Annotated[AsyncSession, Depends(models.get_session)], cart: Checkout, wallet_id: int) -> CheckoutResult:
+        return await purchase.checkout(session, wallet_id, cart.lines)
 
 @router.post("/{wallet_id}/{item_id}")
-async def create_transaction(session: Annotated[AsyncSession, Depends(models.get_session)],transaction: CreatedTransaction, wallet_id: int, item_id: int):
-        db_wallet = await session.get(DBWallet, wallet_id)
-        db_item = await session.get(DBItem, item_id)
-        if not db_wallet or not db_item:
-            raise HTTPException(status_code=404, detail="Wallet or Item not found")
-
-        balance = db_item.price * transaction.quantity
-        if db_wallet.balance < balance:
-            raise HTTPException(status_code=400, detail="Insufficient balance")
-
-        db_wallet.balance -= balance
-        db_transaction = DBTransaction(**transaction.dict(), wallet_id=wallet_id, item_id=item_id)
-        db_transaction.balance = balance
-        
-        session.add(db_transaction)
-        await session.commit()
-        await session.refresh(db_transaction)
-        return Transaction.from_orm(db_transaction)
+async def create_transaction(transaction: CreatedTransaction, wallet_id: int, item_id: int, idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)]) -> Transaction:
+        return await idempotent.run(coalescer.coalescer.purchase, wallet_id, item_id, transaction.quantity)
 
 @router.get("/{transaction_id}")
 async def get_transaction(transaction_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]):
-    db_transaction = await session.get(DBTransaction, transaction_id)
+    result = await session.exec(select(DBTransaction).where(DBTransaction.id == transaction_id))
+    db_transaction = result.first()
     if not db_transaction:
-         raise HTTPException(status_code=404, detail="Transaction not found")
+        archived = archive.archives.get(transaction_id)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        db_transaction = DBTransaction(**archived)
     return Transaction.from_orm(db_transaction)
 
 @router.get("/wallet/{wallet_id}")
-async def get_transactions(wallet_id: int , session: Annotated[AsyncSession, Depends(models.get_session)]):
-    result = await session.exec(select(DBTransaction).where(DBTransaction.wallet_id == wallet_id))
-    db_transactions = result.all()
-    return TransactionList(transactions=db_transactions, page=1, page_size=len(db_transactions), size_per_page=len(db_transactions))
+async def get_transactions(
+    wallet_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int | None, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = None,
+    after: str | None = None,
+):
+    # archived months come first, they are older than every row left in the
+    # table. Only the archived rows of the page are read.
+    statement = select(DBTransaction).where(DBTransaction.wallet_id == wallet_id)
+    if page_size is None and after is None:
+        # no paging requested, keep returning the whole history
+        result = await session.exec(statement.order_by(DBTransaction.id))
+        db_transactions = [DBTransaction(**row) for row in archive.archives.wallet_transactions(wallet_id)]
+        db_transactions += result.all()
+        return TransactionList(transactions=db_transactions, page=1, page_size=len(db_transactions), size_per_page=len(db_transactions))
+
+    page_size = page_size or SIZE_PER_PAGE
+    columns = [DBTransaction.id]
+    skip = 0
+    last_id = None
+    if after is not None:
+        last_id = pagination.decode_cursor(after, columns)[0]
+    else:
+        skip = (page - 1) * page_size
+    archived = archive.archives.wallet_transactions(wallet_id, after=last_id)
+    db_transactions = [
+        DBTransaction(**row) for row in itertools.islice(archived, skip, skip + page_size + 1)
+    ]
+
+    remaining = page_size + 1 - len(db_transactions)
+    if remaining:
+        statement = pagination.paginate(statement, columns, page_size, page=page, after=after)
+        if after is None:
+            statement = statement.offset(
+                max(0, skip - archive.archives.wallet_count(wallet_id))
+            )
+        result = await session.exec(statement.limit(remaining))
+        db_transactions += result.all()
+    db_transactions, next_cursor = pagination.next_page(db_transactions, columns, page_size)
+    return TransactionList(
+        transactions=db_transactions,
+        page=page if after is None else None,
+        page_size=page_size,
+        size_per_page=len(db_transactions),
+        next_cursor=next_cursor,
+    )
+
+async def stream_transactions(wallet_id: int, format: ExportFormat, chunk_size: int = EXPORT_CHUNK_SIZE):
+    # rows come through a server-side cursor one chunk at a time, so memory
+    # stays flat no matter how long the wallet history is
+    columns = DBTransaction.__table__.c
+    statement = (
+        select(*columns)
+        .where(DBTransaction.wallet_id == wallet_id)
+        .order_by(DBTransaction.id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    if format == ExportFormat.csv:
+        yield ",".join(columns.keys()) + "\n"
+
+    archived = archive.archives.wallet_transactions(wallet_id)
+    while rows := [
+        {key: row.get(key) for key in columns.keys()}
+        for row in itertools.islice(archived, chunk_size)
+    ]:
+        if format == ExportFormat.csv:
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerows(row.values() for row in rows)
+            yield buffer.getvalue()
+        else:
+            yield "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+    async with models.engine.connect() as conn:
+        result = await conn.stream(statement)
+        async for rows in result.partitions():
+            if format == ExportFormat.csv:
+                buffer = io.StringIO()
+                csv.writer(buffer, lineterminator="\n").writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield "".join(
+                    json.dumps(row._asdict(), default=str) + "\n" for row in rows
+                )
+
+@router.get("/wallet/{wallet_id}/export")
+async def export_transactions(
+    wallet_id: int,
+    format: ExportFormat = ExportFormat.ndjson,
+    chunk_size: Annotated[int, Query(ge=1, le=EXPORT_MAX_CHUNK_SIZE)] = EXPORT_CHUNK_SIZE,
+):
+    # the session is closed before streaming, so an export only ever holds
+    # the connection of its cursor
+    async with models.session_factory() as session:
+        if not await session.get(DBWallet, wallet_id):
+            raise HTTPException(status_code=404, detail="Wallet not found")
+
+    return StreamingResponse(
+        stream_transactions(wallet_id, format, chunk_size),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f"attachment; filename=wallet-{wallet_id}-transactions.{format.value}"
+        },
+    )
 
 @router.delete("/{transaction_id}")
 async def delete_transaction(transaction_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]):
-    db_transaction = await session.get(DBTransaction, transaction_id)
+    result = await session.exec(select(DBTransaction).where(DBTransaction.id == transaction_id))
+    db_transaction = result.first()
+    if not db_transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
     await session.delete(db_transaction)
     await session.commit()
     return {"message": "Transaction deleted successfully"}
\ No newline at end of file
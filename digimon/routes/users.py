@@ -6,10 +6,15 @@ from typing import Annotated
 
 from .. import deps
 from .. import models
-from ..models.users import User, DBUser, RegisteredUser, UpdatedUser, ChangedPassword
+from .. import revocation
+from .. import security
+from ..models.users import User, DBUser, RegisteredUser, UpdatedUser, UpdatedAccess, ChangedPassword, TokenData
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# what a user may change about themselves
+UPDATABLE_FIELDS = {"email", "username", "first_name", "last_name"}
+
 
 @router.get("/me")
 def get_me(current_user: User = Depends(deps.get_current_user)) -> User:
@@ -20,7 +25,7 @@ def get_me(current_user: User = Depends(deps.get_current_user)) -> User:
 async def get(
     user_id: int,
     session: Annotated[AsyncSession, Depends(models.get_session)],
-    current_user: User = Depends(deps.get_current_user),
+    current_user: TokenData = Depends(deps.get_current_principal),
 ) -> User:
 
     user = await session.get(DBUser, user_id)
@@ -63,7 +68,7 @@ async def change_password(
     session: Annotated[AsyncSession, Depends(models.get_session)],
     user_id: int,
     password_update: ChangedPassword,
-    current_user: User = Depends(deps.get_current_user),
+    current_user: TokenData = Depends(deps.get_current_principal),
 ) -> dict(): # type: ignore
 
     user = await session.get(DBUser, user_id)
@@ -74,7 +79,7 @@ async def change_password(
             detail="Not found this user",
         )
 
-    if not user.verify_password(password_update.current_password):
+    if not await user.verify_password(password_update.current_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
@@ -91,8 +96,13 @@ async def update(
     request: Request,
     user_id: int,
     user_update: UpdatedUser,
-    current_user: User = Depends(deps.get_current_user),
+    current_user: TokenData = Depends(deps.get_current_principal),
 ) -> User:
+    if current_user.user_id != user_id and "admin" not in current_user.roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Role not permitted",
+        )
 
     user = await session.get(DBUser, user_id)
     if not user:
@@ -101,16 +111,82 @@ async def update(
             detail="Not found this user",
         )
 
-    if not user.verify_password(user_update.verify_password):
+    # an admin confirms with their own password
+    verifying_user = user
+    if current_user.user_id != user_id:
+        verifying_user = await session.get(DBUser, current_user.user_id)
+    if not verifying_user or not await verifying_user.verify_password(
+        user_update.verify_password
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect password",
         )
 
-    set_dict = user_update.dict()
+    set_dict = user_update.model_dump(exclude_unset=True, include=UPDATABLE_FIELDS)
     user.sqlmodel_update(set_dict)
     session.add(user)
     await session.commit()
     await session.refresh(user)
 
     return user
+
+
+@router.put("/{user_id}/access")
+async def update_access(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    user_id: int,
+    access: UpdatedAccess,
+    current_user: TokenData = Depends(deps.get_current_active_user),
+) -> User:
+    if "admin" not in current_user.roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Role not permitted",
+        )
+
+    if access.roles is not None and not set(access.roles) <= set(security.ROLE_PERMISSIONS):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown role",
+        )
+
+    user = await session.get(DBUser, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not found this user",
+        )
+
+    if access.roles is not None:
+        user.roles = access.roles
+    if access.status is not None:
+        user.status = access.status
+    # tokens issued with the old claims stop working on every worker
+    await revocation.revoke_user_claims(session, user)
+    await session.refresh(user)
+
+    return user
+
+
+@router.post("/{user_id}/revoke_tokens")
+async def revoke_tokens(
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    user_id: int,
+    current_user: TokenData = Depends(deps.get_current_principal),
+) -> dict:
+    if current_user.user_id != user_id and "admin" not in current_user.roles:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Role not permitted",
+        )
+
+    user = await session.get(DBUser, user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Not found this user",
+        )
+
+    await revocation.revoke_user_tokens(session, user)
+    return dict(message="tokens revoked")
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from sqlmodel import Session
 from ..models.wallet_model import CreatedWallet, DBWallet, UpdatedWallet, Wallet
 from contextlib import contextmanager
@@ -7,17 +7,76 @@ from .. import models
 from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from ..models.wallet_model import CreatedWallet, DBWallet, UpdatedWallet, Wallet
+from ..models.wallet_model import BulkPayout, BulkPayoutResult, CreatedWallet, DBWallet, UpdatedWallet, Wallet
 from datetime import datetime
 from ..models.users import User
+from ..models.ledger_model import LedgerKind, WalletBalance
+from ..models.transfer_model import BulkTransfer, BulkTransferResult, CreatedTransfer, TransferResult
+from .. import catalog
+from .. import coalescer
+from .. import idempotency
+from .. import config
+from .. import ledger
+from .. import payouts
+from .. import transfers
+from .. import wallets
 
 router = APIRouter(prefix="/wallets", tags=["wallet"])
 
+settings = config.get_settings()
+
+
+# declared before POST /{merchant_id}, which would take these paths otherwise
+@router.post("/transfer")
+async def transfer(
+    transfer: CreatedTransfer,
+    idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)],
+) -> TransferResult:
+    return await idempotent.run(run_transfer, transfer)
+
+async def run_transfer(transfer: CreatedTransfer) -> TransferResult:
+    return await transfers.run_transfers([transfer], single_transfer)
+
+def single_transfer(results: list[TransferResult]) -> TransferResult:
+    result, = results
+    if result.status == "not_found":
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    if result.status == "insufficient_funds":
+        raise HTTPException(status_code=400, detail="Insufficient funds")
+    return result
+
+@router.post("/transfers")
+async def bulk_transfer(
+    bulk: BulkTransfer,
+    idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)],
+) -> BulkTransferResult:
+    return await idempotent.run(run_bulk_transfer, bulk)
+
+async def run_bulk_transfer(bulk: BulkTransfer) -> BulkTransferResult:
+    return await transfers.run_transfers(
+        bulk.transfers, lambda results: BulkTransferResult(transfers=results)
+    )
+
+@router.post("/payouts")
+async def bulk_payout(
+    bulk: BulkPayout,
+    idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)],
+) -> BulkPayoutResult:
+    return await idempotent.run(run_bulk_payout, bulk, idempotent)
+
+async def run_bulk_payout(bulk: BulkPayout, idempotent: idempotency.IdempotentRequest) -> BulkPayoutResult:
+    return BulkPayoutResult(payouts=await payouts.run_payouts(bulk.payouts, idempotent))
+
 
 @router.post("/{merchant_id}")
 async def create_wallet(wallet: CreatedWallet, merchant_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]):
     db_wallet = DBWallet(**wallet.dict(), merchant_id=merchant_id)
     session.add(db_wallet)
+    await session.flush()
+    if db_wallet.balance:
+        await ledger.record(
+            session, [ledger.entry(db_wallet.id, db_wallet.balance, LedgerKind.opening)]
+        )
     await session.commit()
     await session.refresh(db_wallet)
     return Wallet.from_orm(db_wallet)
@@ -27,49 +86,80 @@ async def get_wallet(wallet_id: int,session: Annotated[AsyncSession, Depends(mod
     db_wallet = await session.get(DBWallet, wallet_id)
     if not db_wallet:
         raise HTTPException(status_code=404, detail="Wallet not found")
+    if db_wallet.shard_count > 1:
+        return Wallet(
+            id=db_wallet.id,
+            shard_count=db_wallet.shard_count,
+            balance=await wallets.get_balance(session, wallet_id),
+        )
     return Wallet.from_orm(db_wallet)
 
 @router.put("/{wallet_id}")
 async def update_wallet(wallet_id: int, wallet: UpdatedWallet,session: Annotated[AsyncSession, Depends(models.get_session)]):
-    db_wallet = await session.get(DBWallet, wallet_id)
-    for key, value in wallet.dict(exclude_unset=True).items():
-        setattr(db_wallet, key, value)
-    session.add(db_wallet)
-    await session.commit()
-    await session.refresh(db_wallet)
-    return Wallet.from_orm(db_wallet)
+    if "balance" not in wallet.model_fields_set:
+        return await get_wallet(wallet_id, session)
 
-@router.put("/deposit/{wallet_id}")
-async def deposit_to_wallet(wallet_id: int, amount: float, session: Annotated[AsyncSession, Depends(models.get_session)]):
-    db_wallet = await session.get(DBWallet, wallet_id)
-    if not db_wallet:
+    db_wallet, shards = await wallets.lock(session, wallet_id)
+    if db_wallet is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    
-    db_wallet.balance += amount
-    session.add(db_wallet)
+
+    # the difference is booked as an adjustment, sharded wallets get the new
+    # balance spread over their shards
+    await wallets.spread(
+        session, wallet_id, db_wallet.shard_count, wallet.balance, len(shards)
+    )
+    await ledger.record(
+        session,
+        [
+            ledger.entry(
+                wallet_id,
+                wallet.balance - db_wallet.balance - sum(shards),
+                LedgerKind.adjustment,
+            )
+        ],
+    )
     await session.commit()
-    await session.refresh(db_wallet)
-    return Wallet.from_orm(db_wallet)
+    await catalog.catalog.invalidate(DBWallet, wallet_id)
+    return Wallet(id=wallet_id, shard_count=db_wallet.shard_count, balance=wallet.balance)
 
-@router.put("/withdraw/{wallet_id}")
-async def withdraw_from_wallet(wallet_id: int, amount: float, session: Annotated[AsyncSession, Depends(models.get_session)]):
-    db_wallet = await session.get(DBWallet, wallet_id)
-    if not db_wallet:
+@router.get("/{wallet_id}/balance")
+async def get_wallet_balance(
+    wallet_id: int,
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+    as_of: datetime | None = None,
+) -> WalletBalance:
+    # from the ledger: the latest snapshot plus the entries after it
+    if not await catalog.catalog.get_wallet(session, wallet_id):
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    balance = await ledger.get_balance(session, wallet_id, as_of)
+    return WalletBalance(wallet_id=wallet_id, balance=balance, as_of=as_of)
+
+@router.put("/{wallet_id}/shards")
+async def shard_wallet(
+    wallet_id: int,
+    shard_count: Annotated[int, Query(ge=1, le=settings.WALLET_MAX_SHARDS)],
+    session: Annotated[AsyncSession, Depends(models.get_session)],
+):
+    balance = await wallets.reshard(session, wallet_id, shard_count)
+    if balance is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    
-    if db_wallet.balance < amount:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
-    
-    db_wallet.balance -= amount
-    session.add(db_wallet)
     await session.commit()
-    await session.refresh(db_wallet)
-    return Wallet.from_orm(db_wallet)
+    await catalog.catalog.invalidate(DBWallet, wallet_id)
+    return Wallet(id=wallet_id, shard_count=shard_count, balance=balance)
+
+@router.put("/deposit/{wallet_id}")
+async def deposit_to_wallet(wallet_id: int, amount: Annotated[float, Query(gt=0)], idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)]) -> Wallet:
+    return await idempotent.run(coalescer.coalescer.deposit, wallet_id, amount)
+
+@router.put("/withdraw/{wallet_id}")
+async def withdraw_from_wallet(wallet_id: int, amount: Annotated[float, Query(gt=0)], idempotent: Annotated[idempotency.IdempotentRequest, Depends(idempotency.IdempotentRequest.from_request)]) -> Wallet:
+    return await idempotent.run(coalescer.coalescer.withdraw, wallet_id, amount)
 
 @router.delete("/{wallet_id}")
 async def delete_wallet(wallet_id: int, session: Annotated[AsyncSession, Depends(models.get_session)]):
     db_wallet = await session.get(DBWallet, wallet_id)
     await session.delete(db_wallet)
     await session.commit()
+    await catalog.catalog.invalidate(DBWallet, wallet_id)
     return {"message": "Wallet deleted successfully"}
 
@@ -1,4 +1,6 @@
-from datetime import datetime, timedelta
+import datetime
+import enum
+import uuid
 from typing import Any, Union
 
 import jwt
@@ -8,8 +10,48 @@ from . import config
 
 ALGORITHM = "HS256"
 
+# bump when the claim layout changes, older tokens are then re-checked
+# against the database instead of being trusted
+CLAIMS_VERSION = 1
+
 settings = config.get_settings()
 
+
+class Permission(enum.IntFlag):
+    READ = 1
+    PURCHASE = 2
+    MANAGE_MERCHANT = 4
+    MANAGE_USERS = 8
+
+
+ROLE_PERMISSIONS = {
+    "user": Permission.READ | Permission.PURCHASE,
+    "merchant": Permission.READ | Permission.PURCHASE | Permission.MANAGE_MERCHANT,
+    "admin": Permission.READ
+    | Permission.PURCHASE
+    | Permission.MANAGE_MERCHANT
+    | Permission.MANAGE_USERS,
+}
+
+
+def get_permissions(roles: list[str]) -> Permission:
+    permissions = Permission(0)
+    for role in roles:
+        permissions |= ROLE_PERMISSIONS.get(role, Permission(0))
+    return permissions
+
+
+def get_user_claims(user) -> dict:
+    return {
+        "sub": str(user.id),
+        "cv": CLAIMS_VERSION,
+        "st": user.status,
+        "rl": user.roles,
+        "pm": int(get_permissions(user.roles)),
+        "gen": user.token_generation,
+    }
+
+
 def create_access_token(data: dict, expires_delta: datetime.timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -18,6 +60,7 @@ def create_access_token(data: dict, expires_delta: datetime.timedelta | None = N
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
             minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES
         )
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -33,6 +76,6 @@ def create_refresh_token(
         expire = datetime.datetime.now(tz=datetime.timezone.utc) + datetime.timedelta(
             minutes=settings.REFRESH_TOKEN_EXPIRE_MINUTES
         )
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "typ": "refresh"})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
\ No newline at end of file
@@ -0,0 +1,267 @@
+import asyncio
+import collections
+import contextlib
+import time
+import urllib.parse
+from typing import Callable
+
+from . import config
+
+settings = config.get_settings()
+
+# A cache shared by every worker, on every node, plus a channel to tell all
+# of them about writes. SHARED_CACHE_URL picks the backend:
+#
+#   memory://                    one process, for a single worker and tests
+#   redis://host:port/db         any server speaking the Redis protocol
+#
+# Backends never raise for a missing key; a broken connection or an error
+# reply raises ConnectionError, and callers fall back to the database.
+
+MessageListener = Callable[[str], None]
+# told False when messages may have been missed, True once they flow again
+StateListener = Callable[[bool], None]
+
+
+class SharedCache:
+    async def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def publish(self, channel: str, message: str):
+        raise NotImplementedError
+
+    async def subscribe(
+        self, channel: str, on_message: MessageListener, on_state: StateListener
+    ):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class MemorySharedCache(SharedCache):
+    def __init__(self):
+        self.entries: dict[str, tuple[float, bytes]] = {}
+        self.subscribers: dict[str, list[MessageListener]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            self.entries.pop(key, None)
+            return None
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.entries[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+    async def publish(self, channel: str, message: str):
+        for on_message in self.subscribers.get(channel, []):
+            on_message(message)
+
+    async def subscribe(
+        self, channel: str, on_message: MessageListener, on_state: StateListener
+    ):
+        self.subscribers.setdefault(channel, []).append(on_message)
+        on_state(True)
+
+    async def close(self):
+        self.subscribers.clear()
+
+
+class RedisError(ConnectionError):
+    # an error reply such as -OOM or -READONLY, the server can not be used
+    # any more than a broken connection
+    pass
+
+
+def encode_command(*args) -> bytes:
+    parts = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+    return b"".join(parts)
+
+
+async def read_reply(reader: asyncio.StreamReader):
+    line = await reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("connection closed")
+    kind, data = line[:1], line[1:-2]
+    if kind == b"+":
+        return data.decode()
+    if kind == b"-":
+        return RedisError(data.decode())
+    if kind == b":":
+        return int(data)
+    if kind == b"$":
+        if int(data) < 0:
+            return None
+        value = await reader.readexactly(int(data) + 2)
+        return value[:-2]
+    if kind == b"*":
+        if int(data) < 0:
+            return None
+        return [await read_reply(reader) for _ in range(int(data))]
+    raise ConnectionError(f"unexpected reply {line!r}")
+
+
+class RedisConnection:
+    # commands are pipelined on one connection: each write queues a future
+    # and a reader task resolves them in order, so concurrent requests never
+    # wait for each other's round trip
+    def __init__(self, host: str, port: int, db: int):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.writer = None
+        self.pending: collections.deque[asyncio.Future] = collections.deque()
+        self.task = None
+        self.connecting = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connecting:
+            if self.writer is not None:
+                return
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            self.writer = writer
+            self.task = asyncio.create_task(self.read(reader, writer))
+            if self.db:
+                await self.send("SELECT", self.db)
+
+    async def read(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                reply = await read_reply(reader)
+                future = self.pending.popleft()
+                if not future.done():
+                    if isinstance(reply, RedisError):
+                        future.set_exception(reply)
+                    else:
+                        future.set_result(reply)
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, IndexError):
+            pass
+        finally:
+            if self.writer is writer:
+                self.writer = None
+            writer.close()
+            while self.pending:
+                future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+
+    async def send(self, *args):
+        if self.writer is None:
+            raise ConnectionError("connection closed")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(encode_command(*args))
+        return await future
+
+    async def execute(self, *args, timeout: float):
+        try:
+            if self.writer is None:
+                await asyncio.wait_for(self.connect(), timeout)
+            return await asyncio.wait_for(self.send(*args), timeout)
+        except asyncio.TimeoutError as e:
+            # a stalled server fails everything queued behind it, the next
+            # command reconnects
+            if self.writer is not None:
+                self.writer.close()
+            raise ConnectionError("timed out") from e
+        except OSError as e:
+            raise ConnectionError(str(e)) from e
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        if self.task is not None:
+            with contextlib.suppress(Exception):
+                await self.task
+            self.task = None
+
+
+class RedisSharedCache(SharedCache):
+    def __init__(self, url: str, timeout: float, reconnect_delay: float = 1.0):
+        parsed = urllib.parse.urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.strip("/") or 0)
+        self.timeout = timeout
+        self.reconnect_delay = reconnect_delay
+        self.connection = RedisConnection(self.host, self.port, self.db)
+        self.subscriptions: list[asyncio.Task] = []
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.connection.execute("GET", key, timeout=self.timeout)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.connection.execute(
+            "SET", key, value, "PX", max(1, int(ttl * 1000)), timeout=self.timeout
+        )
+
+    async def delete(self, key: str):
+        await self.connection.execute("DEL", key, timeout=self.timeout)
+
+    async def publish(self, channel: str, message: str):
+        await self.connection.execute("PUBLISH", channel, message, timeout=self.timeout)
+
+    async def subscribe(
+        self, channel: str, on_message: MessageListener, on_state: StateListener
+    ):
+        self.subscriptions.append(
+            asyncio.create_task(self.listen(channel, on_message, on_state))
+        )
+
+    async def listen(self, channel: str, on_message: MessageListener, on_state: StateListener):
+        # a subscribed connection only receives, so it is not shared with the
+        # commands. Messages sent while it was down are lost, which listeners
+        # are told about before it reconnects.
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+                writer.write(encode_command("SUBSCRIBE", channel))
+                reply = await read_reply(reader)
+                if not isinstance(reply, list) or reply[0] != b"subscribe":
+                    raise ConnectionError(f"unexpected reply {reply!r}")
+                on_state(True)
+                while True:
+                    reply = await read_reply(reader)
+                    if isinstance(reply, list) and reply[0] == b"message":
+                        on_message(reply[2].decode())
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                pass
+            finally:
+                on_state(False)
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def close(self):
+        for task in self.subscriptions:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self.subscriptions.clear()
+        await self.connection.close()
+
+
+def create_shared_cache(url: str | None) -> SharedCache | None:
+    if not url:
+        return None
+    scheme = urllib.parse.urlparse(url).scheme
+    if scheme == "memory":
+        return MemorySharedCache()
+    if scheme == "redis":
+        return RedisSharedCache(url, timeout=settings.SHARED_CACHE_TIMEOUT_SECONDS)
+    raise ValueError(f"unsupported shared cache {url}")
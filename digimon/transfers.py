@@ -0,0 +1,95 @@
+from sqlalchemy import insert
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from . import idempotency
+from . import ledger
+from . import models
+from . import wallets
+from .models.ledger_model import LedgerKind
+from .models.transfer_model import CreatedTransfer, DBTransfer, TransferResult
+
+
+async def transfer_many(
+    session: AsyncSession, transfers: list[CreatedTransfer]
+) -> list[TransferResult]:
+    # the caller commits. Every wallet is locked up front in id order, so
+    # transfers crossing in opposite directions queue behind each other
+    # instead of deadlocking
+    balances = {}
+    for wallet_id in sorted(
+        {transfer.from_wallet_id for transfer in transfers}
+        | {transfer.to_wallet_id for transfer in transfers}
+    ):
+        wallet, shards = await wallets.lock(session, wallet_id)
+        if wallet is not None:
+            balances[wallet_id] = [wallet.shard_count, wallet.balance + sum(shards), len(shards)]
+
+    results = []
+    for transfer in transfers:
+        result = TransferResult(**transfer.model_dump(), status="ok")
+        source = balances.get(transfer.from_wallet_id)
+        target = balances.get(transfer.to_wallet_id)
+        if source is None or target is None:
+            result.status = "not_found"
+        elif source[1] < transfer.amount:
+            result.status = "insufficient_funds"
+        else:
+            source[1] -= transfer.amount
+            target[1] += transfer.amount
+        results.append(result)
+
+    accepted = [result for result in results if result.status == "ok"]
+    if not accepted:
+        await session.rollback()
+        return results
+
+    changed = {result.from_wallet_id for result in accepted} | {
+        result.to_wallet_id for result in accepted
+    }
+    for wallet_id in sorted(changed):
+        shard_count, balance, current_shards = balances[wallet_id]
+        await wallets.spread(session, wallet_id, shard_count, balance, current_shards)
+
+    result = await session.exec(
+        insert(DBTransfer).returning(DBTransfer.id, sort_by_parameter_order=True),
+        params=[
+            dict(
+                from_wallet_id=result.from_wallet_id,
+                to_wallet_id=result.to_wallet_id,
+                amount=result.amount,
+            )
+            for result in accepted
+        ],
+    )
+    entries = []
+    for transfer, transfer_id in zip(accepted, result.scalars()):
+        transfer.transfer_id = transfer_id
+        entries.append(
+            ledger.entry(
+                transfer.from_wallet_id,
+                -transfer.amount,
+                LedgerKind.transfer,
+                transfer_id=transfer_id,
+            )
+        )
+        entries.append(
+            ledger.entry(
+                transfer.to_wallet_id,
+                transfer.amount,
+                LedgerKind.transfer,
+                transfer_id=transfer_id,
+            )
+        )
+    await ledger.record(session, entries)
+    return results
+
+
+async def run_transfers(transfers: list[CreatedTransfer], respond=None):
+    # respond turns the results into the response, which is stored with the
+    # transfers when the request has an Idempotency-Key
+    async with models.session_factory() as session:
+        results = await transfer_many(session, transfers)
+        response = results if respond is None else respond(results)
+        await idempotency.complete(session, response)
+        await session.commit()
+        return response
@@ -0,0 +1,249 @@
+import random
+
+from sqlalchemy import (
+    ColumnElement,
+    delete,
+    false,
+    func,
+    insert,
+    literal,
+    select,
+    true,
+    union_all,
+    update,
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from .models.wallet_model import DBWallet, DBWalletShard
+
+# A wallet with shard_count 1 keeps its balance on the wallets row. A sharded
+# wallet spreads it over wallet_shards rows and every write picks one of them
+# at random, so concurrent purchases lock different rows. The total balance is
+# always wallets.balance plus its shards.
+
+
+def pick_shard(wallet_id: int):
+    # the modulo is taken in SQL, so writers never read shard_count first
+    shard_count = (
+        select(DBWallet.shard_count)
+        .where(DBWallet.id == wallet_id)
+        .scalar_subquery()
+    )
+    return literal(random.getrandbits(30)) % shard_count
+
+
+def build_change(wallet_id: int, amount, name: str = "change", debit: bool = True):
+    # both layouts are tried in one statement and only one of them can match,
+    # rows of the other layout fail the where clause without being locked
+    if not isinstance(amount, ColumnElement):
+        amount = literal(amount)
+
+    wallet_where = [DBWallet.id == wallet_id, DBWallet.shard_count == 1]
+    shard_where = [
+        DBWalletShard.wallet_id == wallet_id,
+        DBWalletShard.shard == pick_shard(wallet_id),
+    ]
+    if debit:
+        wallet_where.append(DBWallet.balance >= amount)
+        shard_where.append(DBWalletShard.balance >= amount)
+        amount_change = -amount
+    else:
+        amount_change = amount
+
+    change_wallet = (
+        update(DBWallet)
+        .where(*wallet_where)
+        .values(balance=DBWallet.balance + amount_change)
+        .returning(
+            amount.label("amount"),
+            DBWallet.balance.label("balance"),
+            false().label("sharded"),
+        )
+        .cte(f"{name}_wallet")
+    )
+    change_shard = (
+        update(DBWalletShard)
+        .where(*shard_where)
+        .values(balance=DBWalletShard.balance + amount_change)
+        .returning(
+            amount.label("amount"),
+            DBWalletShard.balance.label("balance"),
+            true().label("sharded"),
+        )
+        .cte(f"{name}_shard")
+    )
+    return union_all(select(change_wallet), select(change_shard)).cte(name)
+
+
+def build_balance(wallet_id: int):
+    shards = (
+        select(func.coalesce(func.sum(DBWalletShard.balance), 0.0))
+        .where(DBWalletShard.wallet_id == wallet_id)
+        .scalar_subquery()
+    )
+    return select(DBWallet.balance + shards).where(DBWallet.id == wallet_id)
+
+
+async def get_balance(session: AsyncSession, wallet_id: int) -> float | None:
+    result = await session.exec(build_balance(wallet_id))
+    return result.scalar_one_or_none()
+
+
+async def change(
+    session: AsyncSession, wallet_id: int, amount: float, debit: bool
+) -> float | None:
+    # returns the new total balance, None when the wallet does not exist or
+    # does not have the funds
+    change = build_change(wallet_id, amount, debit=debit)
+    result = await session.exec(select(change.c.balance, change.c.sharded))
+    row = result.one_or_none()
+
+    if row is None:
+        if not debit:
+            return None
+        return await rebalance(session, wallet_id, amount)
+
+    if row.sharded:
+        return await get_balance(session, wallet_id)
+    return row.balance
+
+
+async def debit(session: AsyncSession, wallet_id: int, amount: float) -> float | None:
+    return await change(session, wallet_id, amount, debit=True)
+
+
+async def credit(session: AsyncSession, wallet_id: int, amount: float) -> float | None:
+    return await change(session, wallet_id, amount, debit=False)
+
+
+async def lock(session: AsyncSession, wallet_id: int):
+    # lock order is always the wallets row, then its shards by shard number.
+    # NO KEY UPDATE still lets purchases on other shards insert transactions,
+    # which take a key share lock on the wallets row for the foreign key
+    result = await session.exec(
+        select(DBWallet.shard_count, DBWallet.balance)
+        .where(DBWallet.id == wallet_id)
+        .with_for_update(key_share=True)
+    )
+    wallet = result.one_or_none()
+    if wallet is None:
+        return None, []
+
+    result = await session.exec(
+        select(DBWalletShard.balance)
+        .where(DBWalletShard.wallet_id == wallet_id)
+        .order_by(DBWalletShard.shard)
+        .with_for_update()
+    )
+    return wallet, result.scalars().all()
+
+
+async def lock_one(session: AsyncSession, wallet_id: int) -> tuple[int | None, float] | None:
+    # locks the one row a write of the wallet goes to, the wallets row of an
+    # unsharded wallet or a shard picked at random, and returns its shard
+    # (None for the wallets row) and balance. None when neither is found.
+    result = await session.exec(
+        select(DBWallet.balance)
+        .where(DBWallet.id == wallet_id, DBWallet.shard_count == 1)
+        .with_for_update(key_share=True)
+    )
+    balance = result.scalar_one_or_none()
+    if balance is not None:
+        return None, balance
+
+    result = await session.exec(
+        select(DBWalletShard.shard, DBWalletShard.balance)
+        .where(
+            DBWalletShard.wallet_id == wallet_id,
+            DBWalletShard.shard == pick_shard(wallet_id),
+        )
+        .with_for_update()
+    )
+    row = result.one_or_none()
+    return None if row is None else (row.shard, row.balance)
+
+
+async def set_one(session: AsyncSession, wallet_id: int, shard: int | None, balance: float):
+    # writes the row locked by lock_one
+    if shard is None:
+        await session.exec(
+            update(DBWallet).where(DBWallet.id == wallet_id).values(balance=balance)
+        )
+    else:
+        await session.exec(
+            update(DBWalletShard)
+            .where(DBWalletShard.wallet_id == wallet_id, DBWalletShard.shard == shard)
+            .values(balance=balance)
+        )
+
+
+async def spread(
+    session: AsyncSession,
+    wallet_id: int,
+    shard_count: int,
+    total: float,
+    current_shards: int,
+):
+    if shard_count > 1 and shard_count == current_shards:
+        # updated in place, writers waiting on a shard go on with its new balance
+        await session.exec(
+            update(DBWalletShard)
+            .where(DBWalletShard.wallet_id == wallet_id)
+            .values(balance=total / shard_count)
+        )
+        await session.exec(
+            update(DBWallet).where(DBWallet.id == wallet_id).values(balance=0.0)
+        )
+        return
+
+    if current_shards:
+        await session.exec(
+            delete(DBWalletShard).where(DBWalletShard.wallet_id == wallet_id)
+        )
+    if shard_count > 1:
+        await session.exec(
+            insert(DBWalletShard),
+            params=[
+                dict(wallet_id=wallet_id, shard=shard, balance=total / shard_count)
+                for shard in range(shard_count)
+            ],
+        )
+        total = 0.0
+
+    await session.exec(
+        update(DBWallet)
+        .where(DBWallet.id == wallet_id)
+        .values(shard_count=shard_count, balance=total)
+    )
+
+
+async def rebalance(session: AsyncSession, wallet_id: int, amount: float) -> float | None:
+    # the picked shard could not cover the amount, pool every shard and
+    # spread what is left over them evenly again
+    wallet, shards = await lock(session, wallet_id)
+    if wallet is None:
+        return None
+
+    total = wallet.balance + sum(shards)
+    if total < amount:
+        return None
+
+    await spread(
+        session, wallet_id, wallet.shard_count, total - amount, len(shards)
+    )
+    return total - amount
+
+
+async def reshard(
+    session: AsyncSession,
+    wallet_id: int,
+    shard_count: int,
+    balance: float | None = None,
+) -> float | None:
+    wallet, shards = await lock(session, wallet_id)
+    if wallet is None:
+        return None
+
+    total = wallet.balance + sum(shards) if balance is None else balance
+    await spread(session, wallet_id, shard_count, total, len(shards))
+    return total
@@ -0,0 +1,138 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import datetime
+import shutil
+import tempfile
+import time
+
+from sqlmodel import text
+
+from digimon import archive, config, models, partitions
+
+MONTHS = 12
+ROWS_PER_MONTH = 200_000
+WALLETS = 1000
+QUERIES = 50
+
+
+async def seed(session) -> list[int]:
+    user = models.DBUser(
+        username=f"bench-{time.time_ns()}",
+        email="bench@email.local",
+        first_name="bench",
+        last_name="bench",
+        password="bench",
+    )
+    merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+    session.add_all([user, merchant])
+    await session.commit()
+
+    result = await session.exec(
+        text(
+            "INSERT INTO wallets (balance, merchant_id) "
+            "SELECT 0, :merchant_id FROM generate_series(1, :wallets) RETURNING id"
+        ),
+        params=dict(merchant_id=merchant.id, wallets=WALLETS),
+    )
+    wallet_ids = sorted(result.scalars().all())
+
+    # the last MONTHS months, oldest first, each purchase by a random wallet
+    await session.exec(
+        text(
+            "INSERT INTO transactions (quantity, balance, wallet_id, created_at) "
+            "SELECT 1 + i % 3, 1.0, :first_wallet + (random() * (:wallets - 1))::int, "
+            "date_trunc('month', now()) - make_interval(months => :months - 1) "
+            "+ (i::float / :rows) * (now() - (date_trunc('month', now()) "
+            "- make_interval(months => :months - 1))) "
+            "FROM generate_series(0, :rows - 1) AS i"
+        ),
+        params=dict(
+            first_wallet=wallet_ids[0],
+            wallets=WALLETS,
+            months=MONTHS,
+            rows=MONTHS * ROWS_PER_MONTH,
+        ),
+    )
+    await session.commit()
+    return wallet_ids
+
+
+async def table_size(session) -> tuple[int, int, int]:
+    result = await session.exec(
+        text(
+            "SELECT sum(pg_table_size(relid)), sum(pg_indexes_size(relid)) "
+            "FROM pg_partition_tree('transactions') WHERE isleaf"
+        )
+    )
+    data, indexes = result.one()
+    result = await session.exec(text("SELECT count(*) FROM transactions"))
+    return data, indexes, result.scalar_one()
+
+
+async def wallet_history(session, wallet_id: int) -> int:
+    result = await session.exec(
+        text("SELECT * FROM transactions WHERE wallet_id = :wallet_id ORDER BY id"),
+        params=dict(wallet_id=wallet_id),
+    )
+    return len(result.all()) + len(list(archive.archives.wallet_transactions(wallet_id)))
+
+
+async def measure(label, session, wallet_ids):
+    data, indexes, rows = await table_size(session)
+    started = time.perf_counter()
+    for wallet_id in wallet_ids[:QUERIES]:
+        history = await wallet_history(session, wallet_id)
+    elapsed = (time.perf_counter() - started) / QUERIES
+    print(
+        f"{label:>15}: {rows:8} hot rows, table {data / 2**20:6.1f} MiB, "
+        f"indexes {indexes / 2**20:5.1f} MiB, "
+        f"{elapsed * 1000:6.2f} ms per wallet history ({history} rows)"
+    )
+
+
+async def run():
+    await models.create_all()
+    archive.archives.directory = tempfile.mkdtemp(prefix="bench-archive-")
+    # first only partitions, nothing is old enough to archive
+    archiver = partitions.Archiver(
+        interval=60, hot_months=MONTHS + 1, months_ahead=1, archives=archive.archives
+    )
+
+    async with models.session_factory() as session:
+        # partitions exist before the rows arrive, as they do in production
+        today = datetime.date.today().replace(day=1)
+        for i in range(MONTHS):
+            await partitions.create_partition(session, partitions.add_months(today, -i))
+        wallet_ids = await seed(session)
+        await archiver.run_once()
+        await session.exec(text("ANALYZE transactions"))
+        await session.commit()
+        await measure("before archival", session, wallet_ids)
+
+    # everything but the hot months goes to files
+    archiver.hot_months = 3
+    started = time.perf_counter()
+    archived = await archiver.run_once()
+    elapsed = time.perf_counter() - started
+
+    async with models.session_factory() as session:
+        await measure("after archival", session, wallet_ids)
+
+    size = sum(os.path.getsize(path) for path in archived)
+    print(
+        f"archived {len(archived)} months in {elapsed:.1f} s, "
+        f"{size / 2**20:.1f} MiB of files"
+    )
+
+    archive.archives.close()
+    shutil.rmtree(archive.archives.directory)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(run())
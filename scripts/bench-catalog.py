@@ -0,0 +1,81 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+import numpy as np
+from sqlmodel import text
+
+from digimon import catalog, config, models
+from digimon.models.item_models import DBItem, Item
+
+ITEMS = 100_000
+READS = 20_000
+
+
+async def seed() -> int:
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        session.add_all([user, merchant])
+        await session.commit()
+
+        result = await session.exec(
+            text(
+                "INSERT INTO items (name, description, price, merchant_id, user_id) "
+                "SELECT 'bench-' || i, 'a catalog item', i % 100, :merchant_id, :user_id "
+                "FROM generate_series(1, :items) AS i RETURNING id"
+            ).bindparams(merchant_id=merchant.id, user_id=user.id, items=ITEMS)
+        )
+        first = min(result.scalars().all())
+        await session.commit()
+        return first
+
+
+async def measure(label, get, item_ids):
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        for item_id in item_ids:
+            await get(session, item_id)
+            # every request uses its own session, nothing stays in the identity map
+            session.expunge_all()
+        elapsed = time.perf_counter() - started
+    print(f"{label:>12}: {elapsed / len(item_ids) * 1e6:8.1f} us per read")
+
+
+async def uncached(session: models.AsyncSession, item_id: int):
+    return Item.model_validate(await session.get(DBItem, item_id))
+
+
+async def main():
+    await models.create_all()
+    first = await seed()
+
+    # a few popular items get most of the reads
+    rng = np.random.default_rng(0)
+    item_ids = (first + (rng.zipf(1.2, READS) - 1) % ITEMS).tolist()
+
+    await measure("postgres", uncached, item_ids)
+    cache = catalog.Catalog(maxsize=ITEMS, maxbytes=64 * 1024 * 1024, ttl=60)
+    await measure("cached, cold", cache.get_item, item_ids)
+    await measure("cached, warm", cache.get_item, item_ids)
+    stats = cache.stats()
+    print(
+        f"hit rate {stats['hits'] / (stats['hits'] + stats['misses']):.3f}, "
+        f"{stats['size']} items in {stats['bytes'] / 1024 / 1024:.1f} MiB"
+    )
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
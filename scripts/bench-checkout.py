@@ -0,0 +1,65 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from httpx import AsyncClient, ASGITransport
+
+from digimon import config, main, models
+
+CARTS = 200
+CART_SIZE = 20
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        items = [
+            models.DBItem(name=f"bench-{i}", price=1.0, merchant=merchant, user=user)
+            for i in range(CART_SIZE)
+        ]
+        wallet = models.DBWallet(balance=float(CARTS * CART_SIZE * 2), merchant=merchant)
+        session.add_all([user, merchant, wallet, *items])
+        await session.commit()
+        return wallet.id, [item.id for item in items]
+
+
+async def main_():
+    app = main.create_app(config.get_settings())
+    await models.create_all()
+    wallet_id, item_ids = await seed()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://localhost"
+    ) as client:
+        started = time.perf_counter()
+        for _ in range(CARTS):
+            for item_id in item_ids:
+                await client.post(
+                    f"/transactions/{wallet_id}/{item_id}", json={"quantity": 1}
+                )
+        separate = time.perf_counter() - started
+
+        cart = {"lines": [{"item_id": item_id, "quantity": 1} for item_id in item_ids]}
+        started = time.perf_counter()
+        for _ in range(CARTS):
+            await client.post(f"/transactions/checkout/{wallet_id}", json=cart)
+        batched = time.perf_counter() - started
+
+    print(f"{CARTS} carts of {CART_SIZE} items")
+    print(f"separate calls: {separate:.2f}s ({CARTS / separate:.1f} carts/s)")
+    print(f"checkout      : {batched:.2f}s ({CARTS / batched:.1f} carts/s)")
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_())
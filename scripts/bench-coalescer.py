@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from digimon import config, models, purchase
+from digimon.coalescer import coalescer
+
+PURCHASES = 5000
+CONCURRENCY = 50
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        item = models.DBItem(name="bench", price=1.0, merchant=merchant, user=user)
+        wallet = models.DBWallet(balance=float(PURCHASES), merchant=merchant)
+        session.add_all([user, merchant, item, wallet])
+        await session.commit()
+        return wallet.id, item.id
+
+
+async def direct_purchase(wallet_id, item_id, quantity):
+    async with models.session_factory() as session:
+        return await purchase.purchase(session, wallet_id, item_id, quantity)
+
+
+async def run(label, purchase_func):
+    wallet_id, item_id = await seed()
+    queue = asyncio.Queue()
+    for _ in range(PURCHASES):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            try:
+                await purchase_func(wallet_id, item_id, 1)
+            except HTTPException:
+                pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+
+    async with models.session_factory() as session:
+        wallet = await session.get(models.DBWallet, wallet_id)
+        print(
+            f"{label:>10}: {PURCHASES / elapsed:8.1f} purchases/s, "
+            f"final balance {wallet.balance} (expected 0.0)"
+        )
+
+
+async def main():
+    await models.create_all()
+    await run("direct", direct_purchase)
+    await run("coalesced", coalescer.purchase)
+
+    stats = coalescer.stats()
+    print(
+        f"batches {stats['batches']}, avg batch size {stats['avg_batch_size']:.1f}, "
+        f"max batch size {stats['max_batch_size']}, "
+        f"avg added wait {stats['avg_wait_time'] * 1000:.2f} ms, "
+        f"max added wait {stats['max_wait_time'] * 1000:.2f} ms"
+    )
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
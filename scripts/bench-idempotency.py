@@ -0,0 +1,85 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+import uuid
+
+from httpx import ASGITransport, AsyncClient
+
+from digimon import config, main, models
+from digimon.idempotency import store
+
+LOOKUPS = 100_000
+REQUESTS = 1000
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        wallet = models.DBWallet(balance=0.0, merchant=merchant)
+        session.add_all([user, merchant, wallet])
+        await session.commit()
+        return wallet.id
+
+
+async def not_called():
+    raise AssertionError("a cache hit must not run the request again")
+
+
+async def run():
+    app = main.create_app(config.get_settings())
+    await models.create_all()
+    wallet_id = await seed()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        url = f"/wallets/deposit/{wallet_id}"
+        key = uuid.uuid4().hex
+        response = await client.put(url, params={"amount": 1}, headers={"Idempotency-Key": key})
+        fingerprint = store.cache.get(key).fingerprint
+
+        started = time.perf_counter()
+        for _ in range(LOOKUPS):
+            await store.execute(key, fingerprint, not_called)
+        elapsed = (time.perf_counter() - started) / LOOKUPS
+        print(f"cache hit lookup: {elapsed * 1_000_000:.1f} us")
+
+        async def measure(label, headers):
+            started = time.perf_counter()
+            for _ in range(REQUESTS):
+                await client.get(f"/wallets/{wallet_id}")
+            baseline = (time.perf_counter() - started) / REQUESTS
+
+            started = time.perf_counter()
+            for _ in range(REQUESTS):
+                response = await client.put(url, params={"amount": 1}, headers=headers)
+            elapsed = (time.perf_counter() - started) / REQUESTS
+            print(
+                f"{label:>22}: {elapsed * 1000:6.2f} ms per request "
+                f"(GET /wallets/{{id}} {baseline * 1000:.2f} ms)"
+            )
+            return response
+
+        await measure("replayed from cache", {"Idempotency-Key": key})
+        store.cache.clear()
+        store.cache.maxsize = 0
+        await measure("replayed from table", {"Idempotency-Key": key})
+
+        response = await client.get(f"/wallets/{wallet_id}")
+        print(f"final balance {response.json()['balance']} (expected 1.0)")
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import time
+import tracemalloc
+
+import numpy as np
+
+from digimon import leaderboard
+
+ITEMS = 1_000_000
+MERCHANTS = 1000
+SALES = 10_000_000
+CHUNK = 100_000
+K = 10
+WIDTHS = [1 << 16, 1 << 18, 1 << 20]
+DEPTH = 4
+
+
+def run():
+    # item popularity follows a Zipf law, each merchant owns a slice of items
+    rng = np.random.default_rng(1)
+    item_ids = (rng.zipf(1.2, size=SALES * 2) - 1)
+    item_ids = item_ids[item_ids < ITEMS][:SALES]
+    item_ids = rng.permutation(ITEMS)[item_ids]
+    quantities = rng.integers(1, 4, size=len(item_ids))
+    merchant_ids = item_ids % MERCHANTS
+
+    exact = np.bincount(item_ids, weights=quantities, minlength=ITEMS).astype(np.int64)
+    exact_bytes = len(exact) * (28 + 28 + 8)  # a dict of int -> int, roughly
+
+    for width in WIDTHS:
+        tracemalloc.start()
+        board = leaderboard.Leaderboard(size=100, width=width, depth=DEPTH)
+        started = time.perf_counter()
+        for i in range(0, len(item_ids), CHUNK):
+            board.add(
+                list(
+                    zip(
+                        merchant_ids[i : i + CHUNK].tolist(),
+                        item_ids[i : i + CHUNK].tolist(),
+                        quantities[i : i + CHUNK].tolist(),
+                    )
+                )
+            )
+        elapsed = time.perf_counter() - started
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        recall = []
+        errors = []
+        top_time = 0.0
+        for merchant_id in range(MERCHANTS):
+            started = time.perf_counter()
+            top = board.top(merchant_id, K)
+            top_time += time.perf_counter() - started
+
+            owned = np.arange(merchant_id, ITEMS, MERCHANTS)
+            true_top = set(owned[np.argsort(-exact[owned], kind="stable")[:K]].tolist())
+            recall.append(len(true_top & {item_id for item_id, _ in top}) / K)
+            errors.extend(
+                (estimate - exact[item_id]) / exact[item_id] for item_id, estimate in top
+            )
+        top_time /= MERCHANTS
+
+        print(
+            f"width {width:>8}: sketch {board.sketch.nbytes / 2**20:4.0f} MiB, "
+            f"total {memory / 2**20:6.1f} MiB, "
+            f"{len(item_ids) / elapsed:9.0f} sales/s, "
+            f"top-{K} {top_time * 1e6:5.0f} us, "
+            f"recall {np.mean(recall):.3f}, "
+            f"mean overcount {np.mean(errors) * 100:5.2f}%"
+        )
+    print(f"exact counters for {ITEMS} items: about {exact_bytes / 2**20:.0f} MiB")
+
+
+if __name__ == "__main__":
+    run()
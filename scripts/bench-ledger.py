@@ -0,0 +1,67 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from sqlmodel import text
+
+from digimon import config, ledger, models
+
+ENTRIES = 200_000
+QUERIES = 200
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        wallet = models.DBWallet(balance=0.0, merchant=merchant)
+        session.add_all([user, merchant, wallet])
+        await session.commit()
+
+        # one entry per second of history, alternating deposits and withdrawals
+        await session.exec(
+            text(
+                "INSERT INTO ledger_entries (wallet_id, amount, kind, created_at) "
+                "SELECT :wallet_id, CASE WHEN i % 2 = 0 THEN 2.0 ELSE -1.0 END, "
+                "'deposit', now() - make_interval(secs => :entries - i) "
+                "FROM generate_series(1, :entries) AS i"
+            ).bindparams(wallet_id=wallet.id, entries=ENTRIES)
+        )
+        await session.commit()
+        return wallet.id
+
+
+async def measure(label, wallet_id):
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        for _ in range(QUERIES):
+            balance = await ledger.get_balance(session, wallet_id)
+        elapsed = (time.perf_counter() - started) / QUERIES
+    print(f"{label:>16}: {elapsed * 1000:7.2f} ms per balance, balance {balance:.1f}")
+
+
+async def main():
+    await models.create_all()
+    wallet_id = await seed()
+
+    await measure("no snapshot", wallet_id)
+    async with models.session_factory() as session:
+        await ledger.compact(session, wallet_id)
+    await measure("after compaction", wallet_id)
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import datetime
+import random
+import time
+
+from sqlmodel import select, text, update
+
+from digimon import config, logins, models
+from digimon.routes.authentication import build_login_lookup
+
+USERS = 100_000
+LOGINS = 2000
+
+
+async def seed() -> str:
+    prefix = f"bench-{time.time_ns()}-"
+    async with models.session_factory() as session:
+        await session.exec(
+            text(
+                "INSERT INTO users (email, username, first_name, last_name, password, status, "
+                "roles, token_generation, register_date, updated_date) "
+                "SELECT :prefix || i || '@email.local', :prefix || i, 'bench', 'bench', 'x', "
+                "'active', '[\"user\"]', 0, now(), now() "
+                "FROM generate_series(1, :users) AS i"
+            ).bindparams(prefix=prefix, users=USERS)
+        )
+        await session.commit()
+        await session.exec(text("ANALYZE users"))
+    return prefix
+
+
+async def sequential(session: models.AsyncSession, username: str):
+    # what /token did before: username, then email, then stamp the login
+    result = await session.exec(select(models.DBUser).where(models.DBUser.username == username))
+    user = result.one_or_none()
+    if not user:
+        result = await session.exec(select(models.DBUser).where(models.DBUser.email == username))
+        user = result.one_or_none()
+    user.last_login_date = datetime.datetime.now()
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+
+
+async def single(session: models.AsyncSession, username: str):
+    result = await session.exec(build_login_lookup(username))
+    user = result.one()
+    logins.recorder.record(user.id)
+    await session.commit()
+
+
+async def measure(label, login, usernames):
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        for username in usernames:
+            await login(session, username)
+        flushed = await logins.recorder.flush()
+        elapsed = time.perf_counter() - started
+    print(
+        f"{label:>12}: {elapsed / len(usernames) * 1000:6.3f} ms per login"
+        f" ({flushed} dates flushed in one UPDATE)"
+    )
+
+
+async def main():
+    await models.create_all()
+    prefix = await seed()
+    usernames = [
+        f"{prefix}{random.randint(1, USERS)}@email.local" for _ in range(LOGINS)
+    ]
+    await measure("sequential", sequential, usernames)
+    await measure("single", single, usernames)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
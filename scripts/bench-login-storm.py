@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import statistics
+import time
+
+from httpx import AsyncClient, ASGITransport
+from sqlmodel import select
+
+from digimon import config, hashing, main, models
+
+LOGINS = 64
+LOGIN_CONCURRENCY = 16
+
+
+async def inline_run(func, *args):
+    # what DBUser did before hashing.py, bcrypt on the event loop thread
+    return func(*args)
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = (
+            await session.exec(
+                select(models.DBUser).where(models.DBUser.username == "bench-login")
+            )
+        ).one_or_none()
+        if not user:
+            user = models.DBUser(
+                username="bench-login",
+                email="bench-login@email.local",
+                first_name="bench",
+                last_name="bench",
+                password="",
+            )
+        await user.set_password("bench-password")
+        session.add(user)
+        await session.commit()
+
+
+async def run(label, client):
+    done = asyncio.Event()
+
+    async def login_worker(count):
+        for _ in range(count):
+            await client.post(
+                "/token", data={"username": "bench-login", "password": "bench-password"}
+            )
+
+    async def probe():
+        # a cheap route that never touches bcrypt or the database, sent every
+        # 10 ms; latency counts from when the request was due, so time the
+        # event loop spends blocked before serving it is included
+        latencies = []
+        due = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            await client.get("/metrics/pool")
+            latencies.append(time.perf_counter() - due)
+            due = max(due + 0.01, time.perf_counter())
+        return latencies
+
+    probe_task = asyncio.create_task(probe())
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[login_worker(LOGINS // LOGIN_CONCURRENCY) for _ in range(LOGIN_CONCURRENCY)]
+    )
+    elapsed = time.perf_counter() - started
+    done.set()
+    latencies = sorted(await probe_task)
+
+    print(
+        f"{label:>8}: logins {LOGINS / elapsed:6.1f}/s, probe latency "
+        f"p50 {statistics.median(latencies) * 1000:7.2f} ms, "
+        f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.2f} ms"
+    )
+
+
+async def main_():
+    app = main.create_app(config.get_settings())
+    await models.create_all()
+    await seed()
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://localhost"
+    ) as client:
+        run_in_pool = hashing.hasher.run
+        hashing.hasher.run = inline_run
+        await run("inline", client)
+        hashing.hasher.run = run_in_pool
+        await run("pool", client)
+
+    print("hasher", hashing.hasher.stats())
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    asyncio.run(main_())
@@ -0,0 +1,70 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from sqlmodel import text
+
+from digimon import config, models, payouts
+from digimon.models.wallet_model import Payout
+
+
+async def seed(count):
+    async with models.session_factory() as session:
+        result = await session.exec(
+            text(
+                "INSERT INTO wallets (balance, shard_count) "
+                "SELECT 100.0, 1 FROM generate_series(1, :count) RETURNING id"
+            ).bindparams(count=count)
+        )
+        wallet_ids = result.scalars().all()
+        await session.commit()
+        return wallet_ids
+
+
+async def one_by_one(wallet_ids):
+    # what calling PUT /wallets/withdraw/{wallet_id} per wallet used to do
+    async with models.session_factory() as session:
+        for wallet_id in wallet_ids:
+            db_wallet = await session.get(models.DBWallet, wallet_id)
+            db_wallet.balance -= 10.0
+            session.add(db_wallet)
+            await session.commit()
+            await session.refresh(db_wallet)
+
+
+async def bulk(wallet_ids):
+    # every third wallet asks for more than it has
+    results = await payouts.run_payouts(
+        [
+            Payout(wallet_id=wallet_id, amount=1000.0 if i % 3 == 0 else 10.0)
+            for i, wallet_id in enumerate(wallet_ids)
+        ]
+    )
+    assert sum(result.status == "insufficient_funds" for result in results) == (
+        len(wallet_ids) + 2
+    ) // 3
+
+
+async def measure(label, func, count):
+    wallet_ids = await seed(count)
+    started = time.perf_counter()
+    await func(wallet_ids)
+    elapsed = time.perf_counter() - started
+    print(f"{label:>12} {count:>7,} wallets: {elapsed:7.2f} s, {count / elapsed:9.1f} wallets/s")
+
+
+async def main():
+    await models.create_all()
+    await measure("one by one", one_by_one, 10_000)
+    await measure("bulk", bulk, 10_000)
+    await measure("bulk", bulk, 100_000)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
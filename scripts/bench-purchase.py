@@ -0,0 +1,91 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from digimon import config, models, purchase
+
+PURCHASES = 5000
+CONCURRENCY = 50
+
+
+async def legacy_purchase(session, wallet_id, item_id, quantity):
+    # the read-modify-write path create_transaction used before purchase.py
+    db_wallet = await session.get(models.DBWallet, wallet_id)
+    db_item = await session.get(models.DBItem, item_id)
+    if not db_wallet or not db_item:
+        raise HTTPException(status_code=404, detail="Wallet or Item not found")
+
+    balance = db_item.price * quantity
+    if db_wallet.balance < balance:
+        raise HTTPException(status_code=400, detail="Insufficient balance")
+
+    db_wallet.balance -= balance
+    db_transaction = models.DBTransaction(
+        quantity=quantity, wallet_id=wallet_id, item_id=item_id, balance=balance
+    )
+    session.add(db_transaction)
+    await session.commit()
+    await session.refresh(db_transaction)
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        item = models.DBItem(name="bench", price=1.0, merchant=merchant, user=user)
+        wallet = models.DBWallet(balance=float(PURCHASES), merchant=merchant)
+        session.add_all([user, merchant, item, wallet])
+        await session.commit()
+        return wallet.id, item.id
+
+
+async def run(label, purchase_func):
+    wallet_id, item_id = await seed()
+    async_session = models.session_factory
+    queue = asyncio.Queue()
+    for _ in range(PURCHASES):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            async with async_session() as session:
+                try:
+                    await purchase_func(session, wallet_id, item_id, 1)
+                except HTTPException:
+                    pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+
+    async with async_session() as session:
+        wallet = await session.get(models.DBWallet, wallet_id)
+        print(
+            f"{label:>8}: {PURCHASES / elapsed:8.1f} purchases/s, "
+            f"final balance {wallet.balance} (expected 0.0)"
+        )
+
+
+async def main():
+    await models.create_all()
+    await run("legacy", legacy_purchase)
+    await run("atomic", purchase.purchase)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import random
+import time
+
+import numpy as np
+from httpx import ASGITransport, AsyncClient
+
+from digimon import config, main, rates
+from digimon.models.exchange_model import Currency
+
+SIZE = 100_000
+ROUNDS = 20
+
+
+def python_loop(snapshot, amounts, from_currencies, to_currencies):
+    return [
+        amount * snapshot.rate(Currency(from_currency), Currency(to_currency))
+        for amount, from_currency, to_currency in zip(
+            amounts, from_currencies, to_currencies
+        )
+    ]
+
+
+def vectorized(snapshot, amounts, from_currencies, to_currencies):
+    return snapshot.convert(
+        np.asarray(amounts, dtype=np.float64),
+        rates.currency_indexes(from_currencies),
+        rates.currency_indexes(to_currencies),
+    ).tolist()
+
+
+def measure(label, fn, *args):
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn(*args)
+    elapsed = (time.perf_counter() - started) / ROUNDS
+    print(f"{label:>12}: {elapsed * 1000:8.2f} ms per {SIZE:,} conversions")
+    return elapsed
+
+
+async def run():
+    codes = [currency.value for currency in rates.CURRENCIES]
+    amounts = [random.uniform(1, 1000) for _ in range(SIZE)]
+    from_currencies = random.choices(codes, k=SIZE)
+    to_currencies = random.choices(codes, k=SIZE)
+    snapshot = rates.provider.snapshot
+
+    assert np.allclose(
+        python_loop(snapshot, amounts, from_currencies, to_currencies),
+        vectorized(snapshot, amounts, from_currencies, to_currencies),
+    )
+
+    loop = measure("python loop", python_loop, snapshot, amounts, from_currencies, to_currencies)
+    numpy = measure("numpy", vectorized, snapshot, amounts, from_currencies, to_currencies)
+    print(f"speedup: {loop / numpy:.1f}x")
+
+    payload = {
+        "amounts": amounts,
+        "from_currencies": from_currencies,
+        "to_currencies": to_currencies,
+    }
+    app = main.create_app(config.get_settings())
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        started = time.perf_counter()
+        for _ in range(5):
+            response = await client.post("/exchange/quote", json=payload)
+            assert response.status_code == 200
+        elapsed = (time.perf_counter() - started) / 5
+    print(f"POST /exchange/quote: {elapsed * 1000:.1f} ms per {SIZE:,} amounts")
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,105 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from sqlalchemy import Date, cast, func
+from sqlmodel import select, text
+
+from digimon import config, models, reports
+from digimon.models.report_model import DBRevenueRollup
+from digimon.models.transaction_model import DBTransaction
+
+TRANSACTIONS = 1_000_000
+ITEMS = 100
+DAYS = 90
+QUERIES = 20
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        wallet = models.DBWallet(balance=0.0, merchant=merchant)
+        items = [
+            models.DBItem(name=f"bench-{i}", price=1.0 + i, merchant=merchant, user=user)
+            for i in range(ITEMS)
+        ]
+        session.add_all([user, merchant, wallet, *items])
+        await session.commit()
+
+        # purchases spread over the last DAYS days
+        await session.exec(
+            text(
+                "INSERT INTO transactions "
+                "(quantity, balance, wallet_id, item_id, merchant_id, created_at) "
+                "SELECT 1 + i % 3, 1.0, :wallet_id, :first_item + i % :items, "
+                ":merchant_id, now() - make_interval(days => i % :days) "
+                "FROM generate_series(1, :transactions) AS i"
+            ).bindparams(
+                wallet_id=wallet.id,
+                first_item=items[0].id,
+                items=ITEMS,
+                merchant_id=merchant.id,
+                days=DAYS,
+                transactions=TRANSACTIONS,
+            )
+        )
+        await session.commit()
+
+        started = time.perf_counter()
+        await reports.rebuild(session)
+        print(f"rebuild from {TRANSACTIONS} transactions: {time.perf_counter() - started:.2f} s")
+        return merchant.id
+
+
+async def measure(label, statement):
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        for _ in range(QUERIES):
+            result = await session.exec(statement)
+            rows = result.all()
+        elapsed = (time.perf_counter() - started) / QUERIES
+    print(f"{label:>24}: {elapsed * 1000:8.2f} ms per report, {len(rows)} rows")
+
+
+async def main():
+    await models.create_all()
+    merchant_id = await seed()
+
+    day = cast(DBTransaction.created_at, Date)
+    await measure(
+        "daily, transactions scan",
+        select(day, func.count(), func.sum(DBTransaction.quantity), func.sum(DBTransaction.balance))
+        .where(DBTransaction.merchant_id == merchant_id)
+        .group_by(day),
+    )
+    await measure("daily, rollups", reports.build_report(merchant_id, DBRevenueRollup.day))
+    await measure(
+        "items, transactions scan",
+        select(
+            DBTransaction.item_id,
+            func.count(),
+            func.sum(DBTransaction.quantity),
+            func.sum(DBTransaction.balance),
+        )
+        .where(DBTransaction.merchant_id == merchant_id)
+        .group_by(DBTransaction.item_id),
+    )
+    await measure("items, rollups", reports.build_report(merchant_id, DBRevenueRollup.item_id))
+
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
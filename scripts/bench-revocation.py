@@ -0,0 +1,60 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import datetime
+import time
+import tracemalloc
+import types
+import uuid
+
+from digimon import deps, security
+from digimon.revocation import RevocationList, revocations
+
+REVOKED = 1_000_000
+CHECKS = 100_000
+
+
+class BenchUser:
+    id = 1
+    status = "active"
+    roles = ["user"]
+    token_generation = 0
+
+
+async def run(label, token):
+    started = time.perf_counter()
+    for _ in range(CHECKS):
+        await deps.get_token_payload(token)
+    elapsed = time.perf_counter() - started
+    print(f"{label:>24}: {elapsed / CHECKS * 1_000_000:6.2f} us/request")
+
+
+async def main():
+    token = security.create_access_token(security.get_user_claims(BenchUser()))
+    await run("empty revocation list", token)
+
+    expires_at = datetime.datetime.now() + datetime.timedelta(hours=1)
+    tracemalloc.start()
+    filled = RevocationList()
+    for i in range(REVOKED):
+        filled.add(
+            types.SimpleNamespace(
+                id=i + 1,
+                jti=uuid.uuid4().hex,
+                generation=None,
+                user_id=i % 1000 + 2,
+                expires_at=expires_at,
+            )
+        )
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    revocations.__dict__.update(filled.__dict__)
+    await run(f"{REVOKED:,} revoked tokens", token)
+    print(f"revocation list memory: {memory / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,54 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from sqlmodel import text
+
+from digimon import config, models
+
+REQUESTS = 5000
+CONCURRENCY = 20
+
+
+async def per_request_factory():
+    # what get_session did before the factory was created once in init_db
+    async_session = models.sessionmaker(
+        models.engine, class_=models.AsyncSession, expire_on_commit=False
+    )
+    async with async_session() as session:
+        yield session
+
+
+async def run(label, get_session):
+    queue = asyncio.Queue()
+    for _ in range(REQUESTS):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            async for session in get_session():
+                await session.exec(text("SELECT 1"))
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+    print(
+        f"{label:>20}: {elapsed / REQUESTS * 1_000_000:8.1f} us/request, "
+        f"pool {models.pool_status()}"
+    )
+
+
+async def main():
+    await run("sessionmaker/request", per_request_factory)
+    await run("shared factory", models.get_session)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
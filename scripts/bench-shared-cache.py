@@ -0,0 +1,92 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+import numpy as np
+from sqlmodel import text
+
+from digimon import catalog, config, models, shared_cache
+
+ITEMS = 50_000
+READS = 40_000
+WORKERS = 16
+# each worker's local tier only fits a slice of the hot set
+LOCAL_SIZE = 1000
+
+
+async def seed() -> int:
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        session.add_all([user, merchant])
+        await session.commit()
+
+        result = await session.exec(
+            text(
+                "INSERT INTO items (name, price, merchant_id, user_id) "
+                "SELECT 'bench-' || i, i % 100, :merchant_id, :user_id "
+                "FROM generate_series(1, :items) AS i RETURNING id"
+            ).bindparams(merchant_id=merchant.id, user_id=user.id, items=ITEMS)
+        )
+        first = min(result.scalars().all())
+        await session.commit()
+        return first
+
+
+async def measure(label, shared, item_ids):
+    workers = [
+        catalog.Catalog(
+            maxsize=LOCAL_SIZE, maxbytes=64 * 1024 * 1024, ttl=60, max_staleness=5, shared=shared
+        )
+        for _ in range(WORKERS)
+    ]
+    for worker in workers:
+        await worker.start()
+
+    async with models.session_factory() as session:
+        started = time.perf_counter()
+        # requests are spread over the workers like a load balancer would
+        for i, item_id in enumerate(item_ids):
+            await workers[i % WORKERS].get_item(session, item_id)
+            session.expunge_all()
+        elapsed = time.perf_counter() - started
+
+    stats = [worker.stats() for worker in workers]
+    hits = sum(stat["hits"] for stat in stats)
+    shared_hits = sum(stat["shared_hits"] for stat in stats)
+    database = len(item_ids) - hits - shared_hits
+    print(
+        f"{label:>14}: local hits {hits / len(item_ids):.3f}, shared hits "
+        f"{shared_hits / len(item_ids):.3f}, database reads {database:6d}, "
+        f"{elapsed / len(item_ids) * 1e6:6.1f} us per read"
+    )
+    for worker in workers:
+        await worker.stop()
+
+
+async def main():
+    await models.create_all()
+    first = await seed()
+
+    rng = np.random.default_rng(0)
+    item_ids = (first + (rng.zipf(1.2, READS) - 1) % ITEMS).tolist()
+
+    await measure("local only", None, item_ids)
+    url = os.environ.get("SHARED_CACHE_URL", "memory://")
+    await measure(url.split(":")[0] + " shared", shared_cache.create_shared_cache(url), item_ids)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    models.init_db(settings)
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import random
+import time
+
+from sqlalchemy.exc import DBAPIError
+
+from digimon import config, models, transfers, wallets
+from digimon.models.transfer_model import CreatedTransfer
+
+TRANSFERS = 1000
+CONCURRENCY = 50
+WALLETS = 4
+
+
+async def seed():
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        db_wallets = [
+            models.DBWallet(balance=float(TRANSFERS), merchant=merchant)
+            for _ in range(WALLETS)
+        ]
+        session.add_all([user, merchant, *db_wallets])
+        await session.commit()
+        return [wallet.id for wallet in db_wallets]
+
+
+async def unordered_transfer(transfer):
+    # locks the wallets in request order, what wrapping withdraw and deposit
+    # in one transaction amounts to
+    async with models.session_factory() as session:
+        source, source_shards = await wallets.lock(session, transfer.from_wallet_id)
+        target, target_shards = await wallets.lock(session, transfer.to_wallet_id)
+        await wallets.spread(session, transfer.from_wallet_id, 1, source.balance - transfer.amount, 0)
+        await wallets.spread(session, transfer.to_wallet_id, 1, target.balance + transfer.amount, 0)
+        await session.commit()
+
+
+async def ordered_transfer(transfer):
+    await transfers.run_transfers([transfer])
+
+
+async def run(label, transfer_func):
+    wallet_ids = await seed()
+    queue = asyncio.Queue()
+    for _ in range(TRANSFERS):
+        from_wallet_id, to_wallet_id = random.sample(wallet_ids, 2)
+        queue.put_nowait(
+            CreatedTransfer(from_wallet_id=from_wallet_id, to_wallet_id=to_wallet_id, amount=1)
+        )
+    deadlocks = 0
+
+    async def worker():
+        nonlocal deadlocks
+        while not queue.empty():
+            transfer = queue.get_nowait()
+            try:
+                await transfer_func(transfer)
+            except DBAPIError as error:
+                if "deadlock" not in str(error):
+                    raise
+                deadlocks += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+
+    async with models.session_factory() as session:
+        total = 0.0
+        for wallet_id in wallet_ids:
+            total += await wallets.get_balance(session, wallet_id)
+    print(
+        f"{label:>10}: {TRANSFERS / elapsed:8.1f} transfers/s, {deadlocks} deadlocks, "
+        f"total balance {total} (expected {float(TRANSFERS * WALLETS)})"
+    )
+
+
+async def main():
+    await models.create_all()
+    await run("unordered", unordered_transfer)
+    await run("ordered", ordered_transfer)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    settings.DB_POOL_SIZE = CONCURRENCY
+    models.init_db(settings)
+    asyncio.run(main())
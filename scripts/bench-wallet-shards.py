@@ -0,0 +1,84 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+
+from fastapi import HTTPException
+
+from digimon import config, models, purchase, wallets
+from digimon.coalescer import coalescer
+
+PURCHASES = 5000
+CONCURRENCY = 50
+
+
+async def seed(shard_count):
+    async with models.session_factory() as session:
+        user = models.DBUser(
+            username=f"bench-{time.time_ns()}",
+            email="bench@email.local",
+            first_name="bench",
+            last_name="bench",
+            password="bench",
+        )
+        merchant = models.DBMerchant(name="bench", tax_id="bench", user=user)
+        item = models.DBItem(name="bench", price=1.0, merchant=merchant, user=user)
+        wallet = models.DBWallet(balance=float(PURCHASES), merchant=merchant)
+        session.add_all([user, merchant, item, wallet])
+        await session.commit()
+
+        await wallets.reshard(session, wallet.id, shard_count)
+        await session.commit()
+        return wallet.id, item.id
+
+
+async def atomic_purchase(wallet_id, item_id, quantity):
+    async with models.session_factory() as session:
+        return await purchase.purchase(session, wallet_id, item_id, quantity)
+
+
+async def run(label, shard_count, purchase_func):
+    wallet_id, item_id = await seed(shard_count)
+    async_session = models.session_factory
+    queue = asyncio.Queue()
+    for _ in range(PURCHASES):
+        queue.put_nowait(None)
+
+    async def worker():
+        while not queue.empty():
+            queue.get_nowait()
+            try:
+                await purchase_func(wallet_id, item_id, 1)
+            except HTTPException:
+                pass
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    elapsed = time.perf_counter() - started
+
+    async with async_session() as session:
+        balance = await wallets.get_balance(session, wallet_id)
+        print(
+            f"{label:>10} {shard_count:>3} shards: {PURCHASES / elapsed:8.1f} purchases/s, "
+            f"final balance {balance:.1f} (expected 0.0)"
+        )
+
+
+async def main():
+    await models.create_all()
+    # atomic is the single statement purchase, coalesced the path of the
+    # routes, which batches writes to a wallet that is already being written
+    for shard_count in (1, 16):
+        await run("atomic", shard_count, atomic_purchase)
+        await run("coalesced", shard_count, coalescer.purchase)
+    await models.close_session()
+
+
+if __name__ == "__main__":
+    settings = config.get_settings()
+    # one connection per worker, so waits are on row locks and not the pool
+    settings.DB_POOL_SIZE = CONCURRENCY
+    models.init_db(settings)
+    asyncio.run(main())
@@ -32,6 +32,19 @@ SettingsTesting.model_config = SettingsConfigDict(
 )
 
 
+def pytest_collection_modifyitems(items):
+    # share one event loop with the session scoped engine and session fixtures
+    session_loop = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if pytest_asyncio.is_async_test(item):
+            item.add_marker(session_loop, append=False)
+
+
+async def prepare_db():
+    await models.create_all()
+    await models.close_session()
+
+
 @pytest.fixture(name="app", scope="session")
 def app_fixture():
     settings = SettingsTesting()
@@ -41,7 +54,7 @@ def app_fixture():
 
     app = main.create_app(settings)
 
-    asyncio.run(models.create_all())
+    asyncio.run(prepare_db())
 
     yield app
 
@@ -60,10 +73,7 @@ async def get_session() -> models.AsyncIterator[models.AsyncSession]:
     settings = SettingsTesting()
     models.init_db(settings)
 
-    async_session = models.sessionmaker(
-        models.engine, class_=models.AsyncSession, expire_on_commit=False
-    )
-    async with async_session() as session:
+    async with models.session_factory() as session:
         yield session
 
 
@@ -85,7 +95,7 @@ async def example_user1(session: models.AsyncSession) -> models.DBUser:
         email="test@test.com",
         first_name="Firstname",
         last_name="lastname",
-        last_login_date=datetime.datetime.now(tz=datetime.timezone.utc),
+        last_login_date=datetime.datetime.now(),
         
         role="merchants"
     )
@@ -106,11 +116,11 @@ async def oauth_token_user1(user1: models.DBUser) -> models.Token:
     return models.Token(
         user_id=user.id, 
         access_token=security.create_access_token(
-            data={"sub": user.id},
+            data=security.get_user_claims(user),
             expires_delta=access_token_expires,
         ),
         refresh_token=security.create_refresh_token(
-            data={"sub": user.id},
+            data=security.get_user_claims(user),
             expires_delta=access_token_expires,
         ),
         token_type="Bearer",
@@ -137,10 +147,48 @@ async def example_merchant_user1(
         return merchant
 
     merchant = models.DBMerchant(
-        name=name, user=user1, decription="Merchant Description"
+        name=name, user=user1, tax_id="0000000000000", decription="Merchant Description"
     )
 
     session.add(merchant)
     await session.commit()
     await session.refresh(merchant)
-    return merchant
\ No newline at end of file
+    return merchant
+
+
+@pytest_asyncio.fixture(name="item_user1")
+async def example_item_user1(
+    session: models.AsyncSession, merchant_user1: models.DBMerchant
+) -> models.DBItem:
+    name = "item1"
+
+    query = await session.exec(
+        select(models.DBItem).where(models.DBItem.name == name).limit(1)
+    )
+    item = query.one_or_none()
+    if item:
+        return item
+
+    item = models.DBItem(
+        name=name,
+        price=1.0,
+        merchant_id=merchant_user1.id,
+        user_id=merchant_user1.user_id,
+    )
+
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+    return item
+
+
+@pytest_asyncio.fixture(name="wallet_user1")
+async def example_wallet_user1(
+    session: models.AsyncSession, merchant_user1: models.DBMerchant
+) -> models.DBWallet:
+    wallet = models.DBWallet(balance=1000.0, merchant_id=merchant_user1.id)
+
+    session.add(wallet)
+    await session.commit()
+    await session.refresh(wallet)
+    return wallet
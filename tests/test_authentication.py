@@ -0,0 +1,229 @@
+import datetime
+
+from httpx import AsyncClient
+from passlib.context import CryptContext
+
+import pytest
+import pytest_asyncio
+
+from digimon import logins, models, revocation
+from digimon.hashing import hasher
+
+
+@pytest_asyncio.fixture(name="login_user")
+async def example_login_user(session: models.AsyncSession) -> dict:
+    user_info = {
+        "username": "login-user",
+        "email": "login-user@email.local",
+        "password": "login-password",
+    }
+    user = (
+        await session.exec(
+            models.select(models.DBUser).where(
+                models.DBUser.username == user_info["username"]
+            )
+        )
+    ).one_or_none()
+    if not user:
+        user = models.DBUser(
+            username=user_info["username"],
+            email=user_info["email"],
+            first_name="Firstname",
+            last_name="Lastname",
+            password="",
+        )
+
+    # hashed with a lower cost than the configured one
+    user.password = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(
+        user_info["password"]
+    )
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+    return user_info | {"id": user.id}
+
+
+@pytest.mark.asyncio
+async def test_login(client: AsyncClient, login_user: dict):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    response = await client.post("/token", data=payload)
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["access_token"]
+
+
+@pytest.mark.asyncio
+async def test_login_wrong_password(client: AsyncClient, login_user: dict):
+    payload = {"username": login_user["email"], "password": "wrong-password"}
+    response = await client.post("/token", data=payload)
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_login_rehashes_outdated_password(
+    client: AsyncClient, session: models.AsyncSession, login_user: dict
+):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    response = await client.post("/token", data=payload)
+
+    assert response.status_code == 200
+
+    user = await session.get(models.DBUser, login_user["id"])
+    await session.refresh(user)
+    assert not hasher.context.needs_update(user.password)
+
+
+@pytest.mark.asyncio
+async def test_login_records_last_login_date_behind(
+    client: AsyncClient, session: models.AsyncSession, login_user: dict
+):
+    payload = {"username": login_user["email"], "password": login_user["password"]}
+    response = await client.post("/token", data=payload)
+
+    assert response.status_code == 200
+    date = logins.recorder.logins[login_user["id"]]
+
+    assert await logins.recorder.flush() >= 1
+    assert logins.recorder.logins == {}
+    user = await session.get(models.DBUser, login_user["id"])
+    await session.refresh(user)
+    assert user.last_login_date == date
+
+    # a late flush of an older login leaves the newer date alone
+    logins.recorder.record(login_user["id"], date - datetime.timedelta(minutes=1))
+    await logins.recorder.flush()
+    await session.refresh(user)
+    assert user.last_login_date == date
+
+
+@pytest.mark.asyncio
+async def test_login_rejected_when_hasher_is_saturated(
+    client: AsyncClient, mocker, login_user: dict
+):
+    mocker.patch.object(hasher, "max_pending", 0)
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    response = await client.post("/token", data=payload)
+
+    assert response.status_code == 503
+    assert hasher.stats()["rejected"] > 0
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_rotation(client: AsyncClient, login_user: dict):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    login = (await client.post("/token", data=payload)).json()
+
+    response = await client.post(
+        "/token",
+        data={"grant_type": "refresh_token", "refresh_token": login["refresh_token"]},
+    )
+    renewed = response.json()
+
+    assert response.status_code == 200
+    assert renewed["refresh_token"] != login["refresh_token"]
+
+    headers = {"Authorization": f"Bearer {renewed['access_token']}"}
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_reuse_revokes_family(
+    client: AsyncClient, login_user: dict
+):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    login = (await client.post("/token", data=payload)).json()
+
+    refresh = {"grant_type": "refresh_token", "refresh_token": login["refresh_token"]}
+    renewed = (await client.post("/token", data=refresh)).json()
+
+    response = await client.post("/token", data=refresh)
+
+    assert response.status_code == 401
+
+    response = await client.post(
+        "/token",
+        data={"grant_type": "refresh_token", "refresh_token": renewed["refresh_token"]},
+    )
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_refresh_token_is_not_an_access_token(
+    client: AsyncClient, login_user: dict
+):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    login = (await client.post("/token", data=payload)).json()
+
+    headers = {"Authorization": f"Bearer {login['refresh_token']}"}
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_revoke_token(client: AsyncClient, login_user: dict):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    login = (await client.post("/token", data=payload)).json()
+    headers = {"Authorization": f"Bearer {login['access_token']}"}
+
+    response = await client.post("/token/revoke", headers=headers)
+
+    assert response.status_code == 200
+
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_revoke_all_user_tokens(client: AsyncClient, login_user: dict):
+    payload = {"username": login_user["username"], "password": login_user["password"]}
+    first = (await client.post("/token", data=payload)).json()
+    headers = {"Authorization": f"Bearer {first['access_token']}"}
+
+    response = await client.post(
+        f"/users/{login_user['id']}/revoke_tokens", headers=headers
+    )
+
+    assert response.status_code == 200
+    assert (await client.get("/users/me", headers=headers)).status_code == 401
+
+    response = await client.post(
+        "/token",
+        data={"grant_type": "refresh_token", "refresh_token": first["refresh_token"]},
+    )
+
+    assert response.status_code == 401
+
+    second = (await client.post("/token", data=payload)).json()
+    headers = {"Authorization": f"Bearer {second['access_token']}"}
+
+    assert (await client.get("/users/me", headers=headers)).status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_revocation_committed_out_of_order(login_user: dict):
+    revocations = revocation.RevocationList()
+    await revocations.refresh()
+
+    expires_at = datetime.datetime.now() + datetime.timedelta(hours=1)
+    async with models.session_factory() as first, models.session_factory() as second:
+        # the first row gets the lower id but commits after the second
+        first.add(models.DBRevokedToken(jti="late", user_id=login_user["id"], expires_at=expires_at))
+        await first.flush()
+        second.add(models.DBRevokedToken(jti="early", user_id=login_user["id"], expires_at=expires_at))
+        await second.commit()
+
+        await revocations.refresh()
+        assert revocations.is_revoked({"jti": "early", "sub": login_user["id"]})
+
+        await first.commit()
+
+    await revocations.refresh()
+    assert revocations.is_revoked({"jti": "late", "sub": login_user["id"]})
@@ -0,0 +1,105 @@
+import json
+
+from httpx import AsyncClient
+
+import pytest
+
+from digimon import rates
+from digimon.models.exchange_model import EXCHANGE_RATES, Currency
+from digimon.models.wallet_model import DBWallet
+
+
+@pytest.mark.asyncio
+async def test_exchange_money(client: AsyncClient, wallet_user1: DBWallet):
+    payload = {"amount": 10, "from_currency": "USD", "to_currency": "JPY"}
+    response = await client.post(
+        "/exchange/money", params={"wallet_id": wallet_user1.id}, json=payload
+    )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["thb_equivalent"] == pytest.approx(10 * EXCHANGE_RATES["USD"])
+    assert data["exchanged_amount"] == pytest.approx(
+        10 * EXCHANGE_RATES["USD"] / EXCHANGE_RATES["JPY"]
+    )
+    assert data["wallet_balance"] == pytest.approx(1000 - data["thb_equivalent"])
+    assert data["rate_version"] == rates.provider.snapshot.version
+
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("amount", [0, -10])
+async def test_exchange_invalid_amount(client: AsyncClient, wallet_user1: DBWallet, amount: float):
+    payload = {"amount": amount, "from_currency": "USD", "to_currency": "JPY"}
+    response = await client.post(
+        "/exchange/money", params={"wallet_id": wallet_user1.id}, json=payload
+    )
+    assert response.status_code == 422
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(1000)
+
+
+def test_rate_provider_reloads_file(tmp_path, mocker):
+    path = tmp_path / "rates.json"
+    path.write_text(json.dumps(EXCHANGE_RATES))
+    provider = rates.RateProvider()
+    mocker.patch.object(provider, "path", str(path))
+
+    snapshot = provider.reload()
+
+    assert snapshot.version == 1
+    assert snapshot.rate(Currency.USD, Currency.THB) == EXCHANGE_RATES["USD"]
+    assert snapshot.rate(Currency.THB, Currency.THB) == 1.0
+
+    path.write_text(json.dumps(EXCHANGE_RATES | {"USD": 30.0}))
+    reloaded = provider.reload()
+
+    assert reloaded.version == 2
+    assert reloaded.rate(Currency.USD, Currency.CNY) == 30.0 / EXCHANGE_RATES["CNY"]
+    assert snapshot.rate(Currency.USD, Currency.THB) == EXCHANGE_RATES["USD"]
+
+
+@pytest.mark.asyncio
+async def test_quote(client: AsyncClient):
+    payload = {
+        "amounts": [10, 20, 30],
+        "from_currencies": ["USD", "THB", "JPY"],
+        "to_currencies": ["THB", "CNY", "JPY"],
+    }
+    response = await client.post("/exchange/quote", json=payload)
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["converted"] == pytest.approx(
+        [10 * EXCHANGE_RATES["USD"], 20 / EXCHANGE_RATES["CNY"], 30]
+    )
+    assert data["rate_version"] == rates.provider.snapshot.version
+
+
+@pytest.mark.asyncio
+async def test_quote_mismatched_lengths(client: AsyncClient):
+    payload = {
+        "amounts": [10, 20],
+        "from_currencies": ["USD"],
+        "to_currencies": ["THB", "CNY"],
+    }
+    response = await client.post("/exchange/quote", json=payload)
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_quote_items(client: AsyncClient, item_user1):
+    response = await client.post(
+        "/exchange/quote/items", json={"item_ids": [item_user1.id]}
+    )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["item_ids"] == [item_user1.id]
+    assert data["THB"] == pytest.approx([item_user1.price])
+    assert data["USD"] == pytest.approx([item_user1.price / EXCHANGE_RATES["USD"]])
@@ -0,0 +1,159 @@
+import datetime
+import json
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlmodel import SQLModel, select
+
+from digimon import ledger, models, pagination, reports
+from digimon.models.item_models import DBItem
+from digimon.models.merchant_model import DBMerchant
+from digimon.models.report_model import DBRevenueRollup
+from digimon.models.revocation_model import DBRevokedToken
+from digimon.models.token_model import DBRefreshToken
+from digimon.models.transaction_model import DBTransaction
+from digimon.models.transfer_model import DBTransfer
+from digimon.models.users import DBUser
+from digimon.models.wallet_model import DBWallet
+from digimon.routes.authentication import build_login_lookup
+
+import pytest
+import pytest_asyncio
+
+SCHEMA = "explain_test"
+# tables with at least this many rows must never be read with a sequential scan
+LARGE_TABLE_ROWS = 10_000
+
+SEED = [
+    "INSERT INTO users (email, username, first_name, last_name, password, status, roles, "
+    "token_generation, register_date, updated_date) "
+    "SELECT 'user' || i || '@email.local', 'user' || i, 'First', 'Last', 'x', 'active', "
+    "'[\"user\"]', 0, now(), now() FROM generate_series(1, 20000) i",
+    "INSERT INTO merchants (name, tax_id, user_id) "
+    "SELECT 'merchant' || i, i::text, i FROM generate_series(1, 2000) i",
+    "INSERT INTO items (name, price, merchant_id, user_id) "
+    "SELECT 'item' || i, i % 997, i % 2000 + 1, i % 2000 + 1 FROM generate_series(1, 50000) i",
+    "INSERT INTO wallets (balance, shard_count, merchant_id) "
+    "SELECT 100, 1, i % 2000 + 1 FROM generate_series(1, 20000) i",
+    "INSERT INTO transactions (quantity, balance, wallet_id, item_id, merchant_id) "
+    "SELECT 1, 1, i % 20000 + 1, i % 50000 + 1, i % 2000 + 1 FROM generate_series(1, 100000) i",
+    "INSERT INTO ledger_entries (wallet_id, amount, kind, created_at) "
+    "SELECT i % 20000 + 1, 1, 'purchase', now() FROM generate_series(1, 100000) i",
+    "INSERT INTO balance_snapshots (wallet_id, entry_id, balance, created_at) "
+    "SELECT i, i, 1, now() FROM generate_series(1, 20000) i",
+    "INSERT INTO refresh_tokens (jti, family, user_id, issued_at, expires_at, revoked) "
+    "SELECT 'jti' || i, 'family' || i % 10000, i % 20000 + 1, now(), now(), false "
+    "FROM generate_series(1, 20000) i",
+    "INSERT INTO revoked_tokens (jti, user_id, revoked_at, expires_at) "
+    "SELECT 'jti' || i, i % 20000 + 1, now() - i * interval '1 second', now() "
+    "FROM generate_series(1, 20000) i",
+    "INSERT INTO transfers (from_wallet_id, to_wallet_id, amount, created_at) "
+    "SELECT i % 20000 + 1, (i + 1) % 20000 + 1, 1, now() FROM generate_series(1, 20000) i",
+    "INSERT INTO revenue_rollups (merchant_id, item_id, day, count, quantity, revenue) "
+    "SELECT i % 2000 + 1, i % 50000 + 1, current_date - i / 50000, 1, 1, 1 "
+    "FROM generate_series(1, 100000) i",
+]
+
+# the statements behind the hot routes, with values from the seeded ranges
+QUERIES = {
+    "login by username": build_login_lookup("user42"),
+    "login by email": build_login_lookup("user42@email.local"),
+    "user": select(DBUser).where(DBUser.id == 42),
+    "merchant page": pagination.paginate(
+        select(DBMerchant), [DBMerchant.id], 20, after=pagination.encode_cursor([DBMerchant.id], [100])
+    ),
+    "merchant items": select(DBItem).where(DBItem.merchant_id == 42),
+    "user items": select(DBItem).where(DBItem.user_id == 42),
+    "item page": pagination.paginate(select(DBItem), [DBItem.id], 20, page=3),
+    "item page by name": pagination.paginate(select(DBItem), [DBItem.name, DBItem.id], 20),
+    "item page by price": pagination.paginate(
+        select(DBItem),
+        [DBItem.price, DBItem.id],
+        20,
+        after=pagination.encode_cursor([DBItem.price, DBItem.id], [500.0, 42]),
+    ),
+    "merchant wallets": select(DBWallet).where(DBWallet.merchant_id == 42),
+    "transaction": select(DBTransaction).where(DBTransaction.id == 42),
+    "wallet transactions": pagination.paginate(
+        select(DBTransaction).where(DBTransaction.wallet_id == 42),
+        [DBTransaction.id],
+        20,
+        after=pagination.encode_cursor([DBTransaction.id], [1000]),
+    ),
+    "item transactions": select(DBTransaction).where(DBTransaction.item_id == 42),
+    "balance snapshot": ledger.latest_snapshot(42),
+    "balance entries": select(func.sum(models.DBLedgerEntry.amount)).where(
+        models.DBLedgerEntry.wallet_id == 42, models.DBLedgerEntry.id > 1000
+    ),
+    "daily revenue": reports.build_report(
+        42, DBRevenueRollup.day, datetime.date.today() - datetime.timedelta(days=1)
+    ),
+    "item revenue": reports.build_report(42, DBRevenueRollup.item_id),
+    "refresh token family": select(DBRefreshToken).where(DBRefreshToken.family == "family42"),
+    "user refresh tokens": select(DBRefreshToken).where(DBRefreshToken.user_id == 42),
+    "user revoked tokens": select(DBRevokedToken).where(DBRevokedToken.user_id == 42),
+    "recent revocations": select(DBRevokedToken).where(
+        DBRevokedToken.expires_at > datetime.datetime.now(),
+        DBRevokedToken.revoked_at > datetime.datetime.now() - datetime.timedelta(minutes=1),
+    ),
+    "outgoing transfers": select(DBTransfer).where(DBTransfer.from_wallet_id == 42),
+    "incoming transfers": select(DBTransfer).where(DBTransfer.to_wallet_id == 42),
+}
+
+
+@pytest_asyncio.fixture(name="explain_engine", scope="module")
+async def explain_engine_fixture(session: models.AsyncSession):
+    # seeded in their own schema, so the test tables keep their statistics
+    engine = create_async_engine(
+        models.engine.url, connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        await conn.run_sync(SQLModel.metadata.create_all)
+        for statement in SEED:
+            await conn.execute(text(statement))
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+
+    yield engine
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    await engine.dispose()
+
+
+def get_seq_scans(plan: dict) -> list[str]:
+    relations = []
+    if plan["Node Type"] == "Seq Scan":
+        relations.append(plan["Relation Name"])
+    for child in plan.get("Plans", []):
+        relations.extend(get_seq_scans(child))
+    return relations
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", QUERIES)
+async def test_query_uses_indexes(explain_engine, name: str):
+    statement = QUERIES[name].compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    async with explain_engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "SELECT relname FROM pg_class "
+                "WHERE relnamespace = :schema ::regnamespace AND relkind = 'r' "
+                "AND reltuples >= :rows"
+            ),
+            dict(schema=SCHEMA, rows=LARGE_TABLE_ROWS),
+        )
+        large_tables = set(result.scalars().all())
+        result = await conn.execute(text(f"EXPLAIN (FORMAT JSON) {statement}"))
+        plan = result.scalar_one()
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    seq_scans = set(get_seq_scans(plan[0]["Plan"])) & large_tables
+    assert not seq_scans, f"{name} scans {', '.join(sorted(seq_scans))}"
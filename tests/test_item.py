@@ -0,0 +1,154 @@
+from httpx import AsyncClient
+
+import pytest
+
+from digimon import catalog, models, pagination
+from digimon.models.item_models import DBItem
+from digimon.models.merchant_model import DBMerchant
+
+
+@pytest.mark.asyncio
+async def test_items_cursor_pagination(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: DBMerchant,
+):
+    session.add_all(
+        [
+            DBItem(
+                name=f"paged-{i}",
+                price=float(i % 3),
+                merchant_id=merchant_user1.id,
+                user_id=merchant_user1.user_id,
+            )
+            for i in range(7)
+        ]
+    )
+    await session.commit()
+
+    seen = []
+    params = {"size_per_page": 3, "sort_by": "price", "with_count": False}
+    response = await client.get("/items", params=params)
+    while True:
+        data = response.json()
+        assert response.status_code == 200
+        assert data["page_count"] is None
+        seen.extend(data["items"])
+
+        if data["next_cursor"] is None:
+            break
+        response = await client.get(
+            "/items", params=params | {"after": data["next_cursor"]}
+        )
+
+    keys = [(item["price"], item["id"]) for item in seen]
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert {f"paged-{i}" for i in range(7)} <= {item["name"] for item in seen}
+
+
+@pytest.mark.asyncio
+async def test_items_invalid_cursor(client: AsyncClient):
+    response = await client.get("/items", params={"after": "not-a-cursor"})
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "params", [{"size_per_page": 0}, {"size_per_page": 100_000}, {"page": 0}]
+)
+async def test_items_invalid_page(client: AsyncClient, params: dict):
+    response = await client.get("/items", params=params)
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_item_read_through_cache(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: DBMerchant,
+):
+    item = DBItem(
+        name="cached", price=1.0, merchant_id=merchant_user1.id, user_id=merchant_user1.user_id
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+
+    stats = catalog.catalog.stats()
+    for _ in range(3):
+        response = await client.get(f"/items/{item.id}")
+        assert response.status_code == 200
+        assert response.json()["name"] == "cached"
+    assert catalog.catalog.stats()["hits"] - stats["hits"] == 2
+
+    payload = {"name": "renamed", "price": 2.0, "merchant_id": merchant_user1.id}
+    response = await client.put(f"/items/{item.id}", json=payload)
+    assert response.status_code == 200
+    response = await client.get(f"/items/{item.id}")
+    assert response.json()["name"] == "renamed"
+
+    response = await client.delete(f"/items/{item.id}")
+    assert response.status_code == 200
+    response = await client.get(f"/items/{item.id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_catalog_memory_budget(session: models.AsyncSession, item_user1: DBItem):
+    cache = catalog.Catalog(maxsize=100, maxbytes=1, ttl=60)
+    assert await cache.get_item(session, item_user1.id)
+    assert cache.stats()["size"] == 0
+    assert cache.stats()["evictions"] == 1
+
+    cache = catalog.Catalog(maxsize=100, maxbytes=1024 * 1024, ttl=60)
+    assert await cache.get_item(session, item_user1.id)
+    assert await cache.get_item(session, item_user1.id)
+    assert cache.stats()["hits"] == 1
+    assert 0 < cache.stats()["bytes"] <= 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_item_etag(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: DBMerchant,
+):
+    item = DBItem(
+        name="tagged", price=1.0, merchant_id=merchant_user1.id, user_id=merchant_user1.user_id
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+
+    response = await client.get(f"/items/{item.id}")
+    etag = response.headers["ETag"]
+    response = await client.get(f"/items/{item.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.content == b""
+
+    params = {
+        "size_per_page": 1,
+        "with_count": False,
+        "after": pagination.encode_cursor([DBItem.id], [item.id - 1]),
+    }
+    response = await client.get("/items", params=params)
+    assert response.json()["items"][0]["id"] == item.id
+    page_etag = response.headers["ETag"]
+    response = await client.get(
+        "/items", params=params, headers={"If-None-Match": f'W/{page_etag}, "other"'}
+    )
+    assert response.status_code == 304
+
+    payload = {"name": "retagged", "price": 1.0, "merchant_id": merchant_user1.id}
+    await client.put(f"/items/{item.id}", json=payload)
+    response = await client.get(f"/items/{item.id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    response = await client.get("/items", params=params, headers={"If-None-Match": page_etag})
+    assert response.status_code == 200
+    assert response.json()["items"][0]["name"] == "retagged"
+    assert response.headers["ETag"] != page_etag
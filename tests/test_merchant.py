@@ -42,4 +42,41 @@ async def test_merchants(client: AsyncClient, merchant_user1: DBMerchant):
             check_merchant = merchant
             break
 
-    assert check_merchant["name"] == merchant_user1.name
\ No newline at end of file
+    assert check_merchant["name"] == merchant_user1.name
+
+@pytest.mark.asyncio
+async def test_merchant_cache_invalidated_on_update(
+    client: AsyncClient, merchant_user1: DBMerchant
+):
+    response = await client.get(f"/merchants/{merchant_user1.id}")
+    assert response.status_code == 200
+    name = response.json()["name"]
+
+    response = await client.put(
+        f"/merchants/{merchant_user1.id}", json={"name": "renamed", "tax_id": "0000000000000"}
+    )
+    assert response.status_code == 200
+    response = await client.get(f"/merchants/{merchant_user1.id}")
+    assert response.json()["name"] == "renamed"
+
+    await client.put(
+        f"/merchants/{merchant_user1.id}", json={"name": name, "tax_id": "0000000000000"}
+    )
+
+
+@pytest.mark.asyncio
+async def test_merchant_etag(client: AsyncClient, merchant_user1: DBMerchant):
+    response = await client.get(f"/merchants/{merchant_user1.id}")
+    etag = response.headers["ETag"]
+    response = await client.get(
+        f"/merchants/{merchant_user1.id}", headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    response = await client.get("/merchants")
+    page_etag = response.headers["ETag"]
+    response = await client.get("/merchants", headers={"If-None-Match": page_etag})
+    assert response.status_code == 304
+    response = await client.get("/merchants", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == page_etag
@@ -0,0 +1,166 @@
+import importlib
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from digimon import migrations, models
+
+import pytest
+import pytest_asyncio
+
+SCHEMA = "migration_test"
+INDEXES = importlib.import_module("digimon.migrations.0003_indexes").INDEXES
+
+# the tables as they were before migrations were introduced
+LEGACY_SCHEMA = [
+    "CREATE TABLE users ("
+    "email VARCHAR NOT NULL, username VARCHAR NOT NULL, "
+    "first_name VARCHAR NOT NULL, last_name VARCHAR NOT NULL, "
+    "id SERIAL PRIMARY KEY, password VARCHAR NOT NULL, "
+    "register_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "updated_date TIMESTAMP WITHOUT TIME ZONE NOT NULL, "
+    "last_login_date TIMESTAMP WITHOUT TIME ZONE)",
+    "CREATE TABLE merchants ("
+    "name VARCHAR NOT NULL, description VARCHAR, tax_id VARCHAR NOT NULL, "
+    "id SERIAL PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users (id))",
+    "CREATE TABLE items ("
+    "name VARCHAR NOT NULL, description VARCHAR, price FLOAT NOT NULL, tax FLOAT, "
+    "id SERIAL PRIMARY KEY, merchant_id INTEGER REFERENCES merchants (id), "
+    "user_id INTEGER NOT NULL REFERENCES users (id))",
+    "CREATE TABLE wallets ("
+    "balance FLOAT NOT NULL, id SERIAL PRIMARY KEY, "
+    "merchant_id INTEGER REFERENCES merchants (id))",
+    "CREATE TABLE transactions ("
+    "quantity INTEGER NOT NULL, id SERIAL PRIMARY KEY, balance FLOAT NOT NULL, "
+    "wallet_id INTEGER REFERENCES wallets (id), item_id INTEGER REFERENCES items (id))",
+]
+
+
+@pytest_asyncio.fixture(name="engine")
+async def engine_fixture(session: models.AsyncSession):
+    # concurrent index builds wait for every open transaction
+    await session.commit()
+    # the migrations run in their own schema, next to the test tables
+    engine = create_async_engine(
+        models.engine.url, connect_args={"server_settings": {"search_path": SCHEMA}}
+    )
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+
+    yield engine
+
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+    await engine.dispose()
+
+
+async def get_relkind(conn, name: str) -> str | None:
+    result = await conn.execute(
+        text("SELECT relkind::text FROM pg_class WHERE oid = to_regclass(:name)"), dict(name=name)
+    )
+    return result.scalar_one()
+
+
+async def get_indexes(conn) -> dict[str, bool]:
+    result = await conn.execute(
+        text(
+            "SELECT class.relname, pg_index.indisvalid FROM pg_index "
+            "JOIN pg_class class ON class.oid = pg_index.indexrelid "
+            "JOIN pg_namespace ON pg_namespace.oid = class.relnamespace "
+            "WHERE pg_namespace.nspname = :schema"
+        ),
+        dict(schema=SCHEMA),
+    )
+    return dict(result.all())
+
+
+@pytest.mark.asyncio
+async def test_migrate_empty_database(engine):
+    applied = await migrations.migrate(engine)
+    assert applied == [f"{version:04}_{name}" for version, name, _ in migrations.load()]
+    assert await migrations.migrate(engine) == []
+
+    async with engine.connect() as conn:
+        assert await get_relkind(conn, "transactions") == "p"
+        indexes = await get_indexes(conn)
+        result = await conn.execute(
+            text(
+                "SELECT table_name, column_name FROM information_schema.columns "
+                "WHERE table_schema = :schema"
+            ),
+            dict(schema=SCHEMA),
+        )
+        columns = set(result.all())
+    for name, _, _ in INDEXES:
+        assert indexes[name]
+    # the frozen baseline and the migrations after it add up to the models
+    for table in models.SQLModel.metadata.sorted_tables:
+        for column in table.columns:
+            assert (table.name, column.name) in columns
+
+
+@pytest.mark.asyncio
+async def test_migrate_legacy_database(engine):
+    async with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            await conn.execute(text(statement))
+        await conn.execute(
+            text(
+                "INSERT INTO users (email, username, first_name, last_name, password, "
+                "register_date, updated_date) "
+                "VALUES ('a@email.local', 'a', 'A', 'A', 'x', now(), now())"
+            )
+        )
+        await conn.execute(
+            text("INSERT INTO merchants (name, tax_id, user_id) VALUES ('m', '1', 1)")
+        )
+        await conn.execute(
+            text("INSERT INTO items (name, price, merchant_id, user_id) VALUES ('i', 2, 1, 1)")
+        )
+        await conn.execute(text("INSERT INTO wallets (balance, merchant_id) VALUES (10, 1)"))
+        await conn.execute(
+            text(
+                "INSERT INTO transactions (quantity, balance, wallet_id, item_id) "
+                "SELECT 1, 2, 1, 1 FROM generate_series(1, 3)"
+            )
+        )
+
+    await migrations.migrate(engine)
+
+    async with engine.connect() as conn:
+        assert await get_relkind(conn, "transactions") == "p"
+        assert await get_relkind(conn, "transactions_default") == "r"
+        assert all((await get_indexes(conn)).values())
+
+        result = await conn.execute(text("SELECT id, merchant_id FROM transactions ORDER BY id"))
+        assert result.all() == [(1, 1), (2, 1), (3, 1)]
+        result = await conn.execute(text("SELECT status, roles FROM users"))
+        assert result.one() == ("active", ["user"])
+        # the ledger accounts for the balance of the wallet from before it
+        result = await conn.execute(
+            text("SELECT kind, amount FROM ledger_entries WHERE wallet_id = 1")
+        )
+        assert result.all() == [("opening", 10)]
+        result = await conn.execute(
+            text("SELECT item_id, count, quantity, revenue FROM revenue_rollups")
+        )
+        assert result.one() == (1, 3, 3, 6)
+
+    # a backfill that runs again adds nothing
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await importlib.import_module("digimon.migrations.0004_transaction_merchants").upgrade(conn)
+        result = await conn.execute(
+            text("SELECT item_id, count, quantity, revenue FROM revenue_rollups")
+        )
+        assert result.one() == (1, 3, 3, 6)
+
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text(
+                "INSERT INTO transactions (quantity, balance, wallet_id, item_id) "
+                "VALUES (1, 2, 1, 1) RETURNING id"
+            )
+        )
+        assert result.scalar_one() == 4
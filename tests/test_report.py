@@ -0,0 +1,141 @@
+import datetime
+
+from httpx import AsyncClient
+
+import pytest
+
+from sqlmodel import select
+
+from digimon import leaderboard, models, purchase, reports
+from digimon.models.report_model import DBRevenueRollup
+
+
+async def create_merchant_with_items(session: models.AsyncSession, user1: models.DBUser):
+    merchant = models.DBMerchant(
+        name="report-merchant", user=user1, tax_id="0000000000000", decription="Reports"
+    )
+    session.add(merchant)
+    await session.commit()
+    await session.refresh(merchant)
+
+    items = [
+        models.DBItem(
+            name=f"report-{i}", price=float(i + 1), merchant_id=merchant.id, user_id=user1.id
+        )
+        for i in range(2)
+    ]
+    session.add_all(items)
+    wallet = models.DBWallet(balance=1000.0, merchant_id=merchant.id)
+    session.add(wallet)
+    await session.commit()
+    for item in items:
+        await session.refresh(item)
+    await session.refresh(wallet)
+    return merchant, items, wallet
+
+
+@pytest.mark.asyncio
+async def test_revenue_rollups(
+    client: AsyncClient, session: models.AsyncSession, user1: models.DBUser
+):
+    merchant, items, wallet = await create_merchant_with_items(session, user1)
+
+    # coalesced purchases, the single statement purchase and a checkout all
+    # add to the same rollups
+    for quantity in (1, 2, 3):
+        response = await client.post(
+            f"/transactions/{wallet.id}/{items[0].id}", json={"quantity": quantity}
+        )
+        assert response.status_code == 200
+    async with models.session_factory() as other:
+        await purchase.purchase(other, wallet.id, items[1].id, 4)
+    response = await client.post(
+        f"/transactions/checkout/{wallet.id}",
+        json={"lines": [{"item_id": items[0].id, "quantity": 1}, {"item_id": items[1].id}]},
+    )
+    assert response.status_code == 200
+
+    today = datetime.date.today().isoformat()
+    response = await client.get(f"/reports/merchants/{merchant.id}/items")
+    assert response.status_code == 200
+    assert response.json()["items"] == [
+        dict(item_id=items[0].id, count=4, quantity=7, revenue=7.0),
+        dict(item_id=items[1].id, count=2, quantity=5, revenue=10.0),
+    ]
+
+    response = await client.get(
+        f"/reports/merchants/{merchant.id}/revenue", params={"start": today, "end": today}
+    )
+    assert response.json()["days"] == [dict(day=today, count=6, quantity=12, revenue=17.0)]
+
+    response = await client.get(
+        f"/reports/merchants/{merchant.id}/revenue", params={"end": "2000-01-01"}
+    )
+    assert response.json()["days"] == []
+
+    # a rebuild from transactions gives the same rows
+    statement = (
+        select(DBRevenueRollup)
+        .where(DBRevenueRollup.merchant_id == merchant.id)
+        .order_by(DBRevenueRollup.item_id)
+    )
+    result = await session.exec(statement)
+    before = [row.model_dump() for row in result.all()]
+    await reports.rebuild(session)
+    session.expire_all()
+    result = await session.exec(statement)
+    assert [row.model_dump() for row in result.all()] == before
+
+    # rollups of archived months have no transactions left to rebuild from
+    archived = DBRevenueRollup(
+        merchant_id=before[0]["merchant_id"],
+        item_id=before[0]["item_id"],
+        day=datetime.date(2000, 1, 1),
+        count=1,
+        quantity=1,
+        revenue=1.0,
+    )
+    session.add(archived)
+    await session.commit()
+    await reports.rebuild(session)
+    session.expire_all()
+    result = await session.exec(statement)
+    assert len(result.all()) == len(before) + 1
+
+
+@pytest.mark.asyncio
+async def test_revenue_report_bad_range(client: AsyncClient):
+    response = await client.get(
+        "/reports/merchants/1/revenue", params={"start": "2024-02-01", "end": "2024-01-01"}
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_top_items(
+    client: AsyncClient, session: models.AsyncSession, user1: models.DBUser
+):
+    merchant, items, wallet = await create_merchant_with_items(session, user1)
+
+    for item, quantity in [(items[0], 2), (items[1], 3), (items[0], 4)]:
+        response = await client.post(
+            f"/transactions/{wallet.id}/{item.id}", json={"quantity": quantity}
+        )
+        assert response.status_code == 200
+
+    expected = [
+        dict(item_id=items[0].id, quantity=6),
+        dict(item_id=items[1].id, quantity=3),
+    ]
+    response = await client.get(f"/merchants/{merchant.id}/top-items")
+    assert response.status_code == 200
+    assert response.json()["items"] == expected
+
+    response = await client.get(f"/merchants/{merchant.id}/top-items", params={"limit": 1})
+    assert response.json()["items"] == expected[:1]
+
+    # the same board comes back from the rollups after a restart
+    leaderboard.leaderboard.clear()
+    await leaderboard.leaderboard.rebuild()
+    response = await client.get(f"/merchants/{merchant.id}/top-items")
+    assert response.json()["items"] == expected
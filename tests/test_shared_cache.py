@@ -0,0 +1,261 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+
+from digimon import catalog, models, shared_cache
+from digimon.models.item_models import DBItem
+from digimon.models.merchant_model import DBMerchant
+
+
+class FakeRedis:
+    # just enough of the Redis protocol for the shared cache
+    def __init__(self):
+        self.entries: dict[bytes, tuple[float | None, bytes]] = {}
+        self.subscribers: dict[bytes, set] = {}
+        self.writers = set()
+        self.commands = []
+        # replied to every command instead of running it
+        self.error = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.url = f"redis://127.0.0.1:{self.port}/1"
+
+    async def stop(self):
+        self.disconnect()
+        self.server.close()
+        await self.server.wait_closed()
+
+    def disconnect(self):
+        for writer in list(self.writers):
+            writer.close()
+
+    def reply(self, writer, value):
+        if value is None:
+            writer.write(b"$-1\r\n")
+        elif isinstance(value, int):
+            writer.write(b":%d\r\n" % value)
+        elif isinstance(value, str):
+            writer.write(b"+%s\r\n" % value.encode())
+        elif isinstance(value, bytes):
+            writer.write(b"$%d\r\n%s\r\n" % (len(value), value))
+        else:
+            writer.write(b"*%d\r\n" % len(value))
+            for item in value:
+                self.reply(writer, item)
+
+    async def handle(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while True:
+                name, *args = await shared_cache.read_reply(reader)
+                name = name.upper()
+                self.commands.append(name)
+                if self.error is not None and name != b"SUBSCRIBE":
+                    writer.write(b"-%s\r\n" % self.error)
+                elif name == b"GET":
+                    entry = self.entries.get(args[0])
+                    if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                        del self.entries[args[0]]
+                        entry = None
+                    self.reply(writer, None if entry is None else entry[1])
+                elif name == b"SET":
+                    expires = None
+                    if len(args) == 4 and args[2].upper() == b"PX":
+                        expires = time.monotonic() + int(args[3]) / 1000
+                    self.entries[args[0]] = (expires, args[1])
+                    self.reply(writer, "OK")
+                elif name == b"DEL":
+                    self.reply(writer, int(self.entries.pop(args[0], None) is not None))
+                elif name == b"PUBLISH":
+                    subscribers = self.subscribers.get(args[0], set())
+                    for subscriber in subscribers:
+                        self.reply(subscriber, [b"message", args[0], args[1]])
+                    self.reply(writer, len(subscribers))
+                elif name == b"SUBSCRIBE":
+                    self.subscribers.setdefault(args[0], set()).add(writer)
+                    self.reply(writer, [b"subscribe", args[0], 1])
+                elif name == b"SELECT":
+                    self.reply(writer, "OK")
+                else:
+                    writer.write(b"-ERR unknown command\r\n")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            for subscribers in self.subscribers.values():
+                subscribers.discard(writer)
+            writer.close()
+
+
+@pytest_asyncio.fixture(name="redis")
+async def redis_fixture():
+    redis = FakeRedis()
+    await redis.start()
+    yield redis
+    await redis.stop()
+
+
+@pytest_asyncio.fixture(name="cached_item")
+async def cached_item_fixture(session: models.AsyncSession, merchant_user1: DBMerchant):
+    item = DBItem(
+        name="shared", price=1.0, merchant_id=merchant_user1.id, user_id=merchant_user1.user_id
+    )
+    session.add(item)
+    await session.commit()
+    await session.refresh(item)
+    return item
+
+
+def create_worker(shared: shared_cache.SharedCache) -> catalog.Catalog:
+    return catalog.Catalog(
+        maxsize=100, maxbytes=1024 * 1024, ttl=60, max_staleness=5, shared=shared
+    )
+
+
+async def wait_for(condition, timeout: float = 2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_redis_shared_cache(redis: FakeRedis):
+    cache = shared_cache.RedisSharedCache(redis.url, timeout=1)
+
+    assert await cache.get("missing") is None
+    await cache.set("key", b"value", ttl=60)
+    await cache.set("short", b"value", ttl=0.01)
+    # commands from concurrent callers share the connection
+    values = await asyncio.gather(*[cache.get("key") for _ in range(20)])
+    assert values == [b"value"] * 20
+    await asyncio.sleep(0.05)
+    assert await cache.get("short") is None
+    await cache.delete("key")
+    assert await cache.get("key") is None
+    assert redis.commands[0] == b"SELECT"
+
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_shared_cache_unavailable(
+    session: models.AsyncSession, redis: FakeRedis, cached_item: DBItem
+):
+    await redis.stop()
+    cache = shared_cache.RedisSharedCache(redis.url, timeout=1)
+    with pytest.raises(ConnectionError):
+        await cache.get("key")
+
+    # the catalog falls back to the database
+    worker = create_worker(cache)
+    item = await worker.get_item(session, cached_item.id)
+    assert item.name == "shared"
+    assert worker.stats()["shared_errors"] == 2
+
+
+@pytest.mark.asyncio
+async def test_redis_error_replies(
+    session: models.AsyncSession, redis: FakeRedis, cached_item: DBItem
+):
+    redis.error = b"OOM command not allowed when used memory > 'maxmemory'"
+    cache = shared_cache.RedisSharedCache(redis.url, timeout=1)
+    worker = create_worker(cache)
+
+    with pytest.raises(ConnectionError):
+        await cache.set("key", b"value", ttl=60)
+    # reads and writes go on without the shared tier
+    item = await worker.get_item(session, cached_item.id)
+    assert item.name == "shared"
+    await worker.invalidate(DBItem, cached_item.id)
+    assert worker.stats()["shared_errors"] == 3
+
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_entries_live_at_most_max_staleness(
+    session: models.AsyncSession, redis: FakeRedis, cached_item: DBItem
+):
+    cache = shared_cache.RedisSharedCache(redis.url, timeout=1)
+    worker = create_worker(cache)
+    await worker.get_item(session, cached_item.id)
+
+    key = catalog.Catalog.key(DBItem, cached_item.id).encode()
+    expires, _ = redis.entries[key]
+    assert expires <= time.monotonic() + 5
+
+    await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_workers_share_entries_and_invalidations(
+    session: models.AsyncSession, redis: FakeRedis, cached_item: DBItem
+):
+    workers = [
+        create_worker(shared_cache.RedisSharedCache(redis.url, timeout=1)) for _ in range(2)
+    ]
+    for worker in workers:
+        await worker.start()
+    await wait_for(lambda: all(worker.coherent for worker in workers))
+
+    assert (await workers[0].get_item(session, cached_item.id)).name == "shared"
+    assert (await workers[1].get_item(session, cached_item.id)).name == "shared"
+    assert workers[1].stats()["shared_hits"] == 1
+    assert await workers[1].get_item(session, cached_item.id)
+    assert workers[1].stats()["hits"] == 1
+
+    cached_item.name = "renamed"
+    session.add(cached_item)
+    await session.commit()
+    await workers[0].invalidate(DBItem, cached_item.id)
+    await wait_for(lambda: len(workers[1].cache) == 0)
+    assert (await workers[1].get_item(session, cached_item.id)).name == "renamed"
+
+    for worker in workers:
+        await worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_lost_subscription_bypasses_local_tier(
+    session: models.AsyncSession, redis: FakeRedis, cached_item: DBItem
+):
+    cache = shared_cache.RedisSharedCache(redis.url, timeout=1, reconnect_delay=0.05)
+    worker = create_worker(cache)
+    await worker.start()
+    await wait_for(lambda: worker.coherent)
+    await worker.get_item(session, cached_item.id)
+    assert len(worker.cache) == 1
+
+    redis.disconnect()
+    await wait_for(lambda: not worker.coherent)
+    assert len(worker.cache) == 0
+    # served from the shared tier, never kept locally
+    await worker.get_item(session, cached_item.id)
+    assert worker.stats()["hits"] == 0
+
+    await wait_for(lambda: worker.coherent)
+    await worker.get_item(session, cached_item.id)
+    assert len(worker.cache) == 1
+
+    await worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_memory_shared_cache(session: models.AsyncSession, cached_item: DBItem):
+    shared = shared_cache.create_shared_cache("memory://")
+    workers = [create_worker(shared) for _ in range(2)]
+    for worker in workers:
+        await worker.start()
+
+    for worker in workers:
+        await worker.get_item(session, cached_item.id)
+    assert workers[1].stats()["shared_hits"] == 1
+
+    await workers[1].invalidate(DBItem, cached_item.id)
+    assert [len(worker.cache) for worker in workers] == [0, 0]
+    assert await shared.get(catalog.Catalog.key(DBItem, cached_item.id)) is None
@@ -0,0 +1,293 @@
+import asyncio
+import tracemalloc
+
+from httpx import AsyncClient
+
+import pytest
+
+from sqlmodel import func, select, text
+
+from digimon import archive, models, partitions
+from digimon.routes import transaction_router
+from digimon.models.item_models import DBItem
+from digimon.models.transaction_model import DBTransaction, ExportFormat
+from digimon.models.wallet_model import DBWallet
+
+
+@pytest.mark.asyncio
+async def test_create_transaction(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem
+):
+    payload = {"quantity": 3}
+    response = await client.post(
+        f"/transactions/{wallet_user1.id}/{item_user1.id}", json=payload
+    )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["quantity"] == payload["quantity"]
+
+
+@pytest.mark.asyncio
+async def test_create_transaction_insufficient_balance(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem
+):
+    payload = {"quantity": 1001}
+    response = await client.post(
+        f"/transactions/{wallet_user1.id}/{item_user1.id}", json=payload
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("quantity", [0, -500])
+async def test_create_transaction_invalid_quantity(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem, quantity: int
+):
+    response = await client.post(
+        f"/transactions/{wallet_user1.id}/{item_user1.id}", json={"quantity": quantity}
+    )
+    assert response.status_code == 422
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(1000)
+
+
+@pytest.mark.asyncio
+async def test_create_transaction_not_found(
+    client: AsyncClient, wallet_user1: DBWallet
+):
+    response = await client.post(
+        f"/transactions/{wallet_user1.id}/0", json={"quantity": 1}
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_concurrent_transactions_on_one_wallet(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    wallet_user1: DBWallet,
+    item_user1: DBItem,
+):
+    # 2000 purchases of price 1.0 race for a balance of 1000
+    url = f"/transactions/{wallet_user1.id}/{item_user1.id}"
+    responses = await asyncio.gather(
+        *[client.post(url, json={"quantity": 1}) for _ in range(2000)]
+    )
+
+    status_codes = [response.status_code for response in responses]
+    assert status_codes.count(200) == 1000
+    assert status_codes.count(400) == 1000
+
+    await session.refresh(wallet_user1)
+    assert wallet_user1.balance == 0
+
+    result = await session.exec(
+        select(func.count(DBTransaction.id)).where(
+            DBTransaction.wallet_id == wallet_user1.id
+        )
+    )
+    assert result.one() == 1000
+
+
+@pytest.mark.asyncio
+async def test_checkout(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    wallet_user1: DBWallet,
+    item_user1: DBItem,
+):
+    payload = {
+        "lines": [
+            {"item_id": item_user1.id, "quantity": 2},
+            {"item_id": item_user1.id, "quantity": 5},
+        ]
+    }
+    response = await client.post(
+        f"/transactions/checkout/{wallet_user1.id}", json=payload
+    )
+
+    data = response.json()
+
+    assert response.status_code == 200
+    assert data["total"] == 7.0
+    assert data["balance"] == 993.0
+    assert [line["status"] for line in data["lines"]] == ["ok", "ok"]
+    assert all(line["transaction_id"] for line in data["lines"])
+
+
+@pytest.mark.asyncio
+async def test_checkout_is_all_or_nothing(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    wallet_user1: DBWallet,
+    item_user1: DBItem,
+):
+    payload = {
+        "lines": [
+            {"item_id": item_user1.id, "quantity": 2},
+            {"item_id": 0, "quantity": 1},
+        ]
+    }
+    response = await client.post(
+        f"/transactions/checkout/{wallet_user1.id}", json=payload
+    )
+
+    data = response.json()
+
+    assert response.status_code == 404
+    assert [line["status"] for line in data["detail"]["lines"]] == [
+        "ok",
+        "not_found",
+    ]
+
+    payload = {"lines": [{"item_id": item_user1.id, "quantity": 1001}]}
+    response = await client.post(
+        f"/transactions/checkout/{wallet_user1.id}", json=payload
+    )
+
+    assert response.status_code == 400
+
+    await session.refresh(wallet_user1)
+    assert wallet_user1.balance == 1000.0
+
+
+@pytest.mark.asyncio
+async def test_export_transactions_csv(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem
+):
+    for _ in range(3):
+        await client.post(
+            f"/transactions/{wallet_user1.id}/{item_user1.id}", json={"quantity": 1}
+        )
+
+    response = await client.get(
+        f"/transactions/wallet/{wallet_user1.id}/export", params={"format": "csv"}
+    )
+
+    lines = response.text.splitlines()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert lines[0].split(",")[0] == "quantity"
+    assert len(lines) == 4
+
+
+@pytest.mark.asyncio
+async def test_export_transactions_invalid_chunk_size(
+    client: AsyncClient, wallet_user1: DBWallet
+):
+    response = await client.get(
+        f"/transactions/wallet/{wallet_user1.id}/export", params={"chunk_size": 0}
+    )
+
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_export_transactions_memory_is_bounded(
+    session: models.AsyncSession, wallet_user1: DBWallet, item_user1: DBItem
+):
+    rows = 200_000
+    await session.exec(
+        text(
+            "INSERT INTO transactions (quantity, balance, wallet_id, item_id) "
+            "SELECT 1, 1.0, :wallet_id, :item_id FROM generate_series(1, :rows)"
+        ),
+        params=dict(wallet_id=wallet_user1.id, item_id=item_user1.id, rows=rows),
+    )
+    await session.commit()
+
+    # materializing 200k rows takes hundreds of MB, streaming should stay
+    # within a few chunks
+    tracemalloc.start()
+    exported = 0
+    async for chunk in transaction_router.stream_transactions(
+        wallet_user1.id, ExportFormat.ndjson
+    ):
+        exported += chunk.count("\n")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert exported == rows
+    assert peak < 16 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_archived_transactions(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    wallet_user1: DBWallet,
+    item_user1: DBItem,
+    tmp_path,
+    monkeypatch,
+):
+    monkeypatch.setattr(archive.archives, "directory", str(tmp_path))
+
+    # three purchases in a long closed month, then two current ones
+    await session.exec(
+        text(
+            "INSERT INTO transactions (quantity, balance, wallet_id, item_id, created_at) "
+            "SELECT i, 1.0, :wallet_id, :item_id, '2020-01-15' FROM generate_series(1, 3) AS i"
+        ),
+        params=dict(wallet_id=wallet_user1.id, item_id=item_user1.id),
+    )
+    await session.commit()
+    for quantity in (4, 5):
+        await client.post(
+            f"/transactions/{wallet_user1.id}/{item_user1.id}", json={"quantity": quantity}
+        )
+
+    archiver = partitions.Archiver(
+        interval=60, hot_months=3, months_ahead=1, archives=archive.archives
+    )
+    # another worker holds the lock
+    async with models.engine.connect() as conn:
+        await conn.execute(text(f"SELECT pg_advisory_lock({partitions.LOCK_KEY})"))
+        assert await archiver.run_once() == []
+        await conn.execute(text(f"SELECT pg_advisory_unlock({partitions.LOCK_KEY})"))
+        await conn.commit()
+    assert await archiver.run_once() == [str(tmp_path / "transactions_2020_01.dtx")]
+
+    result = await session.exec(text("SELECT to_regclass('transactions_2020_01')"))
+    assert result.scalar_one() is None
+    result = await session.exec(
+        select(func.count()).where(DBTransaction.wallet_id == wallet_user1.id)
+    )
+    assert result.one() == 2
+
+    # history reads do not tell archived rows from the others
+    response = await client.get(f"/transactions/wallet/{wallet_user1.id}")
+    transactions = response.json()["transactions"]
+    assert [transaction["quantity"] for transaction in transactions] == [1, 2, 3, 4, 5]
+    ids = [transaction["id"] for transaction in transactions]
+
+    response = await client.get(
+        f"/transactions/wallet/{wallet_user1.id}", params={"page": 2, "page_size": 2}
+    )
+    assert [transaction["id"] for transaction in response.json()["transactions"]] == ids[2:4]
+
+    paged = []
+    params = {"page_size": 2}
+    while True:
+        data = (await client.get(f"/transactions/wallet/{wallet_user1.id}", params=params)).json()
+        paged += [transaction["id"] for transaction in data["transactions"]]
+        if data["next_cursor"] is None:
+            break
+        params["after"] = data["next_cursor"]
+    assert paged == ids
+
+    response = await client.get(f"/transactions/{ids[0]}")
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 1
+
+    response = await client.get(
+        f"/transactions/wallet/{wallet_user1.id}/export", params={"format": "csv"}
+    )
+    lines = response.text.splitlines()
+    assert len(lines) == 6
+    assert "2020-01-15" in lines[1]
@@ -0,0 +1,130 @@
+import jwt
+
+from httpx import AsyncClient
+from passlib.context import CryptContext
+
+import pytest
+
+from digimon import config, deps, models, security
+from digimon.models.users import DBUser, Token
+
+PASSWORD = "access-password"
+
+
+async def create_user(session: models.AsyncSession, username: str, roles: list[str]) -> dict:
+    user = (
+        await session.exec(models.select(DBUser).where(DBUser.username == username))
+    ).one_or_none()
+    if not user:
+        user = DBUser(
+            username=username,
+            email=f"{username}@email.local",
+            first_name="Firstname",
+            last_name="Lastname",
+            password=CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(PASSWORD),
+        )
+    user.roles = roles
+    user.status = "active"
+    session.add(user)
+    await session.commit()
+    await session.refresh(user)
+    token = security.create_access_token(data=security.get_user_claims(user))
+    return dict(id=user.id, headers={"Authorization": f"Bearer {token}"})
+
+
+@pytest.mark.asyncio
+async def test_principal_from_token_claims(mocker, user1: DBUser):
+    session = mocker.AsyncMock()
+    payload = security.get_user_claims(user1) | {"sub": user1.id}
+
+    principal = await deps.get_current_principal(payload, session)
+
+    assert principal.user_id == user1.id
+    assert principal.roles == user1.roles
+    assert principal.permissions & security.Permission.READ
+    session.get.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_principal_with_stale_claims_reads_user(mocker, user1: DBUser):
+    session = mocker.AsyncMock()
+    session.get.return_value = user1
+    payload = {"sub": user1.id, "cv": security.CLAIMS_VERSION - 1}
+
+    principal = await deps.get_current_principal(payload, session)
+
+    assert principal.user_id == user1.id
+    assert principal.status == user1.status
+    session.get.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_get_me(client: AsyncClient, token_user1: Token, user1: DBUser):
+    headers = {"Authorization": f"{token_user1.token_type} {token_user1.access_token}"}
+    response = await client.get("/users/me", headers=headers)
+
+    assert response.status_code == 200
+    assert response.json()["username"] == user1.username
+
+
+@pytest.mark.asyncio
+async def test_invalid_token(client: AsyncClient):
+    token = jwt.encode({"sub": "1"}, "wrong-secret", algorithm=security.ALGORITHM)
+    response = await client.get(
+        "/users/me", headers={"Authorization": f"Bearer {token}"}
+    )
+
+    assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_update_can_not_change_roles(client: AsyncClient, session: models.AsyncSession):
+    user = await create_user(session, "access-user", ["user"])
+
+    response = await client.put(
+        f"/users/{user['id']}/update",
+        json={"first_name": "Renamed", "roles": ["admin"], "verify_password": PASSWORD},
+        headers=user["headers"],
+    )
+
+    assert response.status_code == 200
+    assert response.json()["first_name"] == "Renamed"
+    assert response.json()["last_name"] == "Lastname"
+    db_user = await session.get(DBUser, user["id"])
+    await session.refresh(db_user)
+    assert db_user.roles == ["user"]
+
+
+@pytest.mark.asyncio
+async def test_update_other_user(client: AsyncClient, session: models.AsyncSession):
+    user = await create_user(session, "access-user", ["user"])
+    other = await create_user(session, "access-other", ["user"])
+
+    response = await client.put(
+        f"/users/{other['id']}/update",
+        json={"first_name": "Renamed", "verify_password": PASSWORD},
+        headers=user["headers"],
+    )
+
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_update_access(client: AsyncClient, session: models.AsyncSession):
+    user = await create_user(session, "access-user", ["user"])
+    admin = await create_user(session, "access-admin", ["admin"])
+
+    response = await client.put(
+        f"/users/{user['id']}/access", json={"roles": ["admin"]}, headers=user["headers"]
+    )
+    assert response.status_code == 403
+
+    response = await client.put(
+        f"/users/{user['id']}/access", json={"roles": ["merchant"]}, headers=admin["headers"]
+    )
+    assert response.status_code == 200
+
+    # the token still claims the old roles
+    assert (await client.get("/users/me", headers=user["headers"])).status_code == 401
+    user = await create_user(session, "access-user", ["merchant"])
+    assert (await client.get("/users/me", headers=user["headers"])).status_code == 200
@@ -0,0 +1,515 @@
+import asyncio
+import datetime
+
+from httpx import AsyncClient
+
+import pytest
+
+from sqlmodel import select
+
+import uuid
+
+from digimon import idempotency, leaderboard, ledger, models, payouts
+from digimon.coalescer import coalescer
+from digimon.models.idempotency_model import DBIdempotencyKey, DBIdempotencyStep
+from digimon.models.item_models import DBItem
+from digimon.models.ledger_model import DBLedgerEntry
+from digimon.models.merchant_model import DBMerchant
+from digimon.models.wallet_model import DBWallet
+
+
+@pytest.mark.asyncio
+async def test_shard_wallet(client: AsyncClient, wallet_user1: DBWallet):
+    response = await client.put(
+        f"/wallets/{wallet_user1.id}/shards", params={"shard_count": 4}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["shard_count"] == 4
+
+    response = await client.put(
+        f"/wallets/deposit/{wallet_user1.id}", params={"amount": 100}
+    )
+    assert response.json()["balance"] == pytest.approx(1100)
+
+    response = await client.put(
+        f"/wallets/withdraw/{wallet_user1.id}", params={"amount": 200}
+    )
+    assert response.json()["balance"] == pytest.approx(900)
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    data = response.json()
+    assert data["balance"] == pytest.approx(900)
+    assert data["shard_count"] == 4
+
+
+@pytest.mark.asyncio
+async def test_sharded_purchase_rebalances(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem
+):
+    await client.put(f"/wallets/{wallet_user1.id}/shards", params={"shard_count": 4})
+
+    # more than the 250 held by any one shard
+    url = f"/transactions/{wallet_user1.id}/{item_user1.id}"
+    response = await client.post(url, json={"quantity": 600})
+    assert response.status_code == 200
+
+    response = await client.post(url, json={"quantity": 500})
+    assert response.status_code == 400
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(400)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_transactions_on_sharded_wallet(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem
+):
+    await client.put(f"/wallets/{wallet_user1.id}/shards", params={"shard_count": 16})
+
+    url = f"/transactions/{wallet_user1.id}/{item_user1.id}"
+    responses = await asyncio.gather(
+        *[client.post(url, json={"quantity": 5}) for _ in range(250)]
+    )
+
+    status_codes = [response.status_code for response in responses]
+    assert status_codes.count(200) == 200
+    assert status_codes.count(400) == 50
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(0)
+
+
+@pytest.mark.asyncio
+async def test_coalesced_withdrawals(client: AsyncClient, wallet_user1: DBWallet):
+    batches = coalescer.batches
+    url = f"/wallets/withdraw/{wallet_user1.id}"
+    responses = await asyncio.gather(
+        *[client.put(url, params={"amount": 300}) for _ in range(5)]
+    )
+
+    status_codes = [response.status_code for response in responses]
+    assert status_codes.count(200) == 3
+    assert status_codes.count(400) == 2
+    assert sorted(
+        response.json()["balance"] for response in responses if response.status_code == 200
+    ) == pytest.approx([100, 400, 700])
+    assert coalescer.batches - batches < 5
+
+    response = await client.get("/metrics/coalescer")
+    assert response.json()["max_batch_size"] > 1
+
+
+@pytest.mark.asyncio
+async def test_uncontended_write_runs_alone(client: AsyncClient, wallet_user1: DBWallet):
+    direct, batches = coalescer.direct, coalescer.batches
+
+    response = await client.put(
+        f"/wallets/deposit/{wallet_user1.id}", params={"amount": 100}
+    )
+
+    assert response.json()["balance"] == pytest.approx(1100)
+    assert coalescer.direct == direct + 1
+    assert coalescer.batches == batches
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_runs_operations_alone(
+    client: AsyncClient, wallet_user1: DBWallet, mocker
+):
+    mocker.patch.object(coalescer, "apply", side_effect=RuntimeError("batch failed"))
+    failed_batches = coalescer.failed_batches
+
+    url = f"/wallets/withdraw/{wallet_user1.id}"
+    responses = await asyncio.gather(
+        *[client.put(url, params={"amount": 300}) for _ in range(5)]
+    )
+
+    status_codes = [response.status_code for response in responses]
+    assert status_codes.count(200) == 3
+    assert status_codes.count(400) == 2
+    assert coalescer.failed_batches > failed_batches
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(100)
+
+
+@pytest.mark.asyncio
+async def test_ledger_balance(
+    client: AsyncClient,
+    session: models.AsyncSession,
+    merchant_user1: DBMerchant,
+    item_user1: DBItem,
+):
+    response = await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 100})
+    wallet_id = response.json()["id"]
+
+    await client.put(f"/wallets/deposit/{wallet_id}", params={"amount": 50})
+    await client.put(f"/wallets/withdraw/{wallet_id}", params={"amount": 30})
+    await client.post(f"/transactions/{wallet_id}/{item_user1.id}", json={"quantity": 20})
+    await client.put(f"/wallets/{wallet_id}", json={"balance": 500})
+
+    response = await client.get(f"/wallets/{wallet_id}/balance")
+    assert response.json()["balance"] == pytest.approx(500)
+
+    result = await session.exec(
+        select(DBLedgerEntry)
+        .where(DBLedgerEntry.wallet_id == wallet_id)
+        .order_by(DBLedgerEntry.id)
+    )
+    entries = result.all()
+    assert [entry.kind for entry in entries] == [
+        "opening",
+        "deposit",
+        "withdraw",
+        "purchase",
+        "adjustment",
+    ]
+    assert entries[3].transaction_id is not None
+
+    snapshot = await ledger.compact(session, wallet_id)
+    assert snapshot.balance == pytest.approx(500)
+    await client.put(f"/wallets/deposit/{wallet_id}", params={"amount": 1})
+
+    response = await client.get(f"/wallets/{wallet_id}/balance")
+    assert response.json()["balance"] == pytest.approx(501)
+
+    response = await client.get(
+        f"/wallets/{wallet_id}/balance",
+        params={"as_of": entries[1].created_at.isoformat()},
+    )
+    assert response.json()["balance"] == pytest.approx(150)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("route", ["deposit", "withdraw"])
+@pytest.mark.parametrize("amount", [0, -5000])
+async def test_deposit_withdraw_invalid_amount(
+    client: AsyncClient, wallet_user1: DBWallet, route: str, amount: float
+):
+    response = await client.put(f"/wallets/{route}/{wallet_user1.id}", params={"amount": amount})
+    assert response.status_code == 422
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(1000)
+
+
+@pytest.mark.asyncio
+async def test_idempotent_deposit(client: AsyncClient, wallet_user1: DBWallet):
+    url = f"/wallets/deposit/{wallet_user1.id}"
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    first = await client.put(url, params={"amount": 100}, headers=headers)
+    retry = await client.put(url, params={"amount": 100}, headers=headers)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    # served from the table when the worker cache does not have it
+    idempotency.store.cache.clear()
+    retry = await client.put(url, params={"amount": 100}, headers=headers)
+    assert retry.json() == first.json()
+
+    response = await client.put(url, params={"amount": 50}, headers=headers)
+    assert response.status_code == 422
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(1100)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_idempotent_withdrawals(
+    client: AsyncClient, wallet_user1: DBWallet
+):
+    url = f"/wallets/withdraw/{wallet_user1.id}"
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+
+    responses = await asyncio.gather(
+        *[client.put(url, params={"amount": 100}, headers=headers) for _ in range(10)]
+    )
+
+    assert [response.status_code for response in responses] == [200] * 10
+    assert all(response.json()["balance"] == pytest.approx(900) for response in responses)
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(900)
+
+
+@pytest.mark.asyncio
+async def test_idempotent_purchase_failing_after_commit(
+    client: AsyncClient, wallet_user1: DBWallet, item_user1: DBItem, mocker
+):
+    url = f"/transactions/{wallet_user1.id}/{item_user1.id}"
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    mocker.patch.object(
+        leaderboard.leaderboard, "add", side_effect=RuntimeError("after the commit")
+    )
+
+    # the response was stored with the purchase, so it is the answer
+    first = await client.post(url, json={"quantity": 2}, headers=headers)
+    assert first.status_code == 200
+
+    idempotency.store.cache.clear()
+    retry = await client.post(url, json={"quantity": 2}, headers=headers)
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+
+    response = await client.get(f"/wallets/{wallet_user1.id}")
+    assert response.json()["balance"] == pytest.approx(1000 - 2 * item_user1.price)
+
+
+@pytest.mark.asyncio
+async def test_idempotency_claim_of_dead_worker(
+    client: AsyncClient, session: models.AsyncSession, wallet_user1: DBWallet
+):
+    url = f"/wallets/deposit/{wallet_user1.id}"
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    now = datetime.datetime.now()
+
+    # claimed by a worker that is still running it
+    claim = DBIdempotencyKey(
+        key=headers["Idempotency-Key"],
+        fingerprint="",
+        created_at=now,
+        expires_at=now + datetime.timedelta(seconds=10),
+    )
+    session.add(claim)
+    await session.commit()
+
+    response = await client.put(url, params={"amount": 100}, headers=headers)
+    assert response.status_code == 409
+
+    # the worker died and its lease ran out
+    claim.expires_at = now - datetime.timedelta(seconds=1)
+    session.add(claim)
+    await session.commit()
+
+    response = await client.put(url, params={"amount": 100}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["balance"] == pytest.approx(1100)
+
+    await session.refresh(claim)
+    assert claim.status_code == 200
+    assert claim.expires_at > now + datetime.timedelta(hours=1)
+
+
+@pytest.mark.asyncio
+async def test_transfer(client: AsyncClient, session: models.AsyncSession, merchant_user1: DBMerchant):
+    source = (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 100})).json()
+    target = (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 0})).json()
+
+    payload = {"from_wallet_id": source["id"], "to_wallet_id": target["id"], "amount": 60}
+    response = await client.post("/wallets/transfer", json=payload)
+    assert response.status_code == 200
+    assert response.json()["transfer_id"] is not None
+
+    response = await client.post("/wallets/transfer", json=payload)
+    assert response.status_code == 400
+
+    response = await client.post(
+        "/wallets/transfers",
+        json={
+            "transfers": [
+                {"from_wallet_id": target["id"], "to_wallet_id": source["id"], "amount": 10},
+                {"from_wallet_id": source["id"], "to_wallet_id": target["id"], "amount": 50},
+                {"from_wallet_id": source["id"], "to_wallet_id": 0, "amount": 1},
+            ]
+        },
+    )
+    assert [result["status"] for result in response.json()["transfers"]] == [
+        "ok",
+        "ok",
+        "not_found",
+    ]
+
+    for wallet, balance in ((source, 0), (target, 100)):
+        response = await client.get(f"/wallets/{wallet['id']}")
+        assert response.json()["balance"] == pytest.approx(balance)
+        response = await client.get(f"/wallets/{wallet['id']}/balance")
+        assert response.json()["balance"] == pytest.approx(balance)
+
+
+@pytest.mark.asyncio
+async def test_crossing_transfers(client: AsyncClient, merchant_user1: DBMerchant):
+    a = (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 1000})).json()
+    b = (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 1000})).json()
+
+    # A -> B and B -> A at the same time would deadlock with unordered locks
+    responses = await asyncio.gather(
+        *[
+            client.post(
+                "/wallets/transfer",
+                json={"from_wallet_id": x["id"], "to_wallet_id": y["id"], "amount": 1},
+            )
+            for _ in range(100)
+            for x, y in ((a, b), (b, a))
+        ]
+    )
+    assert [response.status_code for response in responses] == [200] * 200
+
+    for wallet in (a, b):
+        response = await client.get(f"/wallets/{wallet['id']}")
+        assert response.json()["balance"] == pytest.approx(1000)
+
+
+@pytest.mark.asyncio
+async def test_bulk_payout(client: AsyncClient, merchant_user1: DBMerchant, mocker):
+    mocker.patch.object(payouts.settings, "PAYOUT_CHUNK_SIZE", 2)
+    wallet_ids = [
+        (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": balance})).json()["id"]
+        for balance in (100, 50, 100)
+    ]
+    await client.put(f"/wallets/{wallet_ids[2]}/shards", params={"shard_count": 4})
+
+    response = await client.post(
+        "/wallets/payouts",
+        json={
+            "payouts": [
+                {"wallet_id": wallet_ids[0], "amount": 40},
+                {"wallet_id": wallet_ids[1], "amount": 60},
+                {"wallet_id": 0, "amount": 1},
+                {"wallet_id": wallet_ids[2], "amount": 90},
+            ]
+        },
+    )
+
+    results = response.json()["payouts"]
+    assert [result["status"] for result in results] == [
+        "ok",
+        "insufficient_funds",
+        "not_found",
+        "ok",
+    ]
+    assert results[0]["balance"] == pytest.approx(60)
+    assert results[3]["balance"] == pytest.approx(10)
+
+    response = await client.post(
+        "/wallets/payouts",
+        json={"payouts": [{"wallet_id": 1, "amount": 1}, {"wallet_id": 1, "amount": 2}]},
+    )
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_concurrent_payouts_and_transfers_on_sharded_wallets(
+    client: AsyncClient, merchant_user1: DBMerchant
+):
+    wallet_ids = []
+    for _ in range(2):
+        wallet_id = (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 1000})).json()["id"]
+        await client.put(f"/wallets/{wallet_id}/shards", params={"shard_count": 4})
+        wallet_ids.append(wallet_id)
+    first, second = wallet_ids
+
+    payout = {"payouts": [{"wallet_id": second, "amount": 1}, {"wallet_id": first, "amount": 1}]}
+    requests = []
+    for _ in range(10):
+        requests.append(client.post("/wallets/payouts", json=payout))
+        requests.append(
+            client.post(
+                "/wallets/transfer",
+                json={"from_wallet_id": second, "to_wallet_id": first, "amount": 1},
+            )
+        )
+        requests.append(
+            client.post(
+                "/wallets/transfer",
+                json={"from_wallet_id": first, "to_wallet_id": second, "amount": 1},
+            )
+        )
+    responses = await asyncio.gather(*requests)
+    assert [response.status_code for response in responses] == [200] * len(requests)
+
+    for wallet_id in wallet_ids:
+        response = await client.get(f"/wallets/{wallet_id}")
+        assert response.json()["balance"] == pytest.approx(990)
+
+
+@pytest.mark.asyncio
+async def test_bulk_payout_retry_after_partial_commit(
+    client: AsyncClient, session: models.AsyncSession, merchant_user1: DBMerchant, mocker
+):
+    mocker.patch.object(payouts.settings, "PAYOUT_CHUNK_SIZE", 2)
+    wallet_ids = [
+        (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 100})).json()["id"]
+        for _ in range(4)
+    ]
+    headers = {"Idempotency-Key": uuid.uuid4().hex}
+    payload = {"payouts": [{"wallet_id": wallet_id, "amount": 30} for wallet_id in wallet_ids]}
+
+    pay_out = payouts.pay_out
+    calls = 0
+
+    async def fail_second_chunk(*args):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise RuntimeError("connection lost")
+        return await pay_out(*args)
+
+    mocker.patch.object(payouts, "pay_out", fail_second_chunk)
+    with pytest.raises(idempotency.PartiallyApplied):
+        await client.post("/wallets/payouts", json=payload, headers=headers)
+    mocker.patch.object(payouts, "pay_out", pay_out)
+
+    # the claim is kept until its lease runs out
+    claim = await session.get(DBIdempotencyKey, headers["Idempotency-Key"])
+    await session.refresh(claim)
+    assert claim.status_code is None
+    response = await client.post("/wallets/payouts", json=payload, headers=headers)
+    assert response.status_code == 409
+
+    claim.expires_at = datetime.datetime.now() - datetime.timedelta(seconds=1)
+    session.add(claim)
+    await session.commit()
+
+    # the committed steps survive the purge of expired keys
+    await idempotency.store.purge()
+    steps = await session.exec(
+        select(DBIdempotencyStep.step).where(DBIdempotencyStep.key == headers["Idempotency-Key"])
+    )
+    assert len(steps.all()) == 1
+
+    response = await client.post("/wallets/payouts", json=payload, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["payouts"]
+    assert [result["status"] for result in results] == ["ok"] * 4
+    assert [result["balance"] for result in results] == [pytest.approx(70)] * 4
+
+    for wallet_id in wallet_ids:
+        response = await client.get(f"/wallets/{wallet_id}")
+        assert response.json()["balance"] == pytest.approx(70)
+
+
+@pytest.mark.asyncio
+async def test_bulk_payout_partial_commit_without_key(
+    client: AsyncClient, merchant_user1: DBMerchant, mocker
+):
+    mocker.patch.object(payouts.settings, "PAYOUT_CHUNK_SIZE", 2)
+    wallet_ids = [
+        (await client.post(f"/wallets/{merchant_user1.id}", json={"balance": 100})).json()["id"]
+        for _ in range(4)
+    ]
+    payload = {"payouts": [{"wallet_id": wallet_id, "amount": 30} for wallet_id in wallet_ids]}
+
+    pay_out = payouts.pay_out
+    calls = 0
+
+    async def fail_second_chunk(*args):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise RuntimeError("connection lost")
+        return await pay_out(*args)
+
+    mocker.patch.object(payouts, "pay_out", fail_second_chunk)
+    response = await client.post("/wallets/payouts", json=payload)
+    assert response.status_code == 200
+    results = response.json()["payouts"]
+    assert [result["status"] for result in results] == ["ok", "ok", "failed", "failed"]
+
+    for wallet_id, balance in zip(wallet_ids, [70, 70, 100, 100]):
+        response = await client.get(f"/wallets/{wallet_id}")
+        assert response.json()["balance"] == pytest.approx(balance)